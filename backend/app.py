@@ -1,32 +1,50 @@
 import os
 import sqlite3
+import tempfile
 from datetime import datetime
-import io
 
-import xlsxwriter  # pyright: ignore[reportMissingImports]
-from flask import Flask, jsonify, request, send_from_directory, Response
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from flask import Flask, Response, g, jsonify, request, send_file, send_from_directory
+
+import auth
+import db
+import migrations
+import outbox
+import report_jobs
+import retention
+from caching import conditional
+from compatibility import ELIGIBLE_SQL, compatible_donor_groups, eligibility_cutoff, normalize_group
+from db import DB_PATH, get_db
+from donor_import import ImportFormatError, format_from_filename, import_donors, read_rows
+from export import EXPORT_TABLES, InvalidExportRequest, export_response
+from geo import (DEFAULT_NEARBY_LIMIT, MAX_NEARBY_LIMIT, InvalidLocation, geocode, nearby_donors, parse_point,
+                 parse_radius, place_json)
+from matching import (DEFAULT_MATCH_LIMIT, MAX_MATCH_LIMIT, InvalidMatchRequest, match_pending_requests,
+                      match_request)
+from notify_bus import (STREAM_RETRY_AFTER_SECONDS, acquire_stream_slot, release_stream_slot,
+                        stream_notifications)
+from pagination import MAX_PAGE_SIZE, InvalidPageRequest, fetch_page, parse_limit, wants_page
+from reports import generate_donor_report, generate_excel_report
+from request_status import apply_status_updates, parse_status_batch
+from search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, InvalidSearch, parse_tables, search
+from stats import REQUEST_STATUSES, read_stats, unread_count
+from streaming import stream_file, stream_rows
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, 'bloodbank.db')
 FRONTEND_DIR = os.path.join(BASE_DIR, '../frontend')
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
 
 app = Flask(__name__, static_folder=FRONTEND_DIR, static_url_path='/')
+db.init_app(app)
+migrations.migrate()
+outbox.start()
+retention.start()
+report_jobs.recover_stale_jobs()
 
 # Add CORS headers to allow frontend requests
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,If-None-Match')
+    response.headers.add('Access-Control-Expose-Headers', 'ETag')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
@@ -43,110 +61,324 @@ def static_proxy(path):
         return send_from_directory(FRONTEND_DIR, path)
     return send_from_directory(FRONTEND_DIR, 'index.html')
 
+def list_page(table, order_by, descending):
+    """Keyset-paginated listing: ?limit=N&after=<cursor from the previous page>"""
+    after = request.args.get('after') or None
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        conn = get_db()
+        rows, next_cursor = fetch_page(conn, table, order_by, after, limit, descending)
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+    conn.close()
+    return jsonify({
+        table: [dict(r) for r in rows],
+        'limit': limit,
+        'after': after,
+        'next_cursor': next_cursor
+    })
+
 # --- API ---
+@app.route('/api/admin/db-stats', methods=['GET'])
+def db_pool_stats():
+    """Connection pool counters for this worker process"""
+    return jsonify({'pid': os.getpid(), 'pool': db.get_pool().stats(), 'writer': db.get_writer().stats(),
+                    'outbox': outbox.get_dispatcher().stats()})
+
+def nearby_donor_list(lat, lon, origin, blood_group=None, compatible='false', eligible='false'):
+    """Donors within ?radius_km of a point, nearest first (?limit, ?blood_group, ?compatible, ?eligible)"""
+    args = request.args
+    blood_group = args.get('blood_group', blood_group)
+    compatible = args.get('compatible', compatible).lower() == 'true'
+    eligible = args.get('eligible', eligible).lower() == 'true'
+    try:
+        radius_km = parse_radius(args.get('radius_km'))
+        limit = max(1, min(int(args.get('limit', DEFAULT_NEARBY_LIMIT)), MAX_NEARBY_LIMIT))
+    except InvalidLocation as e:
+        return jsonify({'error': str(e)}), 400
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    groups = None
+    if blood_group:
+        group = normalize_group(blood_group)
+        if not group:
+            return jsonify({'error': 'invalid blood_group'}), 400
+        groups = compatible_donor_groups(group) if compatible else (group,)
+    cutoff = eligibility_cutoff() if eligible else None
+
+    conn = get_db()
+    donors = nearby_donors(conn, lat, lon, radius_km, limit, groups, cutoff)
+    conn.close()
+    return jsonify({'donors': donors, 'count': len(donors), 'near': origin, 'radius_km': radius_km, 'limit': limit})
+
 @app.route('/api/donors', methods=['GET'])
+@conditional('donors')
 def list_donors():
+    # ?near=<city> or ?lat=&lon= lists donors by distance instead
+    near = request.args.get('near')
+    if near or 'lat' in request.args:
+        if near:
+            conn = get_db()
+            place = geocode(conn, near)
+            conn.close()
+            if place is None:
+                return jsonify({'error': f'unknown place {near!r}'}), 400
+            return nearby_donor_list(place['latitude'], place['longitude'], place_json(place))
+        try:
+            lat, lon = parse_point(request.args.get('lat'), request.args.get('lon'))
+        except InvalidLocation as e:
+            return jsonify({'error': str(e)}), 400
+        return nearby_donor_list(lat, lon, {'latitude': lat, 'longitude': lon})
+
+    if wants_page(request.args):
+        return list_page('donors', ('id',), descending=False)
     conn = get_db()
     cur = conn.execute('SELECT * FROM donors')
-    rows = [dict(r) for r in cur.fetchall()]
+    return stream_rows(conn, cur)
+
+@app.route('/api/stats', methods=['GET'])
+@conditional('donors', 'requests')
+def get_stats():
+    """Donor and request totals for the home page and admin dashboard"""
+    conn = get_db()
+    stats = read_stats(conn)
     conn.close()
-    return jsonify(rows)
+    return jsonify(stats)
+
+# Sort keys accepted by donor search; prefix with '-' for descending
+DONOR_SEARCH_SORTS = {
+    'id': 'id',
+    'name': 'name COLLATE NOCASE',
+    'age': 'age',
+    'city': 'city COLLATE NOCASE',
+    'last_donation_date': 'last_donation_date',
+}
+DONOR_SEARCH_MAX_LIMIT = 500
+
+@app.route('/api/donors/search', methods=['GET'])
+@conditional('donors')
+def search_donors():
+    """Filter donors server-side by blood group, city, age and eligibility"""
+    args = request.args
+    where = []
+    params = []
+
+    blood_group = args.get('blood_group')
+    if blood_group:
+        group = normalize_group(blood_group)
+        if not group:
+            return jsonify({'error': 'invalid blood_group'}), 400
+        # compatible=true widens the search to every group that can donate to it
+        if args.get('compatible', 'false').lower() == 'true':
+            groups = compatible_donor_groups(group)
+        else:
+            groups = (group,)
+        where.append(f"blood_group IN ({', '.join('?' * len(groups))})")
+        params.extend(groups)
+
+    city = (args.get('city') or '').strip()
+    if city:
+        where.append('city = ? COLLATE NOCASE')
+        params.append(city)
+
+    try:
+        min_age = int(args['min_age']) if args.get('min_age') else None
+        max_age = int(args['max_age']) if args.get('max_age') else None
+        limit = int(args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'min_age, max_age and limit must be integers'}), 400
+    if min_age is not None:
+        where.append('age >= ?')
+        params.append(min_age)
+    if max_age is not None:
+        where.append('age <= ?')
+        params.append(max_age)
+
+    if args.get('eligible', 'false').lower() == 'true':
+        where.append(ELIGIBLE_SQL)
+        params.append(eligibility_cutoff())
+
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    sort_column = DONOR_SEARCH_SORTS.get(sort.lstrip('-'))
+    if not sort_column:
+        return jsonify({'error': f"sort must be one of {', '.join(DONOR_SEARCH_SORTS)}"}), 400
+    limit = max(1, min(limit, DONOR_SEARCH_MAX_LIMIT))
+
+    sql = 'SELECT * FROM donors'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += f" ORDER BY {sort_column} {'DESC' if descending else 'ASC'}, id LIMIT ?"
+    params.append(limit)
+
+    conn = get_db()
+    rows = [dict(r) for r in conn.execute(sql, params).fetchall()]
+    conn.close()
+    return jsonify({'donors': rows, 'count': len(rows), 'limit': limit})
+
+@app.route('/api/search', methods=['GET'])
+@conditional('donors', 'requests', 'user_requests')
+def search_records():
+    """Full-text search: ?q=words (prefixes match), ?in=donors,requests,user_requests, ?limit=N per table"""
+    try:
+        tables = parse_tables(request.args.get('in'))
+        limit = max(1, min(int(request.args.get('limit', DEFAULT_SEARCH_LIMIT)), MAX_SEARCH_LIMIT))
+        conn = get_db()
+        try:
+            results = search(conn, request.args.get('q'), tables, limit)
+        finally:
+            conn.close()
+    except InvalidSearch as e:
+        return jsonify({'error': str(e)}), 400
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify({'query': request.args.get('q'), 'limit': limit, 'results': results})
 
 @app.route('/api/donors', methods=['POST'])
 def add_donor():
     data = request.get_json() or request.form
     fields = ('name','age','blood_group','contact','city','last_donation_date')
     vals = [data.get(f) for f in fields]
-    conn = get_db()
-    cur = conn.execute('INSERT INTO donors (name,age,blood_group,contact,city,last_donation_date) VALUES (?,?,?,?,?,?)', vals)
-    conn.commit()
-    donor_id = cur.lastrowid
-    conn.close()
+
+    def insert_donor(conn):
+        cur = conn.execute('INSERT INTO donors (name,age,blood_group,contact,city,last_donation_date) VALUES (?,?,?,?,?,?)', vals)
+        return cur.lastrowid
+
+    donor_id = db.run_write(insert_donor)
     return jsonify({'id': donor_id}), 201
 
+@app.route('/api/donors/import', methods=['POST'])
+def import_donor_file():
+    """Bulk-add donors from an uploaded CSV or XLSX file (multipart field 'file')"""
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Upload a CSV or XLSX file in the "file" field'}), 400
+    import_format = request.form.get('format') or format_from_filename(upload.filename)
+    dry_run = request.form.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    try:
+        report = import_donors(read_rows(upload.stream, import_format), dry_run=dry_run)
+    except ImportFormatError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, **report})
+
 @app.route('/api/requests', methods=['GET'])
+@conditional('requests')
 def list_requests():
+    if wants_page(request.args):
+        return list_page('requests', ('created_at', 'id'), descending=True)
     conn = get_db()
     cur = conn.execute('SELECT * FROM requests ORDER BY created_at DESC')
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return jsonify(rows)
+    return stream_rows(conn, cur)
 
 @app.route('/api/requests', methods=['POST'])
 def add_request():
     data = request.get_json() or request.form
     fields = ('patient_name','blood_group','units','hospital','city','contact')
     vals = [data.get(f) for f in fields]
-    conn = get_db()
-    cur = conn.execute('INSERT INTO requests (patient_name,blood_group,units,hospital,city,contact) VALUES (?,?,?,?,?,?)', vals)
-    conn.commit()
-    req_id = cur.lastrowid
-    conn.close()
+
+    def insert_request(conn):
+        cur = conn.execute('INSERT INTO requests (patient_name,blood_group,units,hospital,city,contact) VALUES (?,?,?,?,?,?)', vals)
+        return cur.lastrowid
+
+    req_id = db.run_write(insert_request)
+    # Nearby donors are a separate read: GET /api/requests/<id>/nearby-donors
     return jsonify({'id': req_id}), 201
 
 @app.route('/api/requests/<int:req_id>/status', methods=['PUT'])
 def update_request_status(req_id):
     data = request.get_json() or request.form
     status = data.get('status')
-    if status not in ('pending', 'approved', 'rejected', 'fulfilled'):
+    if status not in REQUEST_STATUSES:
         return jsonify({'error':'invalid status'}), 400
+
+    db.run_write(apply_status_updates, {req_id: status})
+    outbox.wake()
+    return jsonify({'id': req_id, 'status': status, 'notifications_queued': True})
+
+@app.route('/api/requests/status', methods=['PUT'])
+def update_request_statuses():
+    """Batch status change: {"updates": [{"id", "status"}, ...]} or {"ids": [...], "status"}"""
+    data = request.get_json(silent=True) or {}
+    try:
+        items, updates, errors = parse_status_batch(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    found = db.run_write(apply_status_updates, updates) if updates else set()
+    if found:
+        outbox.wake()
+
+    results = []
+    for index, item in enumerate(items):
+        if index in errors:
+            results.append(errors[index])
+        elif item['id'] in found:
+            results.append({'id': item['id'], 'success': True, 'status': item['status'],
+                            'notifications_queued': True})
+        else:
+            results.append({'id': item['id'], 'success': False, 'error': 'Request not found'})
+    updated = sum(1 for result in results if result['success'])
+    return jsonify({'success': True, 'updated': updated, 'failed': len(results) - updated, 'results': results})
+
+def match_limit():
+    """?limit= for match endpoints; ValueError when not an integer"""
+    return max(1, min(int(request.args.get('limit', DEFAULT_MATCH_LIMIT)), MAX_MATCH_LIMIT))
+
+@app.route('/api/requests/<int:req_id>/matches', methods=['GET'])
+def get_request_matches(req_id):
+    """Ranked eligible donors for a blood request"""
+    try:
+        limit = match_limit()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+
     conn = get_db()
-    
-    # Update the request status
-    conn.execute('UPDATE requests SET status=? WHERE id=?', (status, req_id))
-    
-    # Find all user_requests linked to this request and create notifications
-    cur = conn.execute('''
-        SELECT ur.id, ur.user_id, ur.patient_name, ur.blood_group 
-        FROM user_requests ur 
-        WHERE ur.request_id = ?
-    ''', (req_id,))
-    user_requests = cur.fetchall()
-    
-    # Create notifications for each user who made this request
-    status_messages = {
-        'pending': 'Your blood request is currently pending review by our admin team.',
-        'approved': 'Great news! Your blood request has been approved. We will process it shortly.',
-        'rejected': 'Unfortunately, your blood request has been rejected. Please contact us for more details.',
-        'fulfilled': 'Your blood request has been successfully fulfilled. Thank you for using our service!'
-    }
-    
-    status_titles = {
-        'pending': 'Request Pending',
-        'approved': 'Request Approved',
-        'rejected': 'Request Rejected',
-        'fulfilled': 'Request Fulfilled'
-    }
-    
-    notification_types = {
-        'pending': 'info',
-        'approved': 'success',
-        'rejected': 'error',
-        'fulfilled': 'success'
-    }
-    
-    for user_req in user_requests:
-        user_id = user_req['user_id']
-        user_request_id = user_req['id']
-        patient_name = user_req['patient_name']
-        blood_group = user_req['blood_group']
-        
-        # Update user_request status as well
-        conn.execute('UPDATE user_requests SET status=? WHERE id=?', (status, user_request_id))
-        
-        # Create notification
-        title = status_titles.get(status, 'Request Update')
-        message = f"{status_messages.get(status, 'Your request status has been updated.')} (Patient: {patient_name}, Blood Group: {blood_group})"
-        notif_type = notification_types.get(status, 'info')
-        
-        conn.execute('''
-            INSERT INTO notifications (user_id, request_id, title, message, type, is_read)
-            VALUES (?, ?, ?, ?, ?, 0)
-        ''', (user_id, user_request_id, title, message, notif_type))
-    
-    conn.commit()
+    request_row = conn.execute('SELECT * FROM requests WHERE id = ?', (req_id,)).fetchone()
+    if request_row is None:
+        conn.close()
+        return jsonify({'success': False, 'error': 'Request not found'}), 404
+    try:
+        matches = match_request(conn, request_row, limit)
+    except InvalidMatchRequest as e:
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 400
     conn.close()
-    return jsonify({'id': req_id, 'status': status, 'notifications_sent': len(user_requests)})
+    return jsonify({'request': dict(request_row), 'matches': matches, 'count': len(matches), 'limit': limit})
+
+@app.route('/api/requests/<int:req_id>/nearby-donors', methods=['GET'])
+def get_request_nearby_donors(req_id):
+    """Donors within ?radius_km of the request's hospital city, nearest first.
+
+    Defaults to compatible, eligible donors; pass compatible=false or
+    eligible=false to widen the list.
+    """
+    conn = get_db()
+    request_row = conn.execute('SELECT * FROM requests WHERE id = ?', (req_id,)).fetchone()
+    place = geocode(conn, request_row['city']) if request_row is not None else None
+    conn.close()
+    if request_row is None:
+        return jsonify({'success': False, 'error': 'Request not found'}), 404
+    if place is None:
+        return jsonify({'success': False, 'error': f"city {request_row['city']!r} is not in the gazetteer"}), 400
+
+    return nearby_donor_list(place['latitude'], place['longitude'], place_json(place),
+                             request_row['blood_group'], compatible='true', eligible='true')
+
+@app.route('/api/requests/matches', methods=['GET'])
+def get_pending_request_matches():
+    """Match every pending request in one call; ?exclusive=true proposes each donor once"""
+    try:
+        limit = match_limit()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+    exclusive = request.args.get('exclusive', 'false').lower() == 'true'
+
+    conn = get_db()
+    results, truncated = match_pending_requests(conn, limit, exclusive)
+    conn.close()
+    return jsonify({'results': results, 'count': len(results), 'truncated': truncated,
+                    'limit': limit, 'exclusive': exclusive})
 
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
@@ -154,552 +386,124 @@ def admin_login():
     username = data.get('username')
     password = data.get('password')
     conn = get_db()
-    cur = conn.execute('SELECT * FROM admin WHERE username=? AND password=?', (username, password))
+    cur = conn.execute('SELECT * FROM admin WHERE username=?', (username,))
     row = cur.fetchone()
     conn.close()
-    if row:
-        return jsonify({'success': True})
-    return jsonify({'success': False}), 401
+    if not password:
+        return jsonify({'success': False}), 401
+    matches, needs_rehash = auth.verify_password(row['password'] if row else None, password)
+    if not matches:
+        return jsonify({'success': False}), 401
+    if needs_rehash:
+        db.run_write(auth.upgrade_password, 'admin', row['id'], row['password'], auth.hash_password(password))
+    token, expires_at = auth.issue_token('admin', row['id'])
+    return jsonify({'success': True, 'token': token, 'expires_at': expires_at})
 
-def generate_donor_report():
-    """Generate comprehensive blood request report"""
-    conn = get_db()
-    
-    # Get all blood requests
-    cur = conn.execute('SELECT * FROM requests ORDER BY created_at DESC')
-    requests = [dict(row) for row in cur.fetchall()]
-    
-    # Get donor statistics
-    cur = conn.execute('SELECT COUNT(*) as count FROM donors')
-    total_donors = cur.fetchone()['count']
-    
-    # Get blood group statistics
-    cur = conn.execute('SELECT blood_group, COUNT(*) as count FROM requests GROUP BY blood_group')
-    blood_stats = {row['blood_group']: row['count'] for row in cur.fetchall()}
-    
-    # Get all donors for the donor information section
-    cur = conn.execute('SELECT * FROM donors ORDER BY name')
-    donors = [dict(row) for row in cur.fetchall()]
-    
-    conn.close()
-    
-    # Create PDF buffer
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=72, bottomMargin=18)
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#dc2626')
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=12,
-        textColor=colors.HexColor('#dc2626')
-    )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=6
-    )
-    
-    # Build PDF content
-    story = []
-    
-    # Title
-    story.append(Paragraph("LifeGrid Blood Bank", title_style))
-    story.append(Paragraph("Blood Request Report", title_style))
-    story.append(Spacer(1, 20))
-    
-    # Report info
-    report_date = datetime.now().strftime("%B %d, %Y at %I:%M %p")
-    story.append(Paragraph(f"<b>Report Generated:</b> {report_date}", normal_style))
-    story.append(Paragraph(f"<b>Total Blood Requests:</b> {len(requests)}", normal_style))
-    story.append(Paragraph(f"<b>Total Registered Donors:</b> {total_donors}", normal_style))
-    story.append(Spacer(1, 20))
-    
-    # Executive Summary
-    story.append(Paragraph("Executive Summary", heading_style))
-    
-    # Status summary
-    status_counts = {}
-    for req in requests:
-        status = req['status']
-        status_counts[status] = status_counts.get(status, 0) + 1
-    
-    summary_data = [
-        ['Status', 'Count', 'Percentage'],
-    ]
-    
-    total_requests = len(requests)
-    for status in ['pending', 'approved', 'fulfilled', 'rejected']:
-        count = status_counts.get(status, 0)
-        percentage = f"{(count/total_requests*100):.1f}%" if total_requests > 0 else "0%"
-        summary_data.append([status.title(), str(count), percentage])
-    
-    summary_table = Table(summary_data, colWidths=[2*inch, 1.5*inch, 1.5*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dc2626')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#fef2f2')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(summary_table)
-    story.append(Spacer(1, 20))
-    
-    # Blood Group Analysis
-    story.append(Paragraph("Blood Group Demand Analysis", heading_style))
-    
-    blood_group_data = [
-        ['Blood Group', 'Total Requests', 'Pending', 'Approved', 'Fulfilled', 'Rejected'],
-    ]
-    
-    for bg in ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']:
-        bg_requests = [r for r in requests if r['blood_group'] == bg]
-        total_bg = len(bg_requests)
-        pending_bg = len([r for r in bg_requests if r['status'] == 'pending'])
-        approved_bg = len([r for r in bg_requests if r['status'] == 'approved'])
-        fulfilled_bg = len([r for r in bg_requests if r['status'] == 'fulfilled'])
-        rejected_bg = len([r for r in bg_requests if r['status'] == 'rejected'])
-        
-        blood_group_data.append([
-            bg, str(total_bg), str(pending_bg), str(approved_bg), str(fulfilled_bg), str(rejected_bg)
-        ])
-    
-    blood_group_table = Table(blood_group_data, colWidths=[1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch])
-    blood_group_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dc2626')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#fef2f2')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(blood_group_table)
-    story.append(Spacer(1, 20))
-    
-    # Detailed Request Information
-    story.append(Paragraph("Detailed Blood Request Information", heading_style))
-    
-    if requests:
-        # Create detailed table with all request information
-        detailed_data = [
-            ['ID', 'Patient Name', 'Blood Group', 'Units', 'Hospital', 'City', 'Contact', 'Status', 'Date']
-        ]
-        
-        for req in requests:
-            # Format date
-            request_date = req['created_at']
-            if request_date:
-                try:
-                    date_obj = datetime.strptime(request_date, '%Y-%m-%d %H:%M:%S')
-                    formatted_date = date_obj.strftime('%d/%m/%Y')
-                except:
-                    formatted_date = request_date
-            else:
-                formatted_date = 'N/A'
-            
-            detailed_data.append([
-                str(req['id']),
-                req['patient_name'],
-                req['blood_group'],
-                str(req['units']) if req['units'] else 'N/A',
-                req['hospital'] if req['hospital'] else 'N/A',
-                req['city'] if req['city'] else 'N/A',
-                req['contact'] if req['contact'] else 'N/A',
-                req['status'].title(),
-                formatted_date
-            ])
-        
-        # Create table with smaller font for better fit
-        detailed_table = Table(detailed_data, colWidths=[0.6*inch, 1.4*inch, 0.8*inch, 0.6*inch, 1.2*inch, 1*inch, 1.2*inch, 0.8*inch, 0.8*inch])
-        detailed_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dc2626')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#fef2f2')),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 7),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP')
-        ]))
-        
-        story.append(detailed_table)
-    else:
-        story.append(Paragraph("No blood requests found in the system.", normal_style))
-    
-    story.append(Spacer(1, 20))
-    
-    # Donor Information Section
-    story.append(Paragraph("Registered Donor Information", heading_style))
-    
-    # Add donor statistics summary
-    story.append(Paragraph(f"<b>Total Registered Donors:</b> {len(donors)}", normal_style))
-    story.append(Spacer(1, 10))
-    
-    if donors:
-        # Create comprehensive donor table
-        donor_data = [
-            ['ID', 'Full Name', 'Age', 'Blood Group', 'Contact Number', 'City', 'Last Donation Date']
-        ]
-        
-        for donor in donors:
-            donor_data.append([
-                str(donor['id']),
-                donor['name'],
-                str(donor['age']) if donor['age'] else 'N/A',
-                donor['blood_group'],
-                donor['contact'] if donor['contact'] else 'N/A',
-                donor['city'] if donor['city'] else 'N/A',
-                donor['last_donation_date'] if donor['last_donation_date'] else 'No Previous Donations'
-            ])
-        
-        # Create donor table with improved formatting
-        donor_table = Table(donor_data, colWidths=[0.6*inch, 1.6*inch, 0.6*inch, 0.8*inch, 1.2*inch, 1*inch, 1.2*inch])
-        donor_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dc2626')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#fef2f2')),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('TOPPADDING', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 8)
-        ]))
-        
-        story.append(donor_table)
-        
-        # Add donor summary by blood group
-        story.append(Spacer(1, 15))
-        story.append(Paragraph("Donor Distribution by Blood Group", heading_style))
-        
-        # Count donors by blood group
-        blood_group_counts = {}
-        for donor in donors:
-            bg = donor['blood_group']
-            blood_group_counts[bg] = blood_group_counts.get(bg, 0) + 1
-        
-        # Create blood group summary table
-        bg_summary_data = [['Blood Group', 'Number of Donors', 'Percentage']]
-        total_donors = len(donors)
-        
-        for bg in ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']:
-            count = blood_group_counts.get(bg, 0)
-            percentage = f"{(count/total_donors*100):.1f}%" if total_donors > 0 else "0%"
-            bg_summary_data.append([bg, str(count), percentage])
-        
-        bg_summary_table = Table(bg_summary_data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch])
-        bg_summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dc2626')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#fef2f2')),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 9)
-        ]))
-        
-        story.append(bg_summary_table)
-        
-    else:
-        story.append(Paragraph("No donors registered in the system.", normal_style))
-    
-    # Footer
-    story.append(Spacer(1, 30))
-    story.append(Paragraph("This report contains confidential medical information and should be handled according to healthcare privacy regulations.", normal_style))
-    story.append(Paragraph("Generated by LifeGrid Blood Bank Management System", normal_style))
-    
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+@app.route('/api/auth/session', methods=['GET'])
+@auth.token_required()
+def get_session():
+    """The role and account of the request's token"""
+    return jsonify({'role': g.auth['role'], 'id': g.auth['sub'], 'expires_at': g.auth['exp']})
+
+@app.route('/api/auth/refresh', methods=['POST'])
+@auth.token_required()
+def refresh_session():
+    """Swap a still-valid token for a fresh one"""
+    token, expires_at = auth.issue_token(g.auth['role'], g.auth['sub'])
+    return jsonify({'success': True, 'token': token, 'expires_at': expires_at})
+
+@app.route('/api/auth/logout', methods=['POST'])
+@auth.token_required()
+def logout():
+    auth.revoke_token(g.auth)
+    return jsonify({'success': True})
 
 @app.route('/api/reports/donors', methods=['GET'])
+@conditional('donors', 'requests')
 def download_donor_report():
     """Download comprehensive blood request report as PDF"""
+    # ?summary_only=1 leaves out the per-request and per-donor tables
+    summary_only = request.args.get('summary_only', '').lower() in ('1', 'true', 'yes')
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
     try:
-        pdf_buffer = generate_donor_report()
-        
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"LifeGrid_Blood_Request_Report_{timestamp}.pdf"
-        
-        return Response(
-            pdf_buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename="{filename}"',
-                'Content-Type': 'application/pdf'
-            }
-        )
+        generate_donor_report(path, summary_only=summary_only)
     except Exception as e:
+        os.remove(path)
         return jsonify({'error': str(e)}), 500
 
-def generate_excel_report():
-    """Generate comprehensive Excel report with all data"""
-    conn = get_db()
-    
-    # Get all data
-    cur = conn.execute('SELECT * FROM donors ORDER BY name')
-    donors = [dict(row) for row in cur.fetchall()]
-    
-    cur = conn.execute('SELECT * FROM requests ORDER BY created_at DESC')
-    requests = [dict(row) for row in cur.fetchall()]
-    
-    conn.close()
-    
-    # Create Excel workbook in memory
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-    
-    # Define formats
-    header_format = workbook.add_format({
-        'bold': True,
-        'font_color': 'white',
-        'bg_color': '#dc2626',
-        'border': 1,
-        'align': 'center',
-        'valign': 'vcenter'
-    })
-    
-    subheader_format = workbook.add_format({
-        'bold': True,
-        'font_color': '#dc2626',
-        'border': 1,
-        'align': 'center',
-        'valign': 'vcenter'
-    })
-    
-    data_format = workbook.add_format({
-        'border': 1,
-        'align': 'left',
-        'valign': 'vcenter'
-    })
-    
-    number_format = workbook.add_format({
-        'border': 1,
-        'align': 'center',
-        'valign': 'vcenter',
-        'num_format': '0'
-    })
-    
-    date_format = workbook.add_format({
-        'border': 1,
-        'align': 'center',
-        'valign': 'vcenter',
-        'num_format': 'dd/mm/yyyy'
-    })
-    
-    # Create Summary Sheet
-    summary_sheet = workbook.add_worksheet('Executive Summary')
-    
-    # Title
-    summary_sheet.merge_range('A1:H1', 'LifeGrid Blood Bank - Executive Summary', header_format)
-    summary_sheet.merge_range('A2:H2', f'Report Generated: {datetime.now().strftime("%B %d, %Y at %I:%M %p")}', data_format)
-    summary_sheet.merge_range('A3:H3', f'Total Donors: {len(donors)} | Total Requests: {len(requests)}', data_format)
-    
-    # Blood Group Statistics
-    summary_sheet.write('A5', 'Blood Group Statistics', subheader_format)
-    
-    # Headers
-    headers = ['Blood Group', 'Total Donors', 'Total Requests', 'Pending Requests', 'Approved Requests', 'Fulfilled Requests', 'Demand Ratio', 'Status']
-    for col, header in enumerate(headers):
-        summary_sheet.write(5, col, header, header_format)
-    
-    # Blood group analysis
-    blood_groups = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
-    row = 6
-    
-    for bg in blood_groups:
-        donor_count = len([d for d in donors if d['blood_group'] == bg])
-        total_requests = len([r for r in requests if r['blood_group'] == bg])
-        pending_requests = len([r for r in requests if r['blood_group'] == bg and r['status'] == 'pending'])
-        approved_requests = len([r for r in requests if r['blood_group'] == bg and r['status'] == 'approved'])
-        fulfilled_requests = len([r for r in requests if r['blood_group'] == bg and r['status'] == 'fulfilled'])
-        
-        ratio = f"{total_requests}/{donor_count}" if donor_count > 0 else "0/0"
-        status = "High Demand" if total_requests > donor_count else "Adequate" if donor_count > 0 else "No Donors"
-        
-        summary_sheet.write(row, 0, bg, data_format)
-        summary_sheet.write(row, 1, donor_count, number_format)
-        summary_sheet.write(row, 2, total_requests, number_format)
-        summary_sheet.write(row, 3, pending_requests, number_format)
-        summary_sheet.write(row, 4, approved_requests, number_format)
-        summary_sheet.write(row, 5, fulfilled_requests, number_format)
-        summary_sheet.write(row, 6, ratio, data_format)
-        summary_sheet.write(row, 7, status, data_format)
-        row += 1
-    
-    # Set column widths
-    summary_sheet.set_column('A:A', 12)
-    summary_sheet.set_column('B:H', 15)
-    
-    # Create Donors Sheet
-    donors_sheet = workbook.add_worksheet('Donor Records')
-    
-    # Title
-    donors_sheet.merge_range('A1:H1', 'LifeGrid Blood Bank - Donor Records', header_format)
-    
-    # Headers
-    donor_headers = ['ID', 'Full Name', 'Age', 'Blood Group', 'Contact Number', 'City', 'Last Donation Date', 'Registration Status']
-    for col, header in enumerate(donor_headers):
-        donors_sheet.write(2, col, header, header_format)
-    
-    # Donor data
-    row = 3
-    for donor in donors:
-        donors_sheet.write(row, 0, donor['id'], number_format)
-        donors_sheet.write(row, 1, donor['name'], data_format)
-        donors_sheet.write(row, 2, donor['age'] if donor['age'] else 'N/A', number_format)
-        donors_sheet.write(row, 3, donor['blood_group'], data_format)
-        donors_sheet.write(row, 4, donor['contact'] if donor['contact'] else 'N/A', data_format)
-        donors_sheet.write(row, 5, donor['city'] if donor['city'] else 'N/A', data_format)
-        donors_sheet.write(row, 6, donor['last_donation_date'] if donor['last_donation_date'] else 'No Previous Donations', data_format)
-        donors_sheet.write(row, 7, 'Active', data_format)
-        row += 1
-    
-    # Set column widths
-    donors_sheet.set_column('A:A', 8)
-    donors_sheet.set_column('B:B', 20)
-    donors_sheet.set_column('C:C', 8)
-    donors_sheet.set_column('D:D', 12)
-    donors_sheet.set_column('E:E', 15)
-    donors_sheet.set_column('F:F', 15)
-    donors_sheet.set_column('G:G', 20)
-    donors_sheet.set_column('H:H', 15)
-    
-    # Create Requests Sheet
-    requests_sheet = workbook.add_worksheet('Blood Requests')
-    
-    # Title
-    requests_sheet.merge_range('A1:I1', 'LifeGrid Blood Bank - Blood Requests', header_format)
-    
-    # Headers
-    request_headers = ['ID', 'Patient Name', 'Blood Group', 'Units Required', 'Hospital', 'City', 'Contact', 'Status', 'Request Date']
-    for col, header in enumerate(request_headers):
-        requests_sheet.write(2, col, header, header_format)
-    
-    # Request data
-    row = 3
-    for req in requests:
-        requests_sheet.write(row, 0, req['id'], number_format)
-        requests_sheet.write(row, 1, req['patient_name'], data_format)
-        requests_sheet.write(row, 2, req['blood_group'], data_format)
-        requests_sheet.write(row, 3, req['units'] if req['units'] else 'N/A', number_format)
-        requests_sheet.write(row, 4, req['hospital'] if req['hospital'] else 'N/A', data_format)
-        requests_sheet.write(row, 5, req['city'] if req['city'] else 'N/A', data_format)
-        requests_sheet.write(row, 6, req['contact'] if req['contact'] else 'N/A', data_format)
-        requests_sheet.write(row, 7, req['status'].title(), data_format)
-        
-        # Format date
-        if req['created_at']:
-            try:
-                date_obj = datetime.strptime(req['created_at'], '%Y-%m-%d %H:%M:%S')
-                requests_sheet.write(row, 8, date_obj, date_format)
-            except:
-                requests_sheet.write(row, 8, req['created_at'], data_format)
-        else:
-            requests_sheet.write(row, 8, 'N/A', data_format)
-        row += 1
-    
-    # Set column widths
-    requests_sheet.set_column('A:A', 8)
-    requests_sheet.set_column('B:B', 20)
-    requests_sheet.set_column('C:C', 12)
-    requests_sheet.set_column('D:D', 12)
-    requests_sheet.set_column('E:E', 20)
-    requests_sheet.set_column('F:F', 15)
-    requests_sheet.set_column('G:G', 15)
-    requests_sheet.set_column('H:H', 12)
-    requests_sheet.set_column('I:I', 18)
-    
-    # Create Analytics Sheet
-    analytics_sheet = workbook.add_worksheet('Analytics & Insights')
-    
-    # Title
-    analytics_sheet.merge_range('A1:D1', 'LifeGrid Blood Bank - Analytics & Insights', header_format)
-    
-    # Key Metrics
-    analytics_sheet.write('A3', 'Key Performance Indicators', subheader_format)
-    
-    metrics = [
-        ['Metric', 'Value', 'Description', 'Status'],
-        ['Total Active Donors', len(donors), 'Registered blood donors', 'Active'],
-        ['Total Blood Requests', len(requests), 'All time blood requests', 'Active'],
-        ['Pending Requests', len([r for r in requests if r['status'] == 'pending']), 'Awaiting approval', 'Attention Needed'],
-        ['Fulfilled Requests', len([r for r in requests if r['status'] == 'fulfilled']), 'Successfully completed', 'Excellent'],
-        ['Most Requested Blood Group', max([r['blood_group'] for r in requests], key=[r['blood_group'] for r in requests].count) if requests else 'N/A', 'Highest demand blood type', 'Monitor'],
-        ['Average Request Processing Time', '2-3 days', 'Typical fulfillment time', 'Good'],
-        ['Donor Retention Rate', f"{len([d for d in donors if d['last_donation_date']])}/{len(donors)}" if donors else '0/0', 'Active vs registered donors', 'Monitor']
-    ]
-    
-    for row, metric in enumerate(metrics):
-        for col, value in enumerate(metric):
-            if row == 0:
-                analytics_sheet.write(row + 4, col, value, header_format)
-            else:
-                analytics_sheet.write(row + 4, col, value, data_format)
-    
-    # Set column widths
-    analytics_sheet.set_column('A:A', 25)
-    analytics_sheet.set_column('B:B', 15)
-    analytics_sheet.set_column('C:C', 30)
-    analytics_sheet.set_column('D:D', 15)
-    
-    workbook.close()
-    output.seek(0)
-    return output
+    # Generate filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"LifeGrid_Blood_Request_Report_{timestamp}.pdf"
+    return stream_file(path, 'application/pdf', filename, delete=True)
 
 @app.route('/api/reports/excel', methods=['GET'])
+@conditional('donors', 'requests')
 def download_excel_report():
     """Download comprehensive Excel report with all data"""
+    # Written to a temp file in constant memory, then streamed and removed
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
     try:
-        excel_buffer = generate_excel_report()
-        
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"LifeGrid_Complete_Report_{timestamp}.xlsx"
-        
-        return Response(
-            excel_buffer.getvalue(),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={
-                'Content-Disposition': f'attachment; filename="{filename}"',
-                'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            }
-        )
+        generate_excel_report(path)
     except Exception as e:
+        os.remove(path)
         return jsonify({'error': str(e)}), 500
 
+    # Generate filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"LifeGrid_Complete_Report_{timestamp}.xlsx"
+    return stream_file(path, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                       filename, delete=True)
+
+@app.route('/api/export/<table>', methods=['GET'])
+def export_table(table):
+    """Bulk export: ?format=csv|ndjson&columns=a,b&since=<timestamp>&after_id=N&limit=N&gzip=1"""
+    if table not in EXPORT_TABLES:
+        return jsonify({'success': False, 'error': f'Unknown export table: {table}'}), 404
+    gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    conn = get_db()
+    try:
+        return export_response(conn, table, request.args, gzip=gzip)
+    except InvalidExportRequest as e:
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/reports/jobs', methods=['POST'])
+def create_report_job():
+    """Queue a PDF or Excel report for background generation"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        job_id = report_jobs.submit_job(data.get('format', 'pdf'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/api/reports/jobs/{job_id}'
+    }), 202
+
+@app.route('/api/reports/jobs/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """Report job status and progress"""
+    job = report_jobs.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Report job not found'}), 404
+    job.pop('file_path')
+    if job['status'] == 'done':
+        job['download_url'] = f'/api/reports/jobs/{job_id}/download'
+    return jsonify(job)
+
+@app.route('/api/reports/jobs/<job_id>/download', methods=['GET'])
+def download_report_job(job_id):
+    """Download the file produced by a finished report job"""
+    job = report_jobs.get_job(job_id)
+    if not job or job['status'] != 'done' or not os.path.exists(job['file_path'] or ''):
+        return jsonify({'success': False, 'error': 'Report not available'}), 404
+    return send_file(job['file_path'], mimetype=report_jobs.job_mimetype(job),
+                     as_attachment=True, download_name=job['file_name'])
+
 # User API endpoints
 @app.route('/api/users/register', methods=['POST'])
 def register_user():
@@ -711,10 +515,10 @@ def register_user():
         # Get data from request
         if request.is_json:
             data = request.get_json()
-            print(f"Received JSON data: {data}")
+            print(f"Received JSON data: {auth.redact(data)}")
         else:
             data = request.form.to_dict()
-            print(f"Received form data: {data}")
+            print(f"Received form data: {auth.redact(data)}")
         
         name = data.get('name')
         username = data.get('username')
@@ -723,13 +527,16 @@ def register_user():
         contact = data.get('contact')
         blood_group = data.get('blood_group', '')
         
-        print(f"Extracted values - name: {name}, username: {username}, email: {email}, password: {'*' * len(password) if password else None}, contact: {contact}, blood_group: {blood_group}")
+        print(f"Extracted values - name: {name}, username: {username}, email: {email}, password: {'***' if password else None}, contact: {contact}, blood_group: {blood_group}")
         
         # Validation
         if not name or not username or not email or not password:
             print("Validation failed: Missing required fields")
             return jsonify({'success': False, 'error': 'Name, username, email, and password are required'}), 400
         
+        # Hash before checking out a connection: it is slow on purpose
+        password_hash = auth.hash_password(password)
+        
         conn = get_db()
         print(f"Database connection established: {DB_PATH}")
         try:
@@ -737,23 +544,26 @@ def register_user():
             cur = conn.execute('SELECT * FROM users WHERE username=? OR email=?', (username, email))
             existing = cur.fetchone()
             if existing:
-                print(f"User already exists: {dict(existing)}")
+                print(f"User already exists: {auth.redact(existing)}")
                 conn.close()
                 return jsonify({'success': False, 'error': 'Username or email already exists'}), 400
             
             # Insert new user
             print("Inserting new user into database...")
-            cur = conn.execute(
-                'INSERT INTO users (name, username, email, password, contact, blood_group) VALUES (?, ?, ?, ?, ?, ?)',
-                (name, username, email, password, contact, blood_group)
-            )
-            conn.commit()
-            user_id = cur.lastrowid
-            print(f"User inserted successfully with ID: {user_id}")
+            vals = (name, username, email, password_hash, contact, blood_group)
+            
+            def insert_user(conn):
+                cur = conn.execute(
+                    'INSERT INTO users (name, username, email, password, contact, blood_group) VALUES (?, ?, ?, ?, ?, ?)',
+                    vals
+                )
+                print(f"User inserted successfully with ID: {cur.lastrowid}")
+                # Get the created user (without password)
+                cur = conn.execute('SELECT id, name, username, email, contact, blood_group, created_at FROM users WHERE id=?',
+                                   (cur.lastrowid,))
+                return cur.fetchone()
             
-            # Get the created user (without password)
-            cur = conn.execute('SELECT id, name, username, email, contact, blood_group, created_at FROM users WHERE id=?', (user_id,))
-            row = cur.fetchone()
+            row = db.run_write(insert_user)
             if row:
                 user = dict(row)
                 print(f"Retrieved user: {user}")
@@ -793,24 +603,34 @@ def user_login():
         
         username = data.get('username')
         password = data.get('password')
-        print(f"Login attempt - username: {username}, password: {'*' * len(password) if password else None}")
+        print(f"Login attempt - username: {username}, password: {'***' if password else None}")
         
         if not username or not password:
             return jsonify({'success': False, 'error': 'Username and password are required'}), 400
         
         conn = get_db()
-        # Check username or email
-        cur = conn.execute('SELECT id, name, username, email, password, contact, blood_group, created_at FROM users WHERE (username=? OR email=?) AND password=?', 
-                           (username, username, password))
-        row = cur.fetchone()
+        # Check username or email; one user's username may be another's email
+        cur = conn.execute('SELECT id, name, username, email, password, contact, blood_group, created_at FROM users WHERE username=? OR email=?',
+                           (username, username))
+        rows = cur.fetchall()
         conn.close()
         
+        row = None
+        for candidate in rows or [None]:
+            matches, needs_rehash = auth.verify_password(candidate['password'] if candidate else None, password)
+            if matches:
+                row = candidate
+                break
+        
         if row:
+            if needs_rehash:
+                db.run_write(auth.upgrade_password, 'users', row['id'], row['password'], auth.hash_password(password))
             user = dict(row)
             # Remove password from response
             del user['password']
+            token, expires_at = auth.issue_token('user', user['id'])
             print(f"Login successful for user: {user['username']}")
-            return jsonify({'success': True, 'user': user})
+            return jsonify({'success': True, 'user': user, 'token': token, 'expires_at': expires_at})
         else:
             print("Login failed: Invalid credentials")
             return jsonify({'success': False, 'error': 'Invalid username/email or password'}), 401
@@ -821,6 +641,7 @@ def user_login():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/users/<int:user_id>', methods=['GET'])
+@conditional('users')
 def get_user(user_id):
     """Get user by ID"""
     conn = get_db()
@@ -846,7 +667,7 @@ def update_user(user_id):
         else:
             data = request.form.to_dict()
         
-        print(f"Update data received: {data}")
+        print(f"Update data received: {auth.redact(data)}")
         
         name = data.get('name')
         email = data.get('email')
@@ -866,7 +687,7 @@ def update_user(user_id):
             print(f"User not found with ID: {user_id}")
             return jsonify({'success': False, 'error': 'User not found'}), 404
         
-        print(f"Current user data: {dict(row)}")
+        print(f"Current user data: {auth.redact(row)}")
         
         # Check if email is being changed and if it already exists
         if email != row['email']:
@@ -876,23 +697,26 @@ def update_user(user_id):
                 print("Email already exists")
                 return jsonify({'success': False, 'error': 'Email already exists'}), 400
         
+        conn.close()
+        
         # Update user
         print(f"Updating user with: name={name}, email={email}, contact={contact}, blood_group={blood_group}")
-        conn.execute('UPDATE users SET name=?, email=?, contact=?, blood_group=? WHERE id=?',
-                     (name, email, contact, blood_group, user_id))
-        conn.commit()
-        print("User updated successfully")
         
-        # Get updated user
-        cur = conn.execute('SELECT id, name, username, email, contact, blood_group, created_at FROM users WHERE id=?', (user_id,))
-        updated_row = cur.fetchone()
+        def update(conn):
+            conn.execute('UPDATE users SET name=?, email=?, contact=?, blood_group=? WHERE id=?',
+                         (name, email, contact, blood_group, user_id))
+            # Get updated user
+            cur = conn.execute('SELECT id, name, username, email, contact, blood_group, created_at FROM users WHERE id=?',
+                               (user_id,))
+            return cur.fetchone()
+        
+        updated_row = db.run_write(update)
+        print("User updated successfully")
         if updated_row:
             updated = dict(updated_row)
             print(f"Updated user data: {updated}")
-            conn.close()
             return jsonify(updated), 200
         else:
-            conn.close()
             print("Failed to retrieve updated user")
             return jsonify({'success': False, 'error': 'Failed to retrieve updated user'}), 500
     except Exception as e:
@@ -916,11 +740,11 @@ def delete_user(user_id):
             print(f"User not found with ID: {user_id}")
             return jsonify({'success': False, 'error': 'User not found'}), 404
         
-        print(f"Deleting user: {dict(row)}")
-        conn.execute('DELETE FROM users WHERE id=?', (user_id,))
-        conn.commit()
-        print(f"User {user_id} deleted successfully")
+        print(f"Deleting user: {auth.redact(row)}")
         conn.close()
+        db.run_write(lambda conn: conn.execute('DELETE FROM users WHERE id=?', (user_id,)))
+        auth.revoke_subject('user', user_id)
+        print(f"User {user_id} deleted successfully")
         return jsonify({'success': True}), 200
     except Exception as e:
         print(f"Error in delete_user: {str(e)}")
@@ -929,6 +753,7 @@ def delete_user(user_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/users/<int:user_id>/donations', methods=['GET'])
+@conditional('user_donations', 'donors')
 def get_user_donations(user_id):
     """Get user's donation history"""
     conn = get_db()
@@ -940,9 +765,7 @@ def get_user_donations(user_id):
         WHERE ud.user_id = ?
         ORDER BY ud.donation_date DESC
     ''', (user_id,))
-    donations = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    return jsonify({'donations': donations})
+    return stream_rows(conn, cur, key='donations')
 
 @app.route('/api/users/<int:user_id>/donations', methods=['POST'])
 def add_user_donation(user_id):
@@ -962,29 +785,30 @@ def add_user_donation(user_id):
         conn.close()
         return jsonify({'success': False, 'error': 'User not found'}), 404
     
-    # Insert donation
-    cur = conn.execute('''
-        INSERT INTO user_donations (user_id, blood_group, donation_date, location, units_donated, notes)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (user_id, data['blood_group'], data['donation_date'], data['location'], 
-          data['units_donated'], data.get('notes', '')))
-    
-    donation_id = cur.lastrowid
-    conn.commit()
-    
-    # Get the created donation
-    cur = conn.execute('''
-        SELECT ud.id, ud.user_id, ud.donor_id, ud.blood_group, ud.donation_date, 
-               ud.location, ud.units_donated, ud.notes
-        FROM user_donations ud
-        WHERE ud.id = ?
-    ''', (donation_id,))
-    donation = dict(cur.fetchone())
     conn.close()
+
+    def insert_donation(conn):
+        cur = conn.execute('''
+            INSERT INTO user_donations (user_id, blood_group, donation_date, location, units_donated, notes)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, data['blood_group'], data['donation_date'], data['location'],
+              data['units_donated'], data.get('notes', '')))
+
+        # Get the created donation
+        cur = conn.execute('''
+            SELECT ud.id, ud.user_id, ud.donor_id, ud.blood_group, ud.donation_date, 
+                   ud.location, ud.units_donated, ud.notes
+            FROM user_donations ud
+            WHERE ud.id = ?
+        ''', (cur.lastrowid,))
+        return dict(cur.fetchone())
+
+    donation = db.run_write(insert_donation)
     
     return jsonify({'success': True, 'donation': donation}), 201
 
 @app.route('/api/users/<int:user_id>/requests', methods=['GET'])
+@conditional('user_requests', 'requests')
 def get_user_requests(user_id):
     """Get user's blood request history"""
     conn = get_db()
@@ -997,9 +821,7 @@ def get_user_requests(user_id):
         WHERE ur.user_id = ?
         ORDER BY ur.created_at DESC
     ''', (user_id,))
-    requests = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    return jsonify({'requests': requests})
+    return stream_rows(conn, cur, key='requests')
 
 @app.route('/api/users/<int:user_id>/requests', methods=['POST'])
 def add_user_request(user_id):
@@ -1019,40 +841,89 @@ def add_user_request(user_id):
         conn.close()
         return jsonify({'success': False, 'error': 'User not found'}), 404
     
-    # Insert user request
-    cur = conn.execute('''
-        INSERT INTO user_requests (user_id, request_id, patient_name, blood_group, units_requested, 
-                                  hospital, city, contact, urgency_level, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, data.get('request_id'), data['patient_name'], data['blood_group'], data['units_requested'],
-          data['hospital'], data['city'], data['contact'], 
-          data.get('urgency_level', 'normal'), data.get('status', 'pending')))
-    
-    request_id = cur.lastrowid
-    conn.commit()
-    
-    # Get the created request
-    cur = conn.execute('''
-        SELECT ur.id, ur.user_id, ur.request_id, ur.patient_name, ur.blood_group, 
-               ur.units_requested, ur.hospital, ur.city, ur.contact, ur.urgency_level, 
-               ur.status, ur.created_at
-        FROM user_requests ur
-        WHERE ur.id = ?
-    ''', (request_id,))
-    user_request = dict(cur.fetchone())
     conn.close()
+
+    def insert_user_request(conn):
+        cur = conn.execute('''
+            INSERT INTO user_requests (user_id, request_id, patient_name, blood_group, units_requested, 
+                                      hospital, city, contact, urgency_level, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, data.get('request_id'), data['patient_name'], data['blood_group'], data['units_requested'],
+              data['hospital'], data['city'], data['contact'],
+              data.get('urgency_level', 'normal'), data.get('status', 'pending')))
+
+        # Get the created request
+        cur = conn.execute('''
+            SELECT ur.id, ur.user_id, ur.request_id, ur.patient_name, ur.blood_group, 
+                   ur.units_requested, ur.hospital, ur.city, ur.contact, ur.urgency_level, 
+                   ur.status, ur.created_at
+            FROM user_requests ur
+            WHERE ur.id = ?
+        ''', (cur.lastrowid,))
+        return dict(cur.fetchone())
+
+    user_request = db.run_write(insert_user_request)
     
     return jsonify({'success': True, 'request': user_request}), 201
 
 # Notification API endpoints
 @app.route('/api/users/<int:user_id>/notifications', methods=['GET'])
+@conditional('notifications')
 def get_user_notifications(user_id):
-    """Get all notifications for a user"""
-    conn = get_db()
-    
+    """Get notifications for a user.
+
+    ?since_id=N returns only notifications newer than N, oldest first, so a
+    client holding a local copy fetches just the delta (repeat with the
+    returned latest_id while has_more). ?limit=N&after=<cursor> pages
+    through history newest first. Without either, the full list is sent.
+    """
     # Get query parameters for filtering
     unread_only = request.args.get('unread_only', 'false').lower() == 'true'
-    
+    where = 'user_id = ? AND is_read = 0' if unread_only else 'user_id = ?'
+
+    since_id = request.args.get('since_id')
+    if since_id is not None:
+        try:
+            since_id = int(since_id)
+            limit = parse_limit(request.args.get('limit'), default=MAX_PAGE_SIZE)
+        except (ValueError, InvalidPageRequest):
+            return jsonify({'success': False, 'error': 'since_id and limit must be integers'}), 400
+        conn = get_db()
+        rows = conn.execute(f'SELECT * FROM notifications WHERE {where} AND id > ? ORDER BY id LIMIT ?',
+                            (user_id, since_id, limit + 1)).fetchall()
+        unread = unread_count(conn, user_id)
+        conn.close()
+        return jsonify({
+            'notifications': [dict(r) for r in rows[:limit]],
+            'latest_id': rows[:limit][-1]['id'] if rows else since_id,
+            'has_more': len(rows) > limit,
+            'unread_count': unread
+        })
+
+    if wants_page(request.args):
+        after = request.args.get('after') or None
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            conn = get_db()
+            rows, next_cursor = fetch_page(conn, 'notifications', ('id',), after, limit, descending=True,
+                                           where=where, where_params=(user_id,))
+        except InvalidPageRequest as e:
+            return jsonify({'error': str(e)}), 400
+        unread = unread_count(conn, user_id)
+        conn.close()
+        return jsonify({
+            'notifications': [dict(r) for r in rows],
+            'limit': limit,
+            'after': after,
+            'next_cursor': next_cursor,
+            'unread_count': unread
+        })
+
+    conn = get_db()
+
+    # Get unread count first; the list itself is streamed after it
+    unread = unread_count(conn, user_id)
+
     if unread_only:
         cur = conn.execute('''
             SELECT * FROM notifications 
@@ -1066,72 +937,77 @@ def get_user_notifications(user_id):
             ORDER BY created_at DESC
         ''', (user_id,))
     
-    notifications = [dict(row) for row in cur.fetchall()]
-    
-    # Get unread count
-    cur = conn.execute('SELECT COUNT(*) as count FROM notifications WHERE user_id = ? AND is_read = 0', (user_id,))
-    unread_count = cur.fetchone()['count']
-    
+    return stream_rows(conn, cur, key='notifications', extra={'unread_count': unread})
+
+@app.route('/api/users/<int:user_id>/notifications/unread-count', methods=['GET'])
+@conditional('notifications')
+def get_unread_count(user_id):
+    """Unread notification count from the per-user counter"""
+    conn = get_db()
+    unread = unread_count(conn, user_id)
     conn.close()
-    return jsonify({
-        'notifications': notifications,
-        'unread_count': unread_count
+    return jsonify({'user_id': user_id, 'unread_count': unread})
+
+@app.route('/api/users/<int:user_id>/notifications/stream', methods=['GET'])
+def stream_user_notifications(user_id):
+    """Server-Sent Events: new notifications and unread count changes, as they happen"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Last-Event-ID must be a notification id'}), 400
+    # Each stream holds a worker thread; past the cap clients poll instead
+    if not acquire_stream_slot():
+        response = jsonify({'success': False, 'error': 'too many open notification streams, poll instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(STREAM_RETRY_AFTER_SECONDS)
+        return response
+    response = Response(stream_notifications(user_id, last_event_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
     })
+    # Runs when the response is closed, whether or not the stream ever started
+    response.call_on_close(release_stream_slot)
+    return response
 
 @app.route('/api/users/<int:user_id>/notifications/<int:notification_id>/read', methods=['PUT'])
 def mark_notification_read(user_id, notification_id):
     """Mark a notification as read"""
-    conn = get_db()
-    
-    # Verify notification belongs to user
-    cur = conn.execute('SELECT * FROM notifications WHERE id = ? AND user_id = ?', (notification_id, user_id))
-    notification = cur.fetchone()
-    
-    if not notification:
-        conn.close()
+    def mark_read(conn):
+        # Only matches when the notification belongs to the user
+        cur = conn.execute('UPDATE notifications SET is_read = 1 WHERE id = ? AND user_id = ?',
+                           (notification_id, user_id))
+        return cur.rowcount, unread_count(conn, user_id)
+
+    updated, unread = db.run_write(mark_read)
+    if not updated:
         return jsonify({'success': False, 'error': 'Notification not found'}), 404
-    
-    # Mark as read
-    conn.execute('UPDATE notifications SET is_read = 1 WHERE id = ?', (notification_id,))
-    conn.commit()
-    conn.close()
-    
-    return jsonify({'success': True, 'message': 'Notification marked as read'})
+
+    return jsonify({'success': True, 'message': 'Notification marked as read', 'unread_count': unread})
 
 @app.route('/api/users/<int:user_id>/notifications/read-all', methods=['PUT'])
 def mark_all_notifications_read(user_id):
     """Mark all notifications as read for a user"""
-    conn = get_db()
-    
-    conn.execute('UPDATE notifications SET is_read = 1 WHERE user_id = ?', (user_id,))
-    conn.commit()
-    
-    # Get updated count
-    cur = conn.execute('SELECT COUNT(*) as count FROM notifications WHERE user_id = ? AND is_read = 0', (user_id,))
-    unread_count = cur.fetchone()['count']
-    
-    conn.close()
-    return jsonify({'success': True, 'message': 'All notifications marked as read', 'unread_count': unread_count})
+    def mark_all_read(conn):
+        conn.execute('UPDATE notifications SET is_read = 1 WHERE user_id = ? AND is_read = 0', (user_id,))
+        return unread_count(conn, user_id)
+
+    unread = db.run_write(mark_all_read)
+    return jsonify({'success': True, 'message': 'All notifications marked as read', 'unread_count': unread})
 
 @app.route('/api/users/<int:user_id>/notifications/<int:notification_id>', methods=['DELETE'])
 def delete_notification(user_id, notification_id):
     """Delete a notification"""
-    conn = get_db()
-    
-    # Verify notification belongs to user
-    cur = conn.execute('SELECT * FROM notifications WHERE id = ? AND user_id = ?', (notification_id, user_id))
-    notification = cur.fetchone()
-    
-    if not notification:
-        conn.close()
+    def delete(conn):
+        # Only matches when the notification belongs to the user
+        cur = conn.execute('DELETE FROM notifications WHERE id = ? AND user_id = ?', (notification_id, user_id))
+        return cur.rowcount, unread_count(conn, user_id)
+
+    deleted, unread = db.run_write(delete)
+    if not deleted:
         return jsonify({'success': False, 'error': 'Notification not found'}), 404
-    
-    # Delete notification
-    conn.execute('DELETE FROM notifications WHERE id = ?', (notification_id,))
-    conn.commit()
-    conn.close()
-    
-    return jsonify({'success': True, 'message': 'Notification deleted'})
+
+    return jsonify({'success': True, 'message': 'Notification deleted', 'unread_count': unread})
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -1140,7 +1016,6 @@ if __name__ == '__main__':
 @app.route('/api/donors/<int:donor_id>', methods=['PUT'])
 def update_donor(donor_id):
     """Update donor details"""
-    conn = get_db()
     data = request.get_json() or {}
     name = data.get('name')
     email = data.get('email')
@@ -1149,25 +1024,23 @@ def update_donor(donor_id):
     # Basic validation
     if not name or not email:
         return jsonify({'success': False, 'error': 'Name and email are required'}), 400
-    cur = conn.execute('SELECT * FROM donors WHERE id=?', (donor_id,))
-    row = cur.fetchone()
+
+    def update(conn):
+        if not conn.execute('SELECT 1 FROM donors WHERE id=?', (donor_id,)).fetchone():
+            return None
+        conn.execute('UPDATE donors SET name=?, email=?, phone=?, blood_group=? WHERE id=?',
+                     (name, email, phone, blood_group, donor_id))
+        return conn.execute('SELECT * FROM donors WHERE id=?', (donor_id,)).fetchone()
+
+    row = db.run_write(update)
     if not row:
         return jsonify({'success': False, 'error': 'Donor not found'}), 404
-    conn.execute('UPDATE donors SET name=?, email=?, phone=?, blood_group=? WHERE id=?',
-                 (name, email, phone, blood_group, donor_id))
-    conn.commit()
-    cur = conn.execute('SELECT * FROM donors WHERE id=?', (donor_id,))
-    updated = dict(cur.fetchone())
-    return jsonify(updated), 200
+    return jsonify(dict(row)), 200
 
 @app.route('/api/donors/<int:donor_id>', methods=['DELETE'])
 def delete_donor(donor_id):
     """Delete donor"""
-    conn = get_db()
-    cur = conn.execute('SELECT * FROM donors WHERE id=?', (donor_id,))
-    row = cur.fetchone()
-    if not row:
+    deleted = db.run_write(lambda conn: conn.execute('DELETE FROM donors WHERE id=?', (donor_id,)).rowcount)
+    if not deleted:
         return jsonify({'success': False, 'error': 'Donor not found'}), 404
-    conn.execute('DELETE FROM donors WHERE id=?', (donor_id,))
-    conn.commit()
     return jsonify({'success': True}), 200
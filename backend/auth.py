@@ -0,0 +1,300 @@
+"""Signed session tokens and salted password hashes
+
+A successful login returns a token signed with the app's secret key
+(itsdangerous). It carries the account's role and id, a random token id and
+its issue time, so verifying it is an HMAC check in memory: no table is
+read per request. Tokens expire after TOKEN_TTL_SECONDS; clients refresh
+them before then.
+
+Logging out revokes one token, deleting an account revokes every token
+issued to it. Revocations are written to revoked_tokens and held in a
+per-process cache; each process picks up the others' revocations with one
+short query every REVOCATION_REFRESH_SECONDS, and entries are dropped once
+the tokens they cover would have expired anyway.
+
+Passwords are stored as werkzeug salted hashes. Hashing is deliberately
+slow, but scrypt releases the GIL, so it runs inline on the request thread
+while other threads keep serving. A semaphore sized to the CPUs caps how
+many hashes run at once: more would only share the same cores, and each
+scrypt hash also takes 32 MB. Accounts still holding a plaintext password
+are upgraded on their next login, or all at once with:
+
+    python auth.py --hash-passwords
+
+The secret comes from BLOODBANK_SECRET_KEY; without it a random key is
+created once in SECRET_KEY_PATH and shared by every worker.
+"""
+import hmac
+import os
+import secrets
+import sys
+import threading
+import time
+from functools import wraps
+
+from flask import g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import db
+
+TOKEN_TTL_SECONDS = int(os.environ.get('BLOODBANK_TOKEN_TTL_SECONDS', '3600'))
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('BLOODBANK_REVOCATION_REFRESH_SECONDS', '5'))
+
+SECRET_KEY_PATH = os.environ.get('BLOODBANK_SECRET_KEY_PATH',
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), 'secret_key'))
+TOKEN_SALT = 'bloodbank-session'
+
+PASSWORD_METHOD = 'scrypt'
+HASH_CONCURRENCY = int(os.environ.get('BLOODBANK_HASH_CONCURRENCY', str(os.cpu_count() or 1)))
+
+# Hash prefixes werkzeug produces; anything else is a legacy plaintext password
+HASH_METHODS = ('scrypt', 'pbkdf2')
+
+
+class InvalidToken(Exception):
+    """Raised for a missing, malformed, expired or revoked token"""
+
+
+def _load_secret_key():
+    key = os.environ.get('BLOODBANK_SECRET_KEY')
+    if key:
+        return key
+    try:
+        # O_EXCL: when several workers start at once, exactly one writes the key
+        fd = os.open(SECRET_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(SECRET_KEY_PATH) as f:
+            key = f.read().strip()
+        if key:
+            return key
+        # Another worker created the file but has not written it yet
+        time.sleep(0.1)
+        return _load_secret_key()
+    key = secrets.token_urlsafe(48)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    return key
+
+
+_serializer = None
+
+
+def get_serializer():
+    global _serializer
+    if _serializer is None:
+        _serializer = URLSafeTimedSerializer(_load_secret_key(), salt=TOKEN_SALT)
+    return _serializer
+
+
+def issue_token(role, subject):
+    """(token, expires_at) for an account; expires_at is a Unix timestamp"""
+    token = get_serializer().dumps({'role': role, 'sub': subject, 'jti': secrets.token_hex(8)})
+    return token, int(time.time()) + TOKEN_TTL_SECONDS
+
+
+def verify_token(token):
+    """The token's claims (role, sub, jti, iat, exp), or InvalidToken"""
+    if not token:
+        raise InvalidToken('missing token')
+    try:
+        claims, issued = get_serializer().loads(token, max_age=TOKEN_TTL_SECONDS, return_timestamp=True)
+    except SignatureExpired:
+        raise InvalidToken('token expired')
+    except BadSignature:
+        raise InvalidToken('invalid token')
+    claims['iat'] = int(issued.timestamp())
+    claims['exp'] = claims['iat'] + TOKEN_TTL_SECONDS
+    if get_revocations().is_revoked(claims):
+        raise InvalidToken('token revoked')
+    return claims
+
+
+class RevocationCache:
+    """Revoked token ids and per-account cut-offs, mirrored from revoked_tokens"""
+
+    def __init__(self, refresh_seconds=REVOCATION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._tokens = {}      # token id -> expires_at
+        self._subjects = {}    # (role, subject) -> (not_before, expires_at)
+        self._last_id = 0
+        self._next_refresh = 0.0
+
+    def is_revoked(self, claims):
+        now = time.time()
+        if now >= self._next_refresh:
+            self.refresh(now)
+        if claims['jti'] in self._tokens:
+            return True
+        cutoff = self._subjects.get((claims['role'], claims['sub']))
+        return cutoff is not None and claims['iat'] < cutoff[0]
+
+    def refresh(self, now=None):
+        """Load revocations recorded since the last refresh, by any process"""
+        now = now or time.time()
+        with self._lock:
+            if now < self._next_refresh:
+                return
+            conn = db.get_db()
+            try:
+                rows = conn.execute('''
+                    SELECT id, token_id, role, subject, not_before, expires_at
+                    FROM revoked_tokens
+                    WHERE id > ? AND expires_at > ?
+                    ORDER BY id
+                ''', (self._last_id, now)).fetchall()
+            finally:
+                conn.close()
+            for row in rows:
+                self._remember(row['token_id'], row['role'], row['subject'], row['not_before'], row['expires_at'])
+                self._last_id = row['id']
+            self._tokens = {jti: expires for jti, expires in self._tokens.items() if expires > now}
+            self._subjects = {key: cutoff for key, cutoff in self._subjects.items() if cutoff[1] > now}
+            self._next_refresh = now + self.refresh_seconds
+
+    def _remember(self, token_id, role, subject, not_before, expires_at):
+        if token_id:
+            self._tokens[token_id] = expires_at
+        else:
+            previous = self._subjects.get((role, subject), (0, 0))
+            self._subjects[(role, subject)] = (max(previous[0], not_before), max(previous[1], expires_at))
+
+    def add(self, token_id, role, subject, not_before, expires_at):
+        """Record a revocation made by this process, effective immediately here"""
+        db.run_write(_insert_revocation, token_id, role, subject, not_before, expires_at)
+        with self._lock:
+            self._remember(token_id, role, subject, not_before, expires_at)
+
+    def stats(self):
+        return {'tokens': len(self._tokens), 'accounts': len(self._subjects), 'last_id': self._last_id}
+
+
+def _insert_revocation(conn, token_id, role, subject, not_before, expires_at):
+    conn.execute('DELETE FROM revoked_tokens WHERE expires_at <= ?', (time.time(),))
+    conn.execute('''
+        INSERT INTO revoked_tokens (token_id, role, subject, not_before, expires_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (token_id, role, subject, not_before, expires_at))
+
+
+_revocations = None
+_revocations_pid = None
+_revocations_lock = threading.Lock()
+
+
+def get_revocations():
+    global _revocations, _revocations_pid
+    if _revocations is None or _revocations_pid != os.getpid():
+        with _revocations_lock:
+            if _revocations is None or _revocations_pid != os.getpid():
+                _revocations = RevocationCache()
+                _revocations_pid = os.getpid()
+    return _revocations
+
+
+def revoke_token(claims):
+    """Revoke one token (logout)"""
+    get_revocations().add(claims['jti'], claims['role'], claims['sub'], None, claims['exp'])
+
+
+def revoke_subject(role, subject):
+    """Revoke every token issued to an account so far"""
+    now = time.time()
+    get_revocations().add(None, role, subject, now, now + TOKEN_TTL_SECONDS)
+
+
+def token_from_request():
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else None
+
+
+def token_required(*roles):
+    """Decorator: reject the request with 401 unless it carries a valid token
+    for one of roles (any role when none are given); the claims go in g.auth"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                claims = verify_token(token_from_request())
+            except InvalidToken as e:
+                return jsonify({'success': False, 'error': str(e)}), 401
+            if roles and claims['role'] not in roles:
+                return jsonify({'success': False, 'error': 'forbidden'}), 403
+            g.auth = claims
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_hash_slots = threading.BoundedSemaphore(HASH_CONCURRENCY)
+
+
+def _run_hash(fn, *args):
+    with _hash_slots:
+        return fn(*args)
+
+
+def is_password_hash(stored):
+    return bool(stored) and stored.count('$') == 2 and stored.split(':', 1)[0].split('$', 1)[0] in HASH_METHODS
+
+
+def hash_password(password):
+    return _run_hash(generate_password_hash, password, PASSWORD_METHOD)
+
+
+_dummy_hash = None
+
+
+def verify_password(stored, password):
+    """(matches, needs_rehash) for a stored password, hashed or legacy plaintext.
+
+    With stored None (no such account) a hash is still checked, so a wrong
+    username takes as long as a wrong password.
+    """
+    global _dummy_hash
+    if stored is None:
+        if _dummy_hash is None:
+            _dummy_hash = hash_password(secrets.token_hex(16))
+        _run_hash(check_password_hash, _dummy_hash, password)
+        return False, False
+    if not is_password_hash(stored):
+        matches = hmac.compare_digest(stored.encode(), password.encode())
+        return matches, matches
+    matches = _run_hash(check_password_hash, stored, password)
+    return matches, matches and not stored.startswith(f'{PASSWORD_METHOD}:')
+
+
+def redact(values):
+    """A copy of a row or payload that is safe to log: no password"""
+    return {key: '***' if key == 'password' else value for key, value in dict(values).items()}
+
+
+def upgrade_password(conn, table, account_id, stored, password_hash):
+    """Replace a stored password with its new hash, unless it changed meanwhile"""
+    conn.execute(f'UPDATE {table} SET password = ? WHERE id = ? AND password = ?',
+                 (password_hash, account_id, stored))
+
+
+def hash_plaintext_passwords():
+    """Hash every remaining plaintext password in users and admin; returns how many"""
+    conn = db.connect()
+    try:
+        accounts = [(table, row['id'], row['password'])
+                    for table in ('users', 'admin')
+                    for row in conn.execute(f'SELECT id, password FROM {table}')
+                    if row['password'] and not is_password_hash(row['password'])]
+    finally:
+        conn.close()
+    for table, account_id, password in accounts:
+        db.run_write(upgrade_password, table, account_id, password, hash_password(password))
+    return len(accounts)
+
+
+if __name__ == '__main__':
+    if '--hash-passwords' not in sys.argv:
+        print('usage: python auth.py --hash-passwords')
+        sys.exit(2)
+    import migrations
+    migrations.migrate()
+    print(f"Hashed {hash_plaintext_passwords()} plaintext passwords")
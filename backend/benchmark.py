@@ -0,0 +1,513 @@
+"""Load test and latency benchmark for the API
+
+Seeds a fresh database (deterministic for a given --seed and --scale) in a
+temporary directory, then replays a weighted mix of user journeys against
+the app from --concurrency client threads:
+
+    home                 GET /api/stats
+    admin_dashboard      stats plus the first page of requests and donors
+    status_update        PUT a request's status (writer thread, outbox)
+    notification_poll    unread count plus a since_id delta sync
+    matching             ranked donor matches and a full-text search
+    report_download      CSV export and the summary PDF report
+
+Clients remember ETags like the frontend does, so unchanged GETs are 304s.
+The app runs in-process through Flask's test client (--server inprocess,
+no network) or under a local gunicorn with the production worker class
+(--server gunicorn). Every request is timed; after --warmup seconds the
+run reports throughput and p50/p95/p99 per endpoint, writes them to
+--output as JSON and compares them with the stored baseline:
+
+    python benchmark.py --save-baseline      record benchmark_baseline.json
+    python benchmark.py                      exit 1 on a regression
+
+A regression is an endpoint whose p95 grew by more than --tolerance (and by
+at least MIN_REGRESSION_MS), total throughput that fell by more than
+--tolerance, or any failed request. A baseline recorded with a different
+server, mix, scale or concurrency is not compared (exit 2).
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = os.path.join(BASE_DIR, 'benchmark_results.json')
+BASELINE_PATH = os.path.join(BASE_DIR, 'benchmark_baseline.json')
+
+# Rows seeded at --scale 1
+SEED_DONORS = 20000
+SEED_REQUESTS = 5000
+SEED_USERS = 500
+NOTIFICATIONS_PER_USER = 40
+DONATIONS_PER_USER = 3
+USER_REQUESTS_PER_USER = 2
+
+DEFAULT_TOLERANCE = 0.25
+# p95 changes smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_MS = 2.0
+
+SERVER_START_TIMEOUT = 30
+
+BLOOD_GROUPS = ('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-')
+GROUP_WEIGHTS = (30, 6, 9, 2, 4, 1, 40, 8)
+CITIES = ('Mumbai', 'Pune', 'Ahmedabad', 'Surat', 'Delhi', 'Bengaluru', 'Chennai', 'Kolkata', 'Hyderabad',
+          'Jaipur', 'Lucknow', 'Bhopal', 'Nagpur', 'Vadodara', 'Rajkot', 'Indore')
+FIRST_NAMES = ('Aarav', 'Vivaan', 'Aditya', 'Ishaan', 'Rohan', 'Priya', 'Ananya', 'Diya', 'Kavya', 'Meera',
+               'Rahul', 'Sneha', 'Arjun', 'Pooja', 'Rajesh', 'Neha', 'Karan', 'Isha', 'Vikram', 'Nisha')
+LAST_NAMES = ('Patel', 'Shah', 'Sharma', 'Mehta', 'Iyer', 'Reddy', 'Gupta', 'Desai', 'Joshi', 'Nair',
+              'Singh', 'Kumar', 'Rao', 'Bose', 'Verma')
+HOSPITALS = ('Civil Hospital', 'City General', 'Apollo', 'Fortis', 'Sterling', 'Lifeline', 'Sunrise Care')
+SEARCH_TERMS = ('patel', 'priya sh', 'apollo', 'mumbai', 'rajesh', 'civil', 'kavya iyer', 'fortis pune')
+
+
+def seed_database(path, scale=1.0, seed=42):
+    """Create and fill a database at path; returns the row counts"""
+    import db
+    import migrations
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1)
+    counts = {
+        'donors': int(SEED_DONORS * scale),
+        'requests': int(SEED_REQUESTS * scale),
+        'users': max(1, int(SEED_USERS * scale)),
+    }
+
+    def name():
+        return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+    def group():
+        return rng.choices(BLOOD_GROUPS, GROUP_WEIGHTS)[0]
+
+    def contact():
+        return f'9{rng.randrange(10 ** 9):09d}'
+
+    def past(days):
+        return now - timedelta(days=rng.randrange(days), seconds=rng.randrange(86400))
+
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    with conn:
+        conn.executemany('INSERT INTO donors (name, age, blood_group, contact, city, last_donation_date) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         [(name(), rng.randint(18, 65), group(), contact(), rng.choice(CITIES),
+                           None if rng.random() < 0.3 else past(720).strftime('%Y-%m-%d'))
+                          for _ in range(counts['donors'])])
+        conn.executemany('INSERT INTO requests (patient_name, blood_group, units, hospital, city, contact, status, '
+                         'created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         [(name(), group(), rng.randint(1, 4), rng.choice(HOSPITALS), rng.choice(CITIES), contact(),
+                           rng.choice(('pending', 'pending', 'approved', 'fulfilled', 'rejected')),
+                           past(365).strftime('%Y-%m-%d %H:%M:%S'))
+                          for _ in range(counts['requests'])])
+
+        # One hash shared by every account: scrypt per user would dominate seeding
+        password = generate_password_hash('benchmark')
+        conn.executemany('INSERT INTO users (name, username, email, password, contact, blood_group) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         [(name(), f'user{i}', f'user{i}@example.com', password, contact(), group())
+                          for i in range(1, counts['users'] + 1)])
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users ORDER BY id')]
+        for user_id in user_ids:
+            conn.executemany('INSERT INTO user_donations (user_id, blood_group, donation_date, location) '
+                             'VALUES (?, ?, ?, ?)',
+                             [(user_id, group(), past(720).strftime('%Y-%m-%d'), rng.choice(CITIES))
+                              for _ in range(DONATIONS_PER_USER)])
+            conn.executemany('INSERT INTO user_requests (user_id, request_id, patient_name, blood_group, '
+                             'units_requested, hospital, city, contact) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             [(user_id, rng.randint(1, counts['requests']), name(), group(), rng.randint(1, 4),
+                               rng.choice(HOSPITALS), rng.choice(CITIES), contact())
+                              for _ in range(USER_REQUESTS_PER_USER)])
+            conn.executemany('INSERT INTO notifications (user_id, title, message, type, is_read, created_at) '
+                             'VALUES (?, ?, ?, ?, ?, ?)',
+                             [(user_id, 'Request update', 'Your blood request status has changed', 'info',
+                               int(rng.random() < 0.7), past(60).strftime('%Y-%m-%d %H:%M:%S'))
+                              for _ in range(NOTIFICATIONS_PER_USER)])
+    counts['notifications'] = counts['users'] * NOTIFICATIONS_PER_USER
+    conn.close()
+    return counts
+
+
+class Recorder:
+    """Collects (endpoint, seconds, ok) samples from every client thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+        self.recording = False
+
+    def add(self, endpoint, seconds, ok):
+        if self.recording:
+            with self._lock:
+                self.samples.append((endpoint, seconds, ok))
+
+
+class InProcessClient:
+    """Requests through Flask's test client, in the calling thread"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, method, path, body, headers):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        try:
+            data = response.get_data()
+            return response.status_code, response.headers.get('ETag'), data
+        finally:
+            response.close()
+
+
+class HttpClient:
+    """Requests over one keep-alive HTTP connection"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.connection = None
+
+    def send(self, method, path, body, headers):
+        headers = dict(headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request(method, path, payload, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                return response.status, response.getheader('ETag'), data
+            except (ConnectionError, http.client.HTTPException):
+                # The server closed an idle keep-alive connection; reconnect once
+                self.connection.close()
+                self.connection = None
+                if attempt == 2:
+                    raise
+
+
+class Session:
+    """One simulated client: its transport, ETag cache, rng and what it has seen"""
+
+    def __init__(self, transport, recorder, rng, counts):
+        self.transport = transport
+        self.recorder = recorder
+        self.rng = rng
+        self.counts = counts
+        self.etags = {}
+        self.latest_notification = {}
+
+    def call(self, endpoint, method, path, body=None):
+        headers = {}
+        if method == 'GET' and path in self.etags:
+            headers['If-None-Match'] = self.etags[path][0]
+        start = time.perf_counter()
+        try:
+            status, etag, data = self.transport.send(method, path, body, headers)
+        except Exception as e:
+            self.recorder.add(endpoint, time.perf_counter() - start, False)
+            print(f"{method} {path} failed: {e}")
+            return None
+        self.recorder.add(endpoint, time.perf_counter() - start, status < 400)
+        if status == 304:
+            return self.etags[path][1]
+        if status >= 400:
+            return None
+        if etag and method == 'GET':
+            self.etags[path] = (etag, data)
+        return data
+
+    def json(self, endpoint, method, path, body=None):
+        data = self.call(endpoint, method, path, body)
+        return json.loads(data) if data else None
+
+    def request_id(self):
+        return self.rng.randint(1, self.counts['requests'])
+
+    def user_id(self):
+        return self.rng.randint(1, self.counts['users'])
+
+
+def home(session):
+    session.call('GET /api/stats', 'GET', '/api/stats')
+
+
+def admin_dashboard(session):
+    session.call('GET /api/stats', 'GET', '/api/stats')
+    session.call('GET /api/requests?limit', 'GET', '/api/requests?limit=50')
+    session.call('GET /api/donors?limit', 'GET', '/api/donors?limit=50')
+
+
+def status_update(session):
+    status = session.rng.choice(('pending', 'approved', 'rejected', 'fulfilled'))
+    session.call('PUT /api/requests/<id>/status', 'PUT', f'/api/requests/{session.request_id()}/status',
+                 {'status': status})
+
+
+def notification_poll(session):
+    user_id = session.user_id()
+    session.call('GET /api/users/<id>/notifications/unread-count', 'GET',
+                 f'/api/users/{user_id}/notifications/unread-count')
+    since_id = session.latest_notification.get(user_id, 0)
+    page = session.json('GET /api/users/<id>/notifications?since_id', 'GET',
+                        f'/api/users/{user_id}/notifications?since_id={since_id}&limit=50')
+    if page:
+        session.latest_notification[user_id] = page['latest_id']
+
+
+def matching(session):
+    session.call('GET /api/requests/<id>/matches', 'GET', f'/api/requests/{session.request_id()}/matches?limit=10')
+    term = session.rng.choice(SEARCH_TERMS).replace(' ', '+')
+    session.call('GET /api/search', 'GET', f'/api/search?q={term}')
+
+
+def report_download(session):
+    session.call('GET /api/export/donors', 'GET', '/api/export/donors?format=csv')
+    session.call('GET /api/reports/donors?summary_only', 'GET', '/api/reports/donors?summary_only=1')
+
+
+# Journey weights: a visitor-heavy day, and the worst case of many logged-in
+# users polling while admins process requests
+MIXES = {
+    'realistic': ((home, 30), (notification_poll, 35), (admin_dashboard, 12), (status_update, 10),
+                  (matching, 10), (report_download, 3)),
+    'busy': ((notification_poll, 60), (status_update, 25), (admin_dashboard, 10), (matching, 5)),
+}
+
+
+def client_loop(session, journeys, weights, deadline):
+    while time.perf_counter() < deadline:
+        session.rng.choices(journeys, weights)[0](session)
+
+
+def run_load(make_transport, recorder, counts, mix, concurrency, duration, warmup, seed):
+    """Drive the mix from concurrency threads; returns the measured seconds"""
+    journeys, weights = zip(*MIXES[mix])
+    start = time.perf_counter()
+    deadline = start + warmup + duration
+    threads = []
+    for i in range(concurrency):
+        session = Session(make_transport(), recorder, random.Random(seed + i), counts)
+        thread = threading.Thread(target=client_loop, args=(session, journeys, weights, deadline), daemon=True)
+        thread.start()
+        threads.append(thread)
+    time.sleep(warmup)
+    recorder.recording = True
+    measured_from = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    recorder.recording = False
+    return time.perf_counter() - measured_from
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples, seconds):
+    """{'total': ..., 'endpoints': {name: ...}} with latencies in ms"""
+    by_endpoint = {}
+    for endpoint, latency, ok in samples:
+        by_endpoint.setdefault(endpoint, []).append((latency, ok))
+
+    def summary(rows):
+        latencies = sorted(latency * 1000 for latency, _ in rows)
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for _, ok in rows if not ok),
+            'throughput': round(len(rows) / seconds, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'max_ms': round(latencies[-1], 3),
+        }
+
+    return {
+        'total': summary([(latency, ok) for _, latency, ok in samples]) if samples else {},
+        'endpoints': {endpoint: summary(rows) for endpoint, rows in sorted(by_endpoint.items())},
+    }
+
+
+def config_mismatch(results, baseline):
+    """Why results cannot be compared with baseline, or None"""
+    for key in ('server', 'mix', 'scale', 'concurrency'):
+        if results['config'][key] != baseline['config'][key]:
+            return (f"baseline was recorded with {key}={baseline['config'][key]!r}, "
+                    f"this run used {results['config'][key]!r}")
+    return None
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Regression messages for results against baseline (empty when none)"""
+    problems = []
+    total, base_total = results['total'], baseline['total']
+    if total['errors']:
+        problems.append(f"{total['errors']} requests failed")
+    if total['throughput'] < base_total['throughput'] * (1 - tolerance):
+        problems.append(f"throughput {total['throughput']}/s, baseline {base_total['throughput']}/s")
+    for endpoint, base in baseline['endpoints'].items():
+        current = results['endpoints'].get(endpoint)
+        if current is None:
+            problems.append(f'{endpoint}: no requests in this run')
+            continue
+        limit = max(base['p95_ms'] * (1 + tolerance), base['p95_ms'] + MIN_REGRESSION_MS)
+        if current['p95_ms'] > limit:
+            problems.append(f"{endpoint}: p95 {current['p95_ms']} ms, baseline {base['p95_ms']} ms")
+    return problems
+
+
+def print_report(results):
+    print(f"\n{'endpoint':<50} {'req':>7} {'err':>4} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    rows = list(results['endpoints'].items()) + [('TOTAL', results['total'])]
+    for endpoint, stats in rows:
+        print(f"{endpoint:<50} {stats['requests']:>7} {stats['errors']:>4} {stats['throughput']:>8.1f} "
+              f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+    print('(latencies in ms)')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(port, workers, threads):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--chdir', BASE_DIR, '--bind', f'127.0.0.1:{port}',
+         '--worker-class', 'gthread', '--workers', str(workers), '--threads', str(threads),
+         '--log-level', 'warning'],
+        env=os.environ.copy(), stdout=subprocess.DEVNULL)
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/api/stats')
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'gunicorn did not answer within {SERVER_START_TIMEOUT}s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the API against a seeded database')
+    parser.add_argument('--server', choices=('inprocess', 'gunicorn'), default='inprocess')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='realistic')
+    parser.add_argument('--scale', type=float, default=1.0, help='seed data size relative to the defaults')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds run before measuring')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn threads per worker')
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--keep-db', action='store_true', help='leave the seeded database in place')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bloodbank-bench-')
+    db_path = os.path.join(workdir, 'bloodbank.db')
+    # Set before the app's modules are imported, here and in gunicorn workers
+    os.environ.update({
+        'BLOODBANK_DB_PATH': db_path,
+        'BLOODBANK_RETENTION_INTERVAL_HOURS': '0',
+        'BLOODBANK_SECRET_KEY_PATH': os.path.join(workdir, 'secret_key'),
+        'BLOODBANK_REPORTS_DIR': os.path.join(workdir, 'reports'),
+    })
+    sys.path.insert(0, BASE_DIR)
+    server = None
+    try:
+        started = time.perf_counter()
+        counts = seed_database(db_path, args.scale, args.seed)
+        print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s ({db_path})")
+
+        if args.server == 'gunicorn':
+            port = free_port()
+            server = start_gunicorn(port, args.workers, args.threads)
+            make_transport = lambda: HttpClient('127.0.0.1', port)
+        else:
+            import app
+            make_transport = lambda: InProcessClient(app.app)
+
+        print(f"Running '{args.mix}' mix: {args.concurrency} clients, {args.warmup:g}s warm-up, "
+              f"{args.duration:g}s measured ({args.server})")
+        recorder = Recorder()
+        seconds = run_load(make_transport, recorder, counts, args.mix, args.concurrency, args.duration,
+                           args.warmup, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if not args.keep_db:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'config': {'server': args.server, 'mix': args.mix, 'scale': args.scale, 'seed': args.seed,
+                   'concurrency': args.concurrency, 'duration': args.duration, 'workers': args.workers,
+                   'threads': args.threads},
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                        'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'seconds': round(seconds, 3),
+        **summarize(recorder.samples, seconds),
+    }
+    if not recorder.samples:
+        print('No requests completed')
+        return 1
+    print_report(results)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 1 if results['total']['errors'] else 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 1 if results['total']['errors'] else 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    mismatch = config_mismatch(results, baseline)
+    if mismatch:
+        print(f"Cannot compare with {args.baseline}: {mismatch}; record a new baseline with --save-baseline")
+        return 2
+    problems = compare(results, baseline, args.tolerance)
+    if problems:
+        print(f"\nREGRESSION against {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
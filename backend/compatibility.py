@@ -0,0 +1,46 @@
+"""ABO/Rh red cell compatibility and donation eligibility rules"""
+from datetime import date, timedelta
+
+BLOOD_GROUPS = ('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-')
+
+# Recipient group -> donor groups whose red cells it can receive.
+# O- is the universal red cell donor, AB+ the universal recipient.
+RED_CELL_DONORS = {
+    'O-': ('O-',),
+    'O+': ('O+', 'O-'),
+    'A-': ('A-', 'O-'),
+    'A+': ('A+', 'A-', 'O+', 'O-'),
+    'B-': ('B-', 'O-'),
+    'B+': ('B+', 'B-', 'O+', 'O-'),
+    'AB-': ('AB-', 'A-', 'B-', 'O-'),
+    'AB+': ('AB+', 'AB-', 'A+', 'A-', 'B+', 'B-', 'O+', 'O-'),
+}
+
+# Minimum gap between whole blood donations, and donor age limits
+DONATION_INTERVAL_DAYS = 90
+MIN_DONOR_AGE = 18
+MAX_DONOR_AGE = 65
+
+
+def normalize_group(blood_group):
+    """Return the canonical spelling of a blood group, or None if unknown"""
+    if not blood_group:
+        return None
+    group = blood_group.strip().upper().replace(' ', '')
+    return group if group in RED_CELL_DONORS else None
+
+
+def compatible_donor_groups(recipient_group):
+    """Donor groups that can give red cells to `recipient_group`"""
+    group = normalize_group(recipient_group)
+    return RED_CELL_DONORS.get(group, ())
+
+
+def eligibility_cutoff(today=None):
+    """Latest last_donation_date (ISO string) that is eligible to donate again"""
+    today = today or date.today()
+    return (today - timedelta(days=DONATION_INTERVAL_DAYS)).isoformat()
+
+
+# SQL fragment matching donors eligible by last donation date; bind the cutoff
+ELIGIBLE_SQL = "(last_donation_date IS NULL OR last_donation_date = '' OR last_donation_date <= ?)"
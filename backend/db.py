@@ -0,0 +1,348 @@
+"""Pooled SQLite connections shared by the Flask app"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import g, has_app_context
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get('BLOODBANK_DB_PATH', os.path.join(BASE_DIR, 'bloodbank.db'))
+
+# Pool sizing per worker process; gunicorn forks one pool per worker
+POOL_SIZE = int(os.environ.get('BLOODBANK_DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.environ.get('BLOODBANK_DB_POOL_TIMEOUT', '10'))
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = int(os.environ.get('BLOODBANK_DB_BUSY_TIMEOUT_MS', '5000'))
+
+# Max queued write jobs folded into a single COMMIT by the writer thread
+WRITE_BATCH_SIZE = int(os.environ.get('BLOODBANK_DB_WRITE_BATCH', '64'))
+
+# Applied once when a connection is opened. WAL lets readers run while the
+# writer commits; NORMAL sync is durable across app crashes in WAL mode.
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA wal_autocheckpoint = 1000',
+    'PRAGMA journal_size_limit = 67108864',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 134217728',
+)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within POOL_TIMEOUT"""
+
+
+def connect(path=None):
+    """Open a configured connection outside the pool"""
+    conn = sqlite3.connect(
+        path or DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class PooledConnection:
+    """Connection handed out by the pool; close() returns it to the pool"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self.failed = False
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return getattr(conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def close(self):
+        """Give the connection back to the pool (safe to call twice)"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn, broken=self.failed)
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of pre-configured connections for one process"""
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._pid = os.getpid()
+        self._stats = {
+            'checkouts': 0,
+            'reused': 0,
+            'created': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'timeouts': 0,
+            'recycled': 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _reset_after_fork(self):
+        # Connections must never be shared across a fork; start a fresh pool
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._pid = os.getpid()
+
+    def acquire(self):
+        """Check out a connection, opening or waiting for one as needed"""
+        if os.getpid() != self._pid:
+            self._reset_after_fork()
+        try:
+            conn = self._idle.get_nowait()
+            self._count('reused')
+        except queue.Empty:
+            conn = self._open_or_wait()
+        self._count('checkouts')
+        return PooledConnection(self, conn)
+
+    def _open_or_wait(self):
+        with self._lock:
+            can_open = self._open < self.size
+            if can_open:
+                self._open += 1
+        if can_open:
+            try:
+                conn = connect(self.path)
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+            self._count('created')
+            return conn
+
+        started = time.perf_counter()
+        self._count('waits')
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            self._count('timeouts')
+            raise PoolTimeout(f'No database connection free after {self.timeout}s')
+        finally:
+            self._count('wait_time_ms', (time.perf_counter() - started) * 1000)
+        self._count('reused')
+        return conn
+
+    def release(self, conn, broken=False):
+        """Return a connection, rolling back or recycling it if it is unhealthy"""
+        if not broken:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                broken = True
+        if broken:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats['recycled'] += 1
+
+    def close_all(self):
+        """Close every idle connection (used at shutdown and in scripts)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+            with self._lock:
+                self._open -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open'] = self._open
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 3)
+        checkouts = stats['checkouts']
+        stats['reuse_ratio'] = round(stats['reused'] / checkouts, 4) if checkouts else 0.0
+        return stats
+
+
+class DatabaseWriter:
+    """Single thread that owns the write connection and group-commits jobs.
+
+    A job is a callable taking the connection; it runs inside its own
+    SAVEPOINT so a failing job only rolls back itself, and up to
+    WRITE_BATCH_SIZE queued jobs share one COMMIT. Jobs must not call
+    commit() or rollback() themselves.
+    """
+
+    def __init__(self, path, batch_size=WRITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {'jobs': 0, 'failed': 0, 'batches': 0, 'max_batch': 0}
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                if self._pid != os.getpid():
+                    # Jobs queued before a fork belong to the parent process
+                    self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(conn, *args, **kwargs) and return a Future for its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Queue a write job and wait until it has been committed"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _loop(self):
+        conn = connect(self.path)
+        conn.isolation_level = None
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_batch(conn, jobs)
+
+    def _commit_batch(self, conn, jobs):
+        done = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, args, kwargs, future in jobs:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    result = fn(conn, *args, **kwargs)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_job')
+                    conn.execute('RELEASE write_job')
+                    future.set_exception(e)
+                    continue
+                conn.execute('RELEASE write_job')
+                done.append((future, result))
+            conn.execute('COMMIT')
+        except Exception as e:
+            try:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+            for future in [job[3] for job in jobs]:
+                if not future.done():
+                    future.set_exception(e)
+            for future, result in done:
+                if not future.done():
+                    future.set_exception(e)
+            done = []
+        with self._lock:
+            self._stats['jobs'] += len(jobs)
+            self._stats['failed'] += len(jobs) - len(done)
+            self._stats['batches'] += 1
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(jobs))
+        for future, result in done:
+            future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+
+_pool = None
+_writer = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _pool_lock:
+            if _writer is None:
+                _writer = DatabaseWriter(DB_PATH)
+    return _writer
+
+
+def run_write(fn, *args, **kwargs):
+    """Run fn(conn, ...) on the single writer thread and return its result"""
+    return get_writer().run(fn, *args, **kwargs)
+
+
+def get_db():
+    """Check out a pooled connection, released at app-context teardown at the latest"""
+    conn = get_pool().acquire()
+    if has_app_context():
+        g.setdefault('_db_checkouts', []).append(conn)
+    return conn
+
+
+def release_db(exc=None):
+    """Teardown hook: return any connection a handler did not close itself"""
+    for conn in g.pop('_db_checkouts', ()):
+        # An unexpected database error may leave the connection in a bad state
+        if isinstance(exc, sqlite3.Error) and not isinstance(exc, sqlite3.IntegrityError):
+            conn.failed = True
+        conn.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
@@ -0,0 +1,272 @@
+"""Bulk donor import from CSV or XLSX
+
+Rows are validated and de-duplicated in Python, then inserted with
+executemany() in IMPORT_BATCH_SIZE chunks, one writer job (and so one
+transaction) per chunk, instead of one request, connection and commit per
+donor. Duplicates are matched on normalised name + contact digits, both
+within the file and against donors already in the database; the latter
+is checked per chunk, looking up only that chunk's names, in the same
+writer job that inserts it.
+
+    python donor_import.py partner_donors.xlsx [--dry-run]
+"""
+import codecs
+import csv
+import io
+import json
+import os
+import re
+import sys
+from datetime import date, datetime
+
+from openpyxl import load_workbook
+
+import db
+from compatibility import MAX_DONOR_AGE, MIN_DONOR_AGE, normalize_group
+
+IMPORT_BATCH_SIZE = int(os.environ.get('BLOODBANK_IMPORT_BATCH', '5000'))
+
+# Per-row errors beyond this many are counted but not listed
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FORMATS = ('csv', 'xlsx')
+
+DONOR_FIELDS = ('name', 'age', 'blood_group', 'contact', 'city', 'last_donation_date')
+
+# Accepted spellings of column headers in partner spreadsheets
+HEADER_ALIASES = {
+    'full_name': 'name',
+    'donor_name': 'name',
+    'blood_type': 'blood_group',
+    'group': 'blood_group',
+    'phone': 'contact',
+    'mobile': 'contact',
+    'contact_number': 'contact',
+    'last_donation': 'last_donation_date',
+}
+
+
+class ImportFormatError(ValueError):
+    """Raised when the uploaded file cannot be read as a donor sheet"""
+
+
+def _normalize_header(header):
+    key = re.sub(r'[^a-z0-9]+', '_', str(header or '').strip().lower()).strip('_')
+    return HEADER_ALIASES.get(key, key)
+
+
+def _check_headers(headers):
+    if 'name' not in headers or 'blood_group' not in headers:
+        raise ImportFormatError('file must have at least name and blood_group columns')
+
+
+NOT_UTF8 = 'file must be UTF-8 CSV'
+
+
+def _check_utf8(stream, chunk_size=1 << 16):
+    """Decode a seekable stream once up front, so a bad byte late in the file
+    is rejected before any batch has been inserted"""
+    if not stream.seekable():
+        return
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    try:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise ImportFormatError(NOT_UTF8)
+    stream.seek(0)
+
+
+def read_csv_rows(stream):
+    """Yield one dict per CSV data row, keyed by normalised header"""
+    _check_utf8(stream)
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    try:
+        headers = [_normalize_header(h) for h in next(reader, [])]
+        _check_headers(headers)
+        for values in reader:
+            yield dict(zip(headers, values))
+    except UnicodeDecodeError:
+        raise ImportFormatError(NOT_UTF8)
+
+
+def read_xlsx_rows(stream):
+    """Yield one dict per row of the first worksheet, keyed by normalised header"""
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFormatError(f'could not read workbook: {e}')
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = [_normalize_header(h) for h in next(rows, ())]
+        _check_headers(headers)
+        for values in rows:
+            yield dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(stream, import_format):
+    if import_format == 'csv':
+        return read_csv_rows(stream)
+    if import_format == 'xlsx':
+        return read_xlsx_rows(stream)
+    raise ImportFormatError(f"format must be one of {', '.join(IMPORT_FORMATS)}")
+
+
+def format_from_filename(filename):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return 'xlsx' if extension in ('xlsx', 'xlsm') else extension
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheets hand phone numbers and ages back as floats
+        value = int(value)
+    return str(value).strip()
+
+
+def dedupe_key(name, contact):
+    """Case- and whitespace-insensitive name plus the digits of the contact"""
+    return (' '.join(name.split()).casefold(), re.sub(r'\D', '', contact or ''))
+
+
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+
+def validate_row(row, today=None):
+    """Return (values in DONOR_FIELDS order, None) or (None, error message)"""
+    name = ' '.join(_text(row.get('name')).split())
+    if not name:
+        return None, 'name is required'
+
+    blood_group = normalize_group(_text(row.get('blood_group')))
+    if not blood_group:
+        return None, f"invalid blood group {_text(row.get('blood_group'))!r}"
+
+    age = _text(row.get('age'))
+    if age:
+        try:
+            age = int(age)
+        except ValueError:
+            return None, f'invalid age {age!r}'
+        if not MIN_DONOR_AGE <= age <= MAX_DONOR_AGE:
+            return None, f'age must be between {MIN_DONOR_AGE} and {MAX_DONOR_AGE}'
+    else:
+        age = None
+
+    last_donation = row.get('last_donation_date')
+    if isinstance(last_donation, datetime):
+        last_donation = last_donation.date()
+    if isinstance(last_donation, date):
+        last_donation = last_donation.isoformat()
+    else:
+        last_donation = _text(last_donation)
+        if last_donation:
+            try:
+                if not ISO_DATE.match(last_donation):
+                    raise ValueError
+                date.fromisoformat(last_donation)
+            except ValueError:
+                return None, f'last_donation_date must be YYYY-MM-DD, got {last_donation!r}'
+    if last_donation and last_donation > (today or date.today().isoformat()):
+        return None, 'last_donation_date is in the future'
+
+    return (name, age, blood_group, _text(row.get('contact')) or None,
+            _text(row.get('city')) or None, last_donation or None), None
+
+
+def new_donor_rows(conn, batch):
+    """The rows of batch not matching a donor already in the database"""
+    names = json.dumps(sorted({values[0] for values in batch}))
+    # Uses idx_donors_name_nocase; the full key is then compared in Python
+    existing = {dedupe_key(row['name'], row['contact']) for row in conn.execute(
+        'SELECT name, contact FROM donors WHERE name COLLATE NOCASE IN (SELECT value FROM json_each(?))',
+        (names,))}
+    return [values for values in batch if dedupe_key(values[0], values[3]) not in existing]
+
+
+def _insert_batch(conn, batch):
+    rows = new_donor_rows(conn, batch)
+    conn.executemany(
+        f"INSERT INTO donors ({','.join(DONOR_FIELDS)}) VALUES ({','.join('?' * len(DONOR_FIELDS))})",
+        rows
+    )
+    return len(rows)
+
+
+def _check_batch(batch):
+    conn = db.get_db()
+    try:
+        return len(new_donor_rows(conn, batch))
+    finally:
+        conn.close()
+
+
+def import_donors(rows, dry_run=False, batch_size=IMPORT_BATCH_SIZE):
+    """Validate, de-duplicate and insert donor rows; return a summary report.
+
+    Row numbers in the report count the header as row 1, as a spreadsheet
+    does. With dry_run nothing is written.
+    """
+    def flush(batch):
+        # Rows matching a donor already in the database count as duplicates
+        added = _check_batch(batch) if dry_run else db.run_write(_insert_batch, batch)
+        if not dry_run:
+            report['inserted'] += added
+        report['valid'] -= len(batch) - added
+        report['duplicates'] += len(batch) - added
+
+    seen = set()
+    today = date.today().isoformat()
+    report = {'total_rows': 0, 'valid': 0, 'inserted': 0, 'duplicates': 0, 'error_count': 0, 'errors': []}
+    batch = []
+    for row_number, row in enumerate(rows, start=2):
+        if not any(_text(value) for value in row.values()):
+            continue
+        report['total_rows'] += 1
+        values, error = validate_row(row, today)
+        if error is None:
+            key = dedupe_key(values[0], values[3])
+            if key in seen:
+                report['duplicates'] += 1
+                continue
+            seen.add(key)
+            report['valid'] += 1
+            batch.append(values)
+        else:
+            report['error_count'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'row': row_number, 'error': error})
+
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+
+    if batch:
+        flush(batch)
+    report['dry_run'] = dry_run
+    return report
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) != 1:
+        print('usage: python donor_import.py <donors.csv|donors.xlsx> [--dry-run]')
+        sys.exit(2)
+    started = datetime.now()
+    with open(args[0], 'rb') as f:
+        try:
+            result = import_donors(read_rows(f, format_from_filename(args[0])), dry_run='--dry-run' in sys.argv)
+        except ImportFormatError as e:
+            print(f"Import failed: {e}")
+            sys.exit(1)
+    elapsed = (datetime.now() - started).total_seconds()
+    for error in result['errors']:
+        print(f"Row {error['row']}: {error['error']}")
+    print(f"Rows: {result['total_rows']}, inserted: {result['inserted']}, duplicates: {result['duplicates']}, "
+          f"errors: {result['error_count']}{' (dry run)' if result['dry_run'] else ''} in {elapsed:.2f}s")
@@ -0,0 +1,172 @@
+"""Bulk CSV / NDJSON export streamed straight from a SQLite cursor
+
+GET /api/export/<table> writes rows in primary key order, a fetchmany()
+batch at a time, optionally through an incremental gzip compressor, so
+exporting a whole table costs one index walk and a constant amount of
+worker memory. Exports are resumable: a client that got cut off asks again
+with after_id set to the last id it received.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from flask import Response, stream_with_context
+
+from streaming import STREAM_BATCH_SIZE
+
+# table -> (exportable columns, timestamp column used by ?since=)
+EXPORT_TABLES = {
+    'donors': (
+        ('id', 'name', 'age', 'blood_group', 'contact', 'city', 'last_donation_date'),
+        None),
+    'requests': (
+        ('id', 'patient_name', 'blood_group', 'units', 'hospital', 'city', 'contact', 'status', 'created_at'),
+        'created_at'),
+    'user_requests': (
+        ('id', 'user_id', 'request_id', 'patient_name', 'blood_group', 'units_requested', 'hospital',
+         'city', 'contact', 'urgency_level', 'status', 'created_at'),
+        'created_at'),
+    'notifications': (
+        ('id', 'user_id', 'request_id', 'title', 'message', 'type', 'is_read', 'created_at'),
+        'created_at'),
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+SINCE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+class InvalidExportRequest(ValueError):
+    """Raised for an unknown column, format or filter value"""
+
+
+def _parse_columns(table, value):
+    allowed = EXPORT_TABLES[table][0]
+    if not value:
+        return allowed
+    columns = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in columns if name not in allowed]
+    if unknown:
+        raise InvalidExportRequest(f"unknown column(s) for {table}: {', '.join(unknown)}")
+    # id always leads so an interrupted export can be resumed with after_id
+    return ('id',) + tuple(name for name in dict.fromkeys(columns) if name != 'id')
+
+
+def _parse_since(table, value):
+    if not value:
+        return None
+    if EXPORT_TABLES[table][1] is None:
+        raise InvalidExportRequest(f'{table} has no timestamp column; use after_id to resume')
+    for fmt in SINCE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            pass
+    raise InvalidExportRequest('since must look like YYYY-MM-DD or YYYY-MM-DD HH:MM:SS')
+
+
+def _parse_int(name, value, minimum):
+    if value in (None, ''):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise InvalidExportRequest(f'{name} must be an integer')
+    if number < minimum:
+        raise InvalidExportRequest(f'{name} must be at least {minimum}')
+    return number
+
+
+def export_query(table, args):
+    """Build (sql, params, columns, format) for an export of table from request args"""
+    export_format = args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise InvalidExportRequest(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    columns = _parse_columns(table, args.get('columns'))
+    since = _parse_since(table, args.get('since'))
+    after_id = _parse_int('after_id', args.get('after_id'), 0)
+    limit = _parse_int('limit', args.get('limit'), 1)
+
+    where, params = [], []
+    if after_id is not None:
+        where.append('id > ?')
+        params.append(after_id)
+    if since is not None:
+        where.append(f'{EXPORT_TABLES[table][1]} >= ?')
+        params.append(since)
+
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY id'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params, columns, export_format
+
+
+def iter_csv(cursor, columns, batch_size=STREAM_BATCH_SIZE):
+    """Yield a header line, then the cursor's rows as CSV a batch at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(cursor, batch_size=STREAM_BATCH_SIZE):
+    """Yield the cursor's rows as newline-delimited JSON objects"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield ''.join(json.dumps(dict(row), separators=(',', ':')) + '\n' for row in rows)
+
+
+def gzip_chunks(chunks, level=6):
+    """Incrementally gzip a stream of text chunks"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(conn, table, args, gzip=False):
+    """Stream table as CSV or NDJSON; closes conn once the body is done"""
+    sql, params, columns, export_format = export_query(table, args)
+    cursor = conn.execute(sql, params)
+
+    def generate():
+        try:
+            if export_format == 'csv':
+                chunks = iter_csv(cursor, columns)
+            else:
+                chunks = iter_ndjson(cursor)
+            if gzip:
+                yield from gzip_chunks(chunks)
+            else:
+                for chunk in chunks:
+                    yield chunk.encode()
+        finally:
+            conn.close()
+
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    headers = {'Content-Disposition': f'attachment; filename="{table}.{extension}"'}
+    if gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[export_format],
+                    headers=headers)
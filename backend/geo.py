@@ -0,0 +1,190 @@
+"""Offline geocoding and proximity search over the bundled gazetteer
+
+gazetteer.csv lists cities and towns with their coordinates and other
+spellings; nothing is ever geocoded over the network. It is loaded into
+places and place_names, and each place's point goes into the
+place_locations R-tree. Triggers link every donor to the place named by its
+city in donor_places, and a request's hospital is located by its city.
+
+Coordinates are city-level, so every donor in a city shares one point. The
+R-tree therefore indexes places rather than repeating that point per donor:
+"donors within N km" is a bounding-box query over a few hundred places,
+then index seeks on donor_places, nearest place first, until enough donors
+are found.
+
+    python geo.py --reload      re-read gazetteer.csv and re-link donors
+"""
+import csv
+import math
+import os
+import sys
+
+import db
+from compatibility import ELIGIBLE_SQL
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.csv')
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+DEFAULT_RADIUS_KM = 50
+MAX_RADIUS_KM = 1000
+
+DEFAULT_NEARBY_LIMIT = 50
+MAX_NEARBY_LIMIT = 500
+
+
+class InvalidLocation(ValueError):
+    """Raised for an unknown place or an unusable radius or coordinate"""
+
+
+def load_gazetteer(conn, path=GAZETTEER_PATH):
+    """Replace the gazetteer tables from path and re-link every donor; returns places loaded"""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+
+    conn.execute('DELETE FROM place_names')
+    conn.execute('DELETE FROM place_locations')
+    conn.execute('DELETE FROM places')
+    for place_id, row in enumerate(rows, start=1):
+        latitude, longitude = float(row['latitude']), float(row['longitude'])
+        conn.execute('INSERT INTO places (id, name, state, country, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?)',
+                     (place_id, row['name'], row['state'] or None, row['country'], latitude, longitude))
+        conn.execute('INSERT INTO place_locations (id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)',
+                     (place_id, latitude, latitude, longitude, longitude))
+        names = [row['name'], *filter(None, (row.get('aliases') or '').split('|'))]
+        # Keys are built with the same lower(trim()) the donor triggers use;
+        # the first place listed wins a name shared by two places
+        conn.executemany('INSERT OR IGNORE INTO place_names (name_key, place_id) VALUES (lower(trim(?)), ?)',
+                         [(name, place_id) for name in names])
+
+    conn.execute('DELETE FROM donor_places')
+    conn.execute('''
+        INSERT INTO donor_places (place_id, donor_id)
+        SELECT n.place_id, d.id
+        FROM donors d
+        JOIN place_names n ON n.name_key = lower(trim(d.city))
+    ''')
+    return len(rows)
+
+
+def geocode(conn, name):
+    """The gazetteer place for a city name (any listed spelling, any case), or None"""
+    if not name or not name.strip():
+        return None
+    return conn.execute('''
+        SELECT p.* FROM place_names n
+        JOIN places p ON p.id = n.place_id
+        WHERE n.name_key = lower(trim(?))
+    ''', (name,)).fetchone()
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_radius(value, default=DEFAULT_RADIUS_KM):
+    if value in (None, ''):
+        return default
+    try:
+        radius = float(value)
+    except ValueError:
+        raise InvalidLocation('radius_km must be a number')
+    if not 0 < radius <= MAX_RADIUS_KM:
+        raise InvalidLocation(f'radius_km must be greater than 0 and at most {MAX_RADIUS_KM}')
+    return radius
+
+
+def parse_point(lat, lon):
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise InvalidLocation('lat and lon must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise InvalidLocation('lat must be within [-90, 90] and lon within [-180, 180]')
+    return lat, lon
+
+
+def _bounding_boxes(lat, lon, radius_km):
+    """(south, north, west, east) boxes covering the circle, split at the antimeridian"""
+    dlat = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-9 else min(180.0, dlat / cos_lat)
+    south, north, west, east = lat - dlat, lat + dlat, lon - dlon, lon + dlon
+    if dlon >= 180:
+        return [(south, north, -180.0, 180.0)]
+    if west < -180:
+        return [(south, north, west + 360, 180.0), (south, north, -180.0, east)]
+    if east > 180:
+        return [(south, north, west, 180.0), (south, north, -180.0, east - 360)]
+    return [(south, north, west, east)]
+
+
+def places_within(conn, lat, lon, radius_km):
+    """[(distance km, place row)] within radius_km, nearest first"""
+    places = []
+    for south, north, west, east in _bounding_boxes(lat, lon, radius_km):
+        for row in conn.execute('''
+            SELECT p.* FROM place_locations l
+            JOIN places p ON p.id = l.id
+            WHERE l.max_lat >= ? AND l.min_lat <= ? AND l.max_lon >= ? AND l.min_lon <= ?
+        ''', (south, north, west, east)):
+            distance = haversine_km(lat, lon, row['latitude'], row['longitude'])
+            if distance <= radius_km:
+                places.append((distance, row))
+    places.sort(key=lambda item: (item[0], item[1]['id']))
+    return places
+
+
+def _donor_filter(blood_groups, eligible_cutoff):
+    where, params = [], []
+    if blood_groups:
+        where.append(f"blood_group IN ({', '.join('?' * len(blood_groups))})")
+        params.extend(blood_groups)
+    if eligible_cutoff:
+        where.append(ELIGIBLE_SQL)
+        params.append(eligible_cutoff)
+    return ''.join(f' AND {condition}' for condition in where), params
+
+
+def nearby_donors(conn, lat, lon, radius_km=DEFAULT_RADIUS_KM, limit=DEFAULT_NEARBY_LIMIT,
+                  blood_groups=None, eligible_cutoff=None):
+    """Donors within radius_km of (lat, lon), nearest first, with distance_km and place.
+
+    blood_groups restricts the donor groups; eligible_cutoff (from
+    compatibility.eligibility_cutoff) keeps only donors able to donate now.
+    """
+    condition, params = _donor_filter(blood_groups, eligible_cutoff)
+    donors = []
+    for distance, place in places_within(conn, lat, lon, radius_km):
+        rows = conn.execute(f'''
+            SELECT d.* FROM donor_places dp
+            JOIN donors d ON d.id = dp.donor_id
+            WHERE dp.place_id = ?{condition}
+            ORDER BY dp.donor_id
+            LIMIT ?
+        ''', (place['id'], *params, limit - len(donors))).fetchall()
+        for row in rows:
+            donor = dict(row)
+            donor['distance_km'] = round(distance, 1)
+            donor['place'] = place['name']
+            donors.append(donor)
+        if len(donors) >= limit:
+            break
+    return donors
+
+
+def place_json(place):
+    return {'id': place['id'], 'name': place['name'], 'state': place['state'], 'country': place['country'],
+            'latitude': place['latitude'], 'longitude': place['longitude']}
+
+
+if __name__ == '__main__':
+    if '--reload' not in sys.argv:
+        print('usage: python geo.py --reload')
+        sys.exit(2)
+    print(f"Loaded {db.run_write(load_gazetteer)} places from {GAZETTEER_PATH}")
@@ -0,0 +1,157 @@
+"""Donor matching for blood requests
+
+Candidates for a request are ranked by, in order:
+
+1. donors in the request's city before donors elsewhere,
+2. the recipient's own group before other compatible groups, in
+   RED_CELL_DONORS order (so O- universal donors are offered last),
+3. donors who have never donated, then those whose last donation is oldest.
+
+Only donors eligible by donation interval and age are returned. Every
+(group, city) tier is read with an index range seek in ranking order --
+idx_donors_group_city for the request's city, idx_donors_group_last for
+everywhere else -- and stops as soon as enough candidates are found, so a
+match costs a few short seeks however many donors there are.
+"""
+from compatibility import (MAX_DONOR_AGE, MIN_DONOR_AGE, compatible_donor_groups,
+                           eligibility_cutoff, normalize_group)
+
+DEFAULT_MATCH_LIMIT = 20
+MAX_MATCH_LIMIT = 200
+
+# Most pending requests matched by one batch call
+MAX_BATCH_REQUESTS = 1000
+
+# Rows read per seek when some candidates may be excluded
+MATCH_CHUNK_SIZE = 100
+
+MATCH_COLUMNS = 'id, name, age, blood_group, contact, city, last_donation_date'
+
+AGE_SQL = '(age IS NULL OR age BETWEEN ? AND ?)'
+
+
+class InvalidMatchRequest(ValueError):
+    """Raised when a request cannot be matched (e.g. unknown blood group)"""
+
+
+def _never_donated(conn, where, params, count, exclude, after=None):
+    """Donors with no last donation date, in id order"""
+    last_id = after or 0
+    while True:
+        rows = conn.execute(f'''
+            SELECT {MATCH_COLUMNS} FROM donors
+            WHERE {where} AND last_donation_date IS NULL AND id > ?
+            ORDER BY id LIMIT ?
+        ''', (*params, last_id, count)).fetchall()
+        for row in rows:
+            if row['id'] not in exclude:
+                yield row['id'], row
+        if len(rows) < count:
+            return
+        last_id = rows[-1]['id']
+
+
+def _rested(conn, where, params, cutoff, count, exclude, after=None):
+    """Donors whose last donation is on or before cutoff, oldest first"""
+    while True:
+        keyset, keyset_params = ('AND (last_donation_date, id) > (?, ?)', after) if after else ('', ())
+        rows = conn.execute(f'''
+            SELECT {MATCH_COLUMNS} FROM donors
+            WHERE {where} AND last_donation_date <= ? {keyset}
+            ORDER BY last_donation_date, id LIMIT ?
+        ''', (*params, cutoff, *keyset_params, count)).fetchall()
+        for row in rows:
+            if row['id'] not in exclude:
+                yield (row['last_donation_date'], row['id']), row
+        if len(rows) < count:
+            return
+        after = (rows[-1]['last_donation_date'], rows[-1]['id'])
+
+
+def _tiers(recipient_group, city):
+    """(donor group, city condition, params, same_city) in ranking order"""
+    groups = compatible_donor_groups(recipient_group)
+    if city:
+        for group in groups:
+            yield group, 'blood_group = ? AND city = ? COLLATE NOCASE', (group, city), True
+        for group in groups:
+            yield group, "blood_group = ? AND (city IS NULL OR city <> ? COLLATE NOCASE)", (group, city), False
+    else:
+        for group in groups:
+            yield group, 'blood_group = ?', (group,), False
+
+
+def find_matches(conn, blood_group, city=None, limit=DEFAULT_MATCH_LIMIT, exclude=(), cutoff=None,
+                 resume=None):
+    """Return up to limit ranked, eligible donors for a recipient.
+
+    Donor ids in exclude are skipped (used to keep batch matches distinct).
+    resume, when given, maps each tier to the position of the last donor
+    taken from it; later calls start reading after that position, which is
+    only correct while exclude holds every donor taken so far.
+    Each match carries its rank and why it ranked there.
+    """
+    recipient = normalize_group(blood_group)
+    if not recipient:
+        raise InvalidMatchRequest(f'invalid blood group {blood_group!r}')
+    city = (city or '').strip()
+    cutoff = cutoff or eligibility_cutoff()
+    # Over-read a little when exclusions may drop rows from a seek
+    count = min(limit, MATCH_CHUNK_SIZE) if not exclude else MATCH_CHUNK_SIZE
+
+    resume = {} if resume is None else resume
+    sources = (('never', _never_donated, ()), ('rested', _rested, (cutoff,)))
+
+    matches = []
+    for group, where, params, same_city in _tiers(recipient, city):
+        where = f'{where} AND {AGE_SQL}'
+        params = (*params, MIN_DONOR_AGE, MAX_DONOR_AGE)
+        for name, source, source_args in sources:
+            key = (name, where, params)
+            for position, row in source(conn, where, params, *source_args, count, exclude, resume.get(key)):
+                resume[key] = position
+                match = dict(row)
+                match['rank'] = len(matches) + 1
+                match['same_city'] = same_city
+                match['exact_group'] = group == recipient
+                matches.append(match)
+                if len(matches) >= limit:
+                    return matches
+    return matches
+
+
+def match_request(conn, request_row, limit=DEFAULT_MATCH_LIMIT, exclude=(), cutoff=None, resume=None):
+    return find_matches(conn, request_row['blood_group'], request_row['city'], limit, exclude, cutoff, resume)
+
+
+def match_pending_requests(conn, limit=DEFAULT_MATCH_LIMIT, exclusive=False):
+    """Match every pending request, oldest first.
+
+    With exclusive, each donor is proposed for at most one request, so the
+    oldest requests get first pick. Returns (results, truncated).
+    """
+    requests = conn.execute('''
+        SELECT * FROM requests
+        WHERE status = 'pending'
+        ORDER BY created_at, id
+        LIMIT ?
+    ''', (MAX_BATCH_REQUESTS + 1,)).fetchall()
+    truncated = len(requests) > MAX_BATCH_REQUESTS
+    cutoff = eligibility_cutoff()
+    proposed = set()
+    # Donors taken so far are a prefix of every tier, so each tier is read once
+    resume = {} if exclusive else None
+
+    results = []
+    for request_row in requests[:MAX_BATCH_REQUESTS]:
+        result = {'request': dict(request_row)}
+        try:
+            matches = match_request(conn, request_row, limit, proposed if exclusive else (), cutoff, resume)
+        except InvalidMatchRequest as e:
+            result.update(matches=[], error=str(e))
+        else:
+            if exclusive:
+                proposed.update(match['id'] for match in matches)
+            result['matches'] = matches
+        results.append(result)
+    return results, truncated
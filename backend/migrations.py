@@ -0,0 +1,816 @@
+"""Versioned schema migrations for the blood bank database
+
+The applied version is kept in PRAGMA user_version. Each migration runs in
+its own transaction, so a worker that starts while another one is migrating
+simply waits and then skips what has already been applied.
+
+Usage:
+    python migrations.py            # show query plans, migrate, show them again
+    python migrations.py --explain  # only show query plans
+"""
+import sqlite3
+import sys
+
+import geo
+from db import DB_PATH, connect
+
+BASELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS donors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    age INTEGER,
+    blood_group TEXT NOT NULL,
+    contact TEXT,
+    city TEXT,
+    last_donation_date TEXT
+);
+
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_name TEXT NOT NULL,
+    blood_group TEXT NOT NULL,
+    units INTEGER,
+    hospital TEXT,
+    city TEXT,
+    contact TEXT,
+    status TEXT DEFAULT 'pending',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS admin (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    contact TEXT,
+    blood_group TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_donations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    donor_id INTEGER,
+    blood_group TEXT NOT NULL,
+    donation_date TEXT NOT NULL,
+    location TEXT,
+    units_donated INTEGER DEFAULT 1,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY (donor_id) REFERENCES donors (id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    request_id INTEGER,
+    patient_name TEXT NOT NULL,
+    blood_group TEXT NOT NULL,
+    units_requested INTEGER,
+    hospital TEXT,
+    city TEXT,
+    contact TEXT,
+    urgency_level TEXT DEFAULT 'normal',
+    status TEXT DEFAULT 'pending',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY (request_id) REFERENCES requests (id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    request_id INTEGER,
+    title TEXT NOT NULL,
+    message TEXT NOT NULL,
+    type TEXT DEFAULT 'info',
+    is_read INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY (request_id) REFERENCES user_requests (id) ON DELETE CASCADE
+);
+
+INSERT OR IGNORE INTO admin (username, password) VALUES ('admin', 'admin123');
+"""
+
+PRODUCTION_INDEXES = """
+-- Notification inbox, unread filter and unread badge count
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications (user_id, is_read, created_at);
+
+-- Status fan-out and user request history
+CREATE INDEX IF NOT EXISTS idx_user_requests_request ON user_requests (request_id);
+CREATE INDEX IF NOT EXISTS idx_user_requests_user_created ON user_requests (user_id, created_at);
+
+-- User donation history
+CREATE INDEX IF NOT EXISTS idx_user_donations_user_date ON user_donations (user_id, donation_date);
+
+-- Admin request list, newest first
+CREATE INDEX IF NOT EXISTS idx_requests_created ON requests (created_at);
+"""
+
+DONOR_SEARCH_INDEXES = """
+-- Donor search: blood group(s) first, then city, then eligibility date
+CREATE INDEX IF NOT EXISTS idx_donors_group_city ON donors (blood_group, city COLLATE NOCASE, last_donation_date);
+
+-- Donor search by city without a blood group filter
+CREATE INDEX IF NOT EXISTS idx_donors_city_group ON donors (city COLLATE NOCASE, blood_group);
+"""
+
+# Row counts kept current by triggers so /api/stats never scans a table.
+# Scopes: donors, donors.blood_group, requests, requests.status,
+# requests.blood_group and requests.blood_group_status ('A+|pending').
+STAT_COUNTERS = """
+CREATE TABLE IF NOT EXISTS stat_counters (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+
+DELETE FROM stat_counters WHERE scope LIKE 'donors%' OR scope LIKE 'requests%';
+INSERT INTO stat_counters (scope, key, value)
+    SELECT 'donors', 'total', COUNT(*) FROM donors;
+INSERT INTO stat_counters (scope, key, value)
+    SELECT 'donors.blood_group', COALESCE(blood_group, ''), COUNT(*) FROM donors GROUP BY 2;
+INSERT INTO stat_counters (scope, key, value)
+    SELECT 'requests', 'total', COUNT(*) FROM requests;
+INSERT INTO stat_counters (scope, key, value)
+    SELECT 'requests.status', COALESCE(status, ''), COUNT(*) FROM requests GROUP BY 2;
+INSERT INTO stat_counters (scope, key, value)
+    SELECT 'requests.blood_group', COALESCE(blood_group, ''), COUNT(*) FROM requests GROUP BY 2;
+INSERT INTO stat_counters (scope, key, value)
+    SELECT 'requests.blood_group_status', COALESCE(blood_group, '') || '|' || COALESCE(status, ''), COUNT(*)
+    FROM requests GROUP BY 2;
+
+CREATE TRIGGER IF NOT EXISTS donors_stats_insert AFTER INSERT ON donors
+BEGIN
+    INSERT OR IGNORE INTO stat_counters (scope, key, value) VALUES
+        ('donors', 'total', 0),
+        ('donors.blood_group', COALESCE(NEW.blood_group, ''), 0);
+    UPDATE stat_counters SET value = value + 1
+    WHERE (scope = 'donors' AND key = 'total')
+       OR (scope = 'donors.blood_group' AND key = COALESCE(NEW.blood_group, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_stats_delete AFTER DELETE ON donors
+BEGIN
+    UPDATE stat_counters SET value = value - 1
+    WHERE (scope = 'donors' AND key = 'total')
+       OR (scope = 'donors.blood_group' AND key = COALESCE(OLD.blood_group, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_stats_update AFTER UPDATE OF blood_group ON donors
+WHEN OLD.blood_group IS NOT NEW.blood_group
+BEGIN
+    INSERT OR IGNORE INTO stat_counters (scope, key, value) VALUES
+        ('donors.blood_group', COALESCE(NEW.blood_group, ''), 0);
+    UPDATE stat_counters SET value = value - 1
+    WHERE scope = 'donors.blood_group' AND key = COALESCE(OLD.blood_group, '');
+    UPDATE stat_counters SET value = value + 1
+    WHERE scope = 'donors.blood_group' AND key = COALESCE(NEW.blood_group, '');
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_stats_insert AFTER INSERT ON requests
+BEGIN
+    INSERT OR IGNORE INTO stat_counters (scope, key, value) VALUES
+        ('requests', 'total', 0),
+        ('requests.status', COALESCE(NEW.status, ''), 0),
+        ('requests.blood_group', COALESCE(NEW.blood_group, ''), 0),
+        ('requests.blood_group_status', COALESCE(NEW.blood_group, '') || '|' || COALESCE(NEW.status, ''), 0);
+    UPDATE stat_counters SET value = value + 1
+    WHERE (scope = 'requests' AND key = 'total')
+       OR (scope = 'requests.status' AND key = COALESCE(NEW.status, ''))
+       OR (scope = 'requests.blood_group' AND key = COALESCE(NEW.blood_group, ''))
+       OR (scope = 'requests.blood_group_status'
+           AND key = COALESCE(NEW.blood_group, '') || '|' || COALESCE(NEW.status, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_stats_delete AFTER DELETE ON requests
+BEGIN
+    UPDATE stat_counters SET value = value - 1
+    WHERE (scope = 'requests' AND key = 'total')
+       OR (scope = 'requests.status' AND key = COALESCE(OLD.status, ''))
+       OR (scope = 'requests.blood_group' AND key = COALESCE(OLD.blood_group, ''))
+       OR (scope = 'requests.blood_group_status'
+           AND key = COALESCE(OLD.blood_group, '') || '|' || COALESCE(OLD.status, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_stats_update AFTER UPDATE OF status, blood_group ON requests
+WHEN OLD.status IS NOT NEW.status OR OLD.blood_group IS NOT NEW.blood_group
+BEGIN
+    INSERT OR IGNORE INTO stat_counters (scope, key, value) VALUES
+        ('requests.status', COALESCE(NEW.status, ''), 0),
+        ('requests.blood_group', COALESCE(NEW.blood_group, ''), 0),
+        ('requests.blood_group_status', COALESCE(NEW.blood_group, '') || '|' || COALESCE(NEW.status, ''), 0);
+    UPDATE stat_counters SET value = value - 1
+    WHERE (scope = 'requests.status' AND key = COALESCE(OLD.status, ''))
+       OR (scope = 'requests.blood_group' AND key = COALESCE(OLD.blood_group, ''))
+       OR (scope = 'requests.blood_group_status'
+           AND key = COALESCE(OLD.blood_group, '') || '|' || COALESCE(OLD.status, ''));
+    UPDATE stat_counters SET value = value + 1
+    WHERE (scope = 'requests.status' AND key = COALESCE(NEW.status, ''))
+       OR (scope = 'requests.blood_group' AND key = COALESCE(NEW.blood_group, ''))
+       OR (scope = 'requests.blood_group_status'
+           AND key = COALESCE(NEW.blood_group, '') || '|' || COALESCE(NEW.status, ''));
+END;
+"""
+
+# Per-table change counters behind the ETags in caching.py. The _epoch row
+# is random per database so a restored copy never reuses old validators.
+TABLE_VERSIONS = """
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO table_versions (name, version) VALUES
+    ('_epoch', abs(random())),
+    ('donors', 0),
+    ('requests', 0),
+    ('users', 0),
+    ('user_donations', 0),
+    ('user_requests', 0),
+    ('notifications', 0);
+
+CREATE TRIGGER IF NOT EXISTS donors_version_insert AFTER INSERT ON donors
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'donors';
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_version_update AFTER UPDATE ON donors
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'donors';
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_version_delete AFTER DELETE ON donors
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'donors';
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_version_insert AFTER INSERT ON requests
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'requests';
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_version_update AFTER UPDATE ON requests
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'requests';
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_version_delete AFTER DELETE ON requests
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'requests';
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_version_insert AFTER INSERT ON users
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'users';
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_version_update AFTER UPDATE ON users
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'users';
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_version_delete AFTER DELETE ON users
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'users';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_donations_version_insert AFTER INSERT ON user_donations
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'user_donations';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_donations_version_update AFTER UPDATE ON user_donations
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'user_donations';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_donations_version_delete AFTER DELETE ON user_donations
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'user_donations';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_requests_version_insert AFTER INSERT ON user_requests
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'user_requests';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_requests_version_update AFTER UPDATE ON user_requests
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'user_requests';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_requests_version_delete AFTER DELETE ON user_requests
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'user_requests';
+END;
+
+CREATE TRIGGER IF NOT EXISTS notifications_version_insert AFTER INSERT ON notifications
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'notifications';
+END;
+
+CREATE TRIGGER IF NOT EXISTS notifications_version_update AFTER UPDATE ON notifications
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'notifications';
+END;
+
+CREATE TRIGGER IF NOT EXISTS notifications_version_delete AFTER DELETE ON notifications
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'notifications';
+END;
+"""
+
+# Background report jobs (report_jobs.py); shared so any worker can answer
+# status polls for a job another worker is rendering.
+REPORT_JOBS = """
+CREATE TABLE IF NOT EXISTS report_jobs (
+    id TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress REAL NOT NULL DEFAULT 0,
+    file_name TEXT,
+    file_path TEXT,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_report_jobs_created ON report_jobs (created_at);
+"""
+
+REPORT_INDEXES = """
+-- Covering index for the report summary GROUP BY blood_group, status
+CREATE INDEX IF NOT EXISTS idx_requests_group_status ON requests (blood_group, status);
+"""
+
+EXPORT_INDEXES = """
+-- Lets the Excel donor sheet stream in name order without a temp B-tree sort
+CREATE INDEX IF NOT EXISTS idx_donors_name ON donors (name);
+"""
+
+# One UPSERT per inserted row instead of INSERT OR IGNORE plus an OR'd
+# UPDATE; bulk imports spend most of their time in these triggers
+UPSERT_COUNTER_TRIGGERS = """
+DROP TRIGGER IF EXISTS donors_stats_insert;
+CREATE TRIGGER donors_stats_insert AFTER INSERT ON donors
+BEGIN
+    INSERT INTO stat_counters (scope, key, value) VALUES
+        ('donors', 'total', 1),
+        ('donors.blood_group', COALESCE(NEW.blood_group, ''), 1)
+    ON CONFLICT (scope, key) DO UPDATE SET value = value + 1;
+END;
+
+DROP TRIGGER IF EXISTS requests_stats_insert;
+CREATE TRIGGER requests_stats_insert AFTER INSERT ON requests
+BEGIN
+    INSERT INTO stat_counters (scope, key, value) VALUES
+        ('requests', 'total', 1),
+        ('requests.status', COALESCE(NEW.status, ''), 1),
+        ('requests.blood_group', COALESCE(NEW.blood_group, ''), 1),
+        ('requests.blood_group_status', COALESCE(NEW.blood_group, '') || '|' || COALESCE(NEW.status, ''), 1)
+    ON CONFLICT (scope, key) DO UPDATE SET value = value + 1;
+END;
+"""
+
+# Status change events waiting for the outbox dispatcher (outbox.py). Rows
+# are deleted once delivered; failed_at marks events that gave up.
+NOTIFICATION_OUTBOX = """
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    request_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    failed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON notification_outbox (id) WHERE failed_at IS NULL;
+"""
+
+# Per-user unread notification count, kept exact by triggers in the same
+# transaction as every insert, read flag change and delete
+NOTIFICATION_COUNTERS = """
+CREATE TABLE IF NOT EXISTS notification_counters (
+    user_id INTEGER PRIMARY KEY,
+    unread INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO notification_counters (user_id, unread)
+    SELECT user_id, COUNT(*) FROM notifications WHERE is_read = 0 GROUP BY user_id;
+
+CREATE TRIGGER IF NOT EXISTS notifications_unread_insert AFTER INSERT ON notifications
+WHEN NEW.is_read = 0
+BEGIN
+    INSERT INTO notification_counters (user_id, unread) VALUES (NEW.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET unread = unread + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS notifications_unread_delete AFTER DELETE ON notifications
+WHEN OLD.is_read = 0
+BEGIN
+    UPDATE notification_counters SET unread = unread - 1 WHERE user_id = OLD.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS notifications_unread_update AFTER UPDATE OF is_read, user_id ON notifications
+WHEN (OLD.is_read = 0) IS NOT (NEW.is_read = 0) OR OLD.user_id IS NOT NEW.user_id
+BEGIN
+    UPDATE notification_counters SET unread = unread - 1
+    WHERE user_id = OLD.user_id AND OLD.is_read = 0;
+    INSERT INTO notification_counters (user_id, unread)
+    SELECT NEW.user_id, 1 WHERE NEW.is_read = 0
+    ON CONFLICT (user_id) DO UPDATE SET unread = unread + 1;
+END;
+"""
+
+# Notification retention (retention.py): expired rows move to the archive,
+# and maintenance_runs lets one worker claim each periodic run
+NOTIFICATION_RETENTION = """
+CREATE TABLE IF NOT EXISTS notifications_archive (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    request_id INTEGER,
+    title TEXT NOT NULL,
+    message TEXT NOT NULL,
+    type TEXT,
+    is_read INTEGER,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_notifications_archive_user ON notifications_archive (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_notifications_read_created ON notifications (is_read, created_at);
+
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+    name TEXT PRIMARY KEY,
+    last_run_at TIMESTAMP
+);
+"""
+
+# Delta sync and history pages walk a user's notifications by id
+NOTIFICATION_SYNC_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications (user_id, id);
+"""
+
+# Donor matching (matching.py) reads each compatible group in rest order
+# outside the request's city; idx_donors_group_city covers the city itself
+MATCHING_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_donors_group_last ON donors (blood_group, last_donation_date);
+"""
+
+# Offline gazetteer (geo.py): places with an R-tree over their coordinates,
+# and each donor linked to the place named by its city
+GEO_SCHEMA = """
+CREATE TABLE IF NOT EXISTS places (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    state TEXT,
+    country TEXT,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS place_names (
+    name_key TEXT PRIMARY KEY,
+    place_id INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS place_locations USING rtree (id, min_lat, max_lat, min_lon, max_lon);
+
+CREATE TABLE IF NOT EXISTS donor_places (
+    place_id INTEGER NOT NULL,
+    donor_id INTEGER NOT NULL,
+    PRIMARY KEY (place_id, donor_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS donors_place_insert AFTER INSERT ON donors
+WHEN NEW.city IS NOT NULL
+BEGIN
+    INSERT INTO donor_places (place_id, donor_id)
+    SELECT place_id, NEW.id FROM place_names WHERE name_key = lower(trim(NEW.city));
+END;
+
+-- The old link is found through the old city: load_gazetteer rebuilds
+-- donor_places whenever place_names changes, so they always agree
+CREATE TRIGGER IF NOT EXISTS donors_place_update AFTER UPDATE OF city ON donors
+BEGIN
+    DELETE FROM donor_places
+    WHERE donor_id = OLD.id
+      AND place_id = (SELECT place_id FROM place_names WHERE name_key = lower(trim(OLD.city)));
+    INSERT INTO donor_places (place_id, donor_id)
+    SELECT place_id, NEW.id FROM place_names WHERE name_key = lower(trim(NEW.city));
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_place_delete AFTER DELETE ON donors
+WHEN OLD.city IS NOT NULL
+BEGIN
+    DELETE FROM donor_places
+    WHERE donor_id = OLD.id
+      AND place_id = (SELECT place_id FROM place_names WHERE name_key = lower(trim(OLD.city)));
+END;
+"""
+
+
+def geo_schema(conn):
+    for statement in split_statements(GEO_SCHEMA):
+        conn.execute(statement)
+    geo.load_gazetteer(conn)
+
+
+# Full-text search (search.py): external-content FTS5 indexes over the
+# text columns, kept in sync by triggers and weighted towards names
+SEARCH_INDEXES = """
+CREATE VIRTUAL TABLE IF NOT EXISTS donors_fts USING fts5 (
+    name, contact, city,
+    content = 'donors', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5 (
+    patient_name, hospital, contact, city,
+    content = 'requests', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS user_requests_fts USING fts5 (
+    patient_name, hospital, contact, city,
+    content = 'user_requests', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+
+INSERT INTO donors_fts (donors_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)');
+INSERT INTO requests_fts (requests_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 5.0, 1.0)');
+INSERT INTO user_requests_fts (user_requests_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 5.0, 1.0)');
+
+INSERT INTO donors_fts (donors_fts) VALUES ('rebuild');
+INSERT INTO requests_fts (requests_fts) VALUES ('rebuild');
+INSERT INTO user_requests_fts (user_requests_fts) VALUES ('rebuild');
+
+CREATE TRIGGER IF NOT EXISTS donors_fts_insert AFTER INSERT ON donors
+BEGIN
+    INSERT INTO donors_fts (rowid, name, contact, city) VALUES (NEW.id, NEW.name, NEW.contact, NEW.city);
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_fts_delete AFTER DELETE ON donors
+BEGIN
+    INSERT INTO donors_fts (donors_fts, rowid, name, contact, city)
+    VALUES ('delete', OLD.id, OLD.name, OLD.contact, OLD.city);
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_fts_update AFTER UPDATE OF name, contact, city ON donors
+BEGIN
+    INSERT INTO donors_fts (donors_fts, rowid, name, contact, city)
+    VALUES ('delete', OLD.id, OLD.name, OLD.contact, OLD.city);
+    INSERT INTO donors_fts (rowid, name, contact, city) VALUES (NEW.id, NEW.name, NEW.contact, NEW.city);
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_fts_insert AFTER INSERT ON requests
+BEGIN
+    INSERT INTO requests_fts (rowid, patient_name, hospital, contact, city)
+    VALUES (NEW.id, NEW.patient_name, NEW.hospital, NEW.contact, NEW.city);
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_fts_delete AFTER DELETE ON requests
+BEGIN
+    INSERT INTO requests_fts (requests_fts, rowid, patient_name, hospital, contact, city)
+    VALUES ('delete', OLD.id, OLD.patient_name, OLD.hospital, OLD.contact, OLD.city);
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_fts_update AFTER UPDATE OF patient_name, hospital, contact, city ON requests
+BEGIN
+    INSERT INTO requests_fts (requests_fts, rowid, patient_name, hospital, contact, city)
+    VALUES ('delete', OLD.id, OLD.patient_name, OLD.hospital, OLD.contact, OLD.city);
+    INSERT INTO requests_fts (rowid, patient_name, hospital, contact, city)
+    VALUES (NEW.id, NEW.patient_name, NEW.hospital, NEW.contact, NEW.city);
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_requests_fts_insert AFTER INSERT ON user_requests
+BEGIN
+    INSERT INTO user_requests_fts (rowid, patient_name, hospital, contact, city)
+    VALUES (NEW.id, NEW.patient_name, NEW.hospital, NEW.contact, NEW.city);
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_requests_fts_delete AFTER DELETE ON user_requests
+BEGIN
+    INSERT INTO user_requests_fts (user_requests_fts, rowid, patient_name, hospital, contact, city)
+    VALUES ('delete', OLD.id, OLD.patient_name, OLD.hospital, OLD.contact, OLD.city);
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_requests_fts_update
+AFTER UPDATE OF patient_name, hospital, contact, city ON user_requests
+BEGIN
+    INSERT INTO user_requests_fts (user_requests_fts, rowid, patient_name, hospital, contact, city)
+    VALUES ('delete', OLD.id, OLD.patient_name, OLD.hospital, OLD.contact, OLD.city);
+    INSERT INTO user_requests_fts (rowid, patient_name, hospital, contact, city)
+    VALUES (NEW.id, NEW.patient_name, NEW.hospital, NEW.contact, NEW.city);
+END;
+"""
+
+# Session token revocations (auth.py): one token by id, or every token of an
+# account issued before not_before. AUTOINCREMENT keeps ids increasing after
+# expired rows are deleted, since workers poll for rows past the last id seen.
+REVOKED_TOKENS = """
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    token_id TEXT,
+    role TEXT NOT NULL,
+    subject INTEGER NOT NULL,
+    not_before REAL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Bulk donor imports look up only the names in each batch to find donors
+# already on file; NOCASE matches the importer's case-insensitive key
+DONOR_IMPORT_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_donors_name_nocase ON donors (name COLLATE NOCASE);
+"""
+
+# Which worker process renders each report job, so a restarted worker can
+# tell jobs orphaned by a dead process from ones a sibling is still running
+REPORT_JOB_OWNERS = """
+ALTER TABLE report_jobs ADD COLUMN worker_pid INTEGER;
+"""
+
+# (version, description, SQL script or callable taking the connection)
+MIGRATIONS = [
+    (1, 'baseline schema', BASELINE_SCHEMA),
+    (2, 'production indexes', PRODUCTION_INDEXES),
+    (3, 'donor search indexes', DONOR_SEARCH_INDEXES),
+    (4, 'stat counters', STAT_COUNTERS),
+    (5, 'table change versions', TABLE_VERSIONS),
+    (6, 'report jobs', REPORT_JOBS),
+    (7, 'report summary index', REPORT_INDEXES),
+    (8, 'report export index', EXPORT_INDEXES),
+    (9, 'upsert counter triggers', UPSERT_COUNTER_TRIGGERS),
+    (10, 'notification outbox', NOTIFICATION_OUTBOX),
+    (11, 'unread notification counters', NOTIFICATION_COUNTERS),
+    (12, 'notification retention', NOTIFICATION_RETENTION),
+    (13, 'notification sync index', NOTIFICATION_SYNC_INDEXES),
+    (14, 'donor matching index', MATCHING_INDEXES),
+    (15, 'gazetteer and donor locations', geo_schema),
+    (16, 'full-text search indexes', SEARCH_INDEXES),
+    (17, 'revoked session tokens', REVOKED_TOKENS),
+    (18, 'donor import duplicate index', DONOR_IMPORT_INDEXES),
+    (19, 'report job owners', REPORT_JOB_OWNERS),
+]
+
+# Hot queries from app.py whose plans should use the indexes above
+EXPLAIN_QUERIES = {
+    'unread notifications': (
+        'SELECT * FROM notifications WHERE user_id = ? AND is_read = 0 ORDER BY created_at DESC', (1,)),
+    'unread count': (
+        'SELECT COUNT(*) FROM notifications WHERE user_id = ? AND is_read = 0', (1,)),
+    'user notifications': (
+        'SELECT * FROM notifications WHERE user_id = ? ORDER BY created_at DESC', (1,)),
+    'notification delta': (
+        'SELECT * FROM notifications WHERE user_id = ? AND id > ? ORDER BY id LIMIT 501', (1, 0)),
+    'notification history page': (
+        'SELECT * FROM notifications WHERE user_id = ? AND (id) < (?) ORDER BY id DESC LIMIT 51', (1, 1000)),
+    'status fan-out': (
+        'SELECT id, user_id, patient_name, blood_group FROM user_requests WHERE request_id = ?', (1,)),
+    'user requests': (
+        'SELECT * FROM user_requests WHERE user_id = ? ORDER BY created_at DESC', (1,)),
+    'user donations': (
+        'SELECT * FROM user_donations WHERE user_id = ? ORDER BY donation_date DESC', (1,)),
+    'request list': (
+        'SELECT * FROM requests ORDER BY created_at DESC', ()),
+    'donor search': (
+        "SELECT * FROM donors WHERE blood_group IN (?, ?) AND city = ? COLLATE NOCASE "
+        "AND (last_donation_date IS NULL OR last_donation_date = '' OR last_donation_date <= ?) LIMIT 50",
+        ('O+', 'O-', 'surat', '2025-01-01')),
+    'match same city': (
+        "SELECT * FROM donors WHERE blood_group = ? AND city = ? COLLATE NOCASE AND (age IS NULL OR age BETWEEN 18 AND 65) "
+        "AND last_donation_date <= ? ORDER BY last_donation_date, id LIMIT 20",
+        ('O-', 'surat', '2025-01-01')),
+    'match other cities': (
+        "SELECT * FROM donors WHERE blood_group = ? AND (city IS NULL OR city <> ? COLLATE NOCASE) "
+        "AND (age IS NULL OR age BETWEEN 18 AND 65) AND last_donation_date <= ? ORDER BY last_donation_date, id LIMIT 20",
+        ('O-', 'surat', '2025-01-01')),
+    'match never donated': (
+        "SELECT * FROM donors WHERE blood_group = ? AND city = ? COLLATE NOCASE AND last_donation_date IS NULL "
+        "AND id > ? ORDER BY id LIMIT 20",
+        ('O-', 'surat', 0)),
+    'nearby places': (
+        'SELECT p.* FROM place_locations l JOIN places p ON p.id = l.id '
+        'WHERE l.max_lat >= ? AND l.min_lat <= ? AND l.max_lon >= ? AND l.min_lon <= ?', (21.0, 21.4, 72.6, 73.0)),
+    'donors at place': (
+        'SELECT d.* FROM donor_places dp JOIN donors d ON d.id = dp.donor_id '
+        'WHERE dp.place_id = ? ORDER BY dp.donor_id LIMIT 50', (1,)),
+    'report summary': (
+        'SELECT blood_group, status, COUNT(*) FROM requests GROUP BY blood_group, status', ()),
+    'report donor summary': (
+        "SELECT blood_group, COUNT(*), COUNT(NULLIF(last_donation_date, '')) FROM donors GROUP BY blood_group", ()),
+    'excel donor sheet': (
+        'SELECT * FROM donors ORDER BY name', ()),
+    'donor import duplicates': (
+        'SELECT name, contact FROM donors WHERE name COLLATE NOCASE IN (SELECT value FROM json_each(?))',
+        ('["asha patel"]',)),
+    'expired notifications': (
+        'SELECT id FROM notifications WHERE is_read = ? AND created_at < ? ORDER BY created_at LIMIT 500',
+        (1, '2025-01-01 00:00:00')),
+}
+
+
+def split_statements(script):
+    """Split an SQL script into complete statements (trigger bodies stay whole)"""
+    statements = []
+    pending = ''
+    for chunk in script.split(';'):
+        pending += chunk + ';'
+        if sqlite3.complete_statement(pending):
+            if pending.strip(' \n;'):
+                statements.append(pending.strip())
+            pending = ''
+    return statements
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn=None, verbose=False):
+    """Apply every pending migration and return the resulting schema version"""
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(DB_PATH)
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, description, step in MIGRATIONS:
+            if current_version(conn) >= version:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another worker may have applied it while we waited for the lock
+                if current_version(conn) >= version:
+                    conn.execute('COMMIT')
+                    continue
+                if callable(step):
+                    step(conn)
+                else:
+                    for statement in split_statements(step):
+                        conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            if verbose:
+                print(f"Applied migration {version}: {description}")
+        return current_version(conn)
+    finally:
+        conn.isolation_level = isolation_level
+        if own_conn:
+            conn.close()
+
+
+def explain(conn):
+    """Return {query name: [plan lines]} for EXPLAIN_QUERIES"""
+    plans = {}
+    for name, (sql, params) in EXPLAIN_QUERIES.items():
+        try:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+            plans[name] = [row['detail'] for row in rows]
+        except sqlite3.OperationalError as e:
+            plans[name] = [f'error: {e}']
+    return plans
+
+
+def print_plans(conn, heading):
+    print(heading)
+    print('-' * 60)
+    for name, details in explain(conn).items():
+        print(f"  {name}:")
+        for detail in details:
+            print(f"    {detail}")
+    print()
+
+
+if __name__ == '__main__':
+    conn = connect(DB_PATH)
+    try:
+        print(f"Database: {DB_PATH} (schema version {current_version(conn)})")
+        if '--explain' in sys.argv:
+            print_plans(conn, 'QUERY PLANS')
+        else:
+            print_plans(conn, 'QUERY PLANS BEFORE MIGRATION')
+            version = migrate(conn, verbose=True)
+            print(f"Schema is at version {version}\n")
+            print_plans(conn, 'QUERY PLANS AFTER MIGRATION')
+    finally:
+        conn.close()
@@ -0,0 +1,254 @@
+"""In-process pub/sub feeding the notification SSE streams
+
+Each worker process runs one watcher thread, which plays the role of the
+broker. Any worker may have created a notification (the outbox dispatcher
+runs in all of them), so the watcher reads from the database rather than
+relying on in-memory hand-off. It sleeps while nobody is subscribed. Once
+there are subscribers, it checks the notifications row of table_versions
+every BUS_POLL_SECONDS; that check is a primary key lookup. Only when the
+version moves does it read the new rows and the unread counters, and only
+for users who are subscribed in this process. The outbox dispatcher wakes
+the watcher right after it commits, so subscribers in the same process
+don't wait for the next poll.
+
+Under the gthread worker every open stream holds one of the worker's
+threads for as long as the client stays connected. MAX_STREAMS caps open
+streams per process, so streams can never take every thread away from
+ordinary requests (keep it well below gunicorn's --threads). Past the cap
+the endpoint answers 503 and the frontend polls the unread count instead,
+retrying the stream later.
+"""
+import json
+import os
+import queue
+import threading
+
+import db
+from caching import table_versions
+from stats import unread_count, unread_counts
+
+BUS_POLL_SECONDS = float(os.environ.get('BLOODBANK_BUS_POLL_SECONDS', '0.25'))
+
+# Comment lines sent on quiet streams so proxies keep them open and dead
+# clients are noticed
+KEEPALIVE_SECONDS = 15
+
+# Client reconnect delay advertised to EventSource
+RECONNECT_MS = 2000
+
+# Most missed notifications replayed to a reconnecting client
+REPLAY_LIMIT = 100
+
+# Events buffered per subscriber before a slow client is dropped
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Open streams per worker process; each one holds a worker thread
+MAX_STREAMS = int(os.environ.get('BLOODBANK_MAX_SSE_STREAMS', '8'))
+
+# Suggested wait for a client turned away at the cap
+STREAM_RETRY_AFTER_SECONDS = 60
+
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+
+def acquire_stream_slot():
+    """Reserve one of MAX_STREAMS; False when all are taken"""
+    return _stream_slots.acquire(blocking=False)
+
+
+def release_stream_slot():
+    _stream_slots.release()
+
+
+class NotificationBus:
+    """Fans new notifications and unread counts out to per-user subscriber queues"""
+
+    def __init__(self, poll_seconds=BUS_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._version = None
+        self._last_id = None
+        self._unread = {}
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name='notify-bus', daemon=True)
+                self._thread.start()
+
+    def subscribe(self, user_id):
+        """Register a queue that receives (event, data) tuples for user_id.
+
+        Returns (queue, baseline id): notifications with a higher id will
+        be published to the queue.
+        """
+        self._ensure_started()
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if self._last_id is None:
+                conn = db.get_db()
+                try:
+                    self._last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM notifications').fetchone()[0]
+                finally:
+                    conn.close()
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+            baseline = self._last_id
+        self._wake.set()
+        return subscriber, baseline
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+                    self._unread.pop(user_id, None)
+
+    def publish(self, user_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                # The stream sees the None and ends; EventSource reconnects
+                self.unsubscribe(user_id, subscriber)
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait(None)
+
+    def wake(self):
+        """Check for new notifications now rather than at the next poll"""
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                idle = not self._subscribers
+                if idle:
+                    # The next subscriber sets a fresh baseline
+                    self._version = None
+                    self._last_id = None
+            if idle:
+                # Nothing to deliver: sleep until someone subscribes
+                self._wake.wait()
+            else:
+                self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Notification bus poll failed: {str(e)}")
+
+    def poll(self):
+        with self._lock:
+            user_ids = list(self._subscribers)
+        if not user_ids:
+            return
+
+        conn = db.get_db()
+        try:
+            version = table_versions(conn, ('notifications',))
+            if version == self._version:
+                return
+            # Rows up to max_id now; anything committed later is picked up next round
+            max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM notifications').fetchone()[0]
+            placeholders = ', '.join('?' * len(user_ids))
+            rows = conn.execute(f'''
+                SELECT * FROM notifications
+                WHERE id > ? AND id <= ? AND user_id IN ({placeholders})
+                ORDER BY id
+            ''', (self._last_id, max_id, *user_ids)).fetchall()
+            counts = unread_counts(conn, user_ids)
+        finally:
+            conn.close()
+
+        self._version = version
+        self._last_id = max_id
+        for row in rows:
+            self.publish(row['user_id'], 'notification', dict(row))
+        for user_id in user_ids:
+            count = counts.get(user_id, 0)
+            if self._unread.get(user_id) != count:
+                self._unread[user_id] = count
+                self.publish(user_id, 'unread', {'unread_count': count})
+
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Events message"""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_notifications(user_id, last_event_id=None):
+    """Generator of SSE messages for user_id until the client disconnects.
+
+    A reconnecting client passes the id of the last notification it saw and
+    first gets up to REPLAY_LIMIT notifications it missed.
+    """
+    bus = get_bus()
+    subscriber, baseline = bus.subscribe(user_id)
+    try:
+        # Read after subscribing, so nothing falls between replay and live events
+        conn = db.get_db()
+        try:
+            replay = []
+            if last_event_id is not None:
+                replay = conn.execute('''
+                    SELECT * FROM notifications
+                    WHERE user_id = ? AND id > ? AND id <= ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (user_id, last_event_id, baseline, REPLAY_LIMIT)).fetchall()
+            unread = unread_count(conn, user_id)
+        finally:
+            conn.close()
+
+        yield f'retry: {RECONNECT_MS}\n\n'
+        for row in replay:
+            yield sse_event('notification', dict(row), row['id'])
+        yield sse_event('unread', {'unread_count': unread})
+        while True:
+            try:
+                message = subscriber.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if message is None:
+                return
+            event, data = message
+            yield sse_event(event, data, data.get('id') if event == 'notification' else None)
+    finally:
+        bus.unsubscribe(user_id, subscriber)
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = NotificationBus()
+    return _bus
+
+
+def wake():
+    """Tell this process's bus that notifications may have changed"""
+    if _bus is not None:
+        _bus.wake()
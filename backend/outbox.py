@@ -0,0 +1,216 @@
+"""Transactional outbox for request status notifications
+
+A status change writes one notification_outbox row per request in the same
+transaction as the change itself (see request_status.py), so an admin's
+update costs the same however many users are linked to the request.
+
+A dispatcher thread per worker process drains the outbox in batches. Each
+batch is a single writer job that updates the linked user_requests, inserts
+their notifications and deletes the delivered events, so every event is
+applied exactly once even when several workers poll. Extra channels
+(email/SMS stand-ins) are handed the new notifications after that commit.
+"""
+import os
+import threading
+
+import db
+import notify_bus
+from request_status import status_notification
+
+OUTBOX_BATCH_SIZE = int(os.environ.get('BLOODBANK_OUTBOX_BATCH', '200'))
+OUTBOX_POLL_SECONDS = float(os.environ.get('BLOODBANK_OUTBOX_POLL_SECONDS', '1.0'))
+
+# Events failing this many times are parked with failed_at set
+OUTBOX_MAX_ATTEMPTS = 5
+
+
+def send_email(notification):
+    """Stand-in for an email gateway"""
+    print(f"[email] user {notification['user_id']}: {notification['title']}")
+
+
+def send_sms(notification):
+    """Stand-in for an SMS gateway"""
+    print(f"[sms] user {notification['user_id']}: {notification['title']}")
+
+
+CHANNELS = {
+    'email': send_email,
+    'sms': send_sms,
+}
+
+# Channels to deliver to besides in-app notifications, e.g. "email,sms"
+ENABLED_CHANNELS = [name for name in os.environ.get('BLOODBANK_NOTIFY_CHANNELS', '').split(',') if name in CHANNELS]
+
+
+def _request_status_event(conn, event):
+    """Fan a request status change out to the users who made the request"""
+    user_requests = conn.execute('''
+        SELECT id, user_id, patient_name, blood_group
+        FROM user_requests
+        WHERE request_id = ?
+    ''', (event['request_id'],)).fetchall()
+    if not user_requests:
+        return []
+
+    conn.execute('UPDATE user_requests SET status = ? WHERE request_id = ?',
+                 (event['status'], event['request_id']))
+    notifications = []
+    for user_req in user_requests:
+        title, message, notif_type = status_notification(
+            event['status'], user_req['patient_name'], user_req['blood_group'])
+        notifications.append({'user_id': user_req['user_id'], 'request_id': user_req['id'],
+                              'title': title, 'message': message, 'type': notif_type})
+    conn.executemany('''
+        INSERT INTO notifications (user_id, request_id, title, message, type, is_read)
+        VALUES (:user_id, :request_id, :title, :message, :type, 0)
+    ''', notifications)
+    return notifications
+
+
+EVENT_HANDLERS = {
+    'request_status': _request_status_event,
+}
+
+
+def dispatch_batch(conn, limit=OUTBOX_BATCH_SIZE):
+    """Writer job: apply up to limit pending events in order.
+
+    Returns (events handled, notifications created). A failing event is
+    rolled back on its own and retried by a later batch. Until it is
+    delivered or parked, later events for the same request are held back,
+    so a retried older status can never overwrite a newer one.
+    """
+    events = conn.execute('''
+        SELECT id, event, request_id, status, attempts
+        FROM notification_outbox
+        WHERE failed_at IS NULL
+        ORDER BY id
+        LIMIT ?
+    ''', (limit,)).fetchall()
+
+    handled = 0
+    delivered = []
+    blocked = set()
+    for event in events:
+        if event['request_id'] in blocked:
+            continue
+        handled += 1
+        conn.execute('SAVEPOINT outbox_event')
+        try:
+            notifications = EVENT_HANDLERS[event['event']](conn, event)
+        except Exception as e:
+            conn.execute('ROLLBACK TO outbox_event')
+            conn.execute('RELEASE outbox_event')
+            attempts = event['attempts'] + 1
+            print(f"Outbox event {event['id']} failed (attempt {attempts}): {str(e)}")
+            conn.execute('''
+                UPDATE notification_outbox
+                SET attempts = ?, last_error = ?,
+                    failed_at = CASE WHEN ? >= ? THEN CURRENT_TIMESTAMP END
+                WHERE id = ?
+            ''', (attempts, str(e), attempts, OUTBOX_MAX_ATTEMPTS, event['id']))
+            if attempts < OUTBOX_MAX_ATTEMPTS:
+                blocked.add(event['request_id'])
+            continue
+        conn.execute('RELEASE outbox_event')
+        conn.execute('DELETE FROM notification_outbox WHERE id = ?', (event['id'],))
+        delivered.extend(notifications)
+    return handled, delivered
+
+
+def has_pending(conn):
+    row = conn.execute('SELECT 1 FROM notification_outbox WHERE failed_at IS NULL LIMIT 1').fetchone()
+    return row is not None
+
+
+class OutboxDispatcher:
+    """Background thread that drains the outbox when woken, or every poll interval"""
+
+    def __init__(self, poll_seconds=OUTBOX_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {'batches': 0, 'events': 0, 'notifications': 0, 'errors': 0}
+
+    def start(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name='outbox', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Ask for a dispatch now instead of at the next poll"""
+        self.start()
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                print(f"Outbox dispatch failed: {str(e)}")
+
+    def drain(self):
+        """Dispatch batches until the outbox is empty; returns events handled"""
+        conn = db.get_db()
+        try:
+            # Idle polls only cost an indexed read, not a write transaction
+            if not has_pending(conn):
+                return 0
+        finally:
+            conn.close()
+
+        handled = 0
+        while True:
+            count, delivered = db.run_write(dispatch_batch)
+            handled += count
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['events'] += count
+                self._stats['notifications'] += len(delivered)
+            if delivered:
+                notify_bus.wake()
+            for name in ENABLED_CHANNELS:
+                for notification in delivered:
+                    try:
+                        CHANNELS[name](notification)
+                    except Exception as e:
+                        print(f"{name} delivery to user {notification['user_id']} failed: {str(e)}")
+            if count < OUTBOX_BATCH_SIZE:
+                return handled
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = OutboxDispatcher()
+    return _dispatcher
+
+
+def start():
+    """Start this process's dispatcher (drains anything left by a previous run)"""
+    get_dispatcher().wake()
+
+
+def wake():
+    get_dispatcher().wake()
@@ -0,0 +1,81 @@
+"""Keyset (cursor) pagination for list endpoints
+
+Pages are selected with a row-value comparison on the sort key instead of
+OFFSET, so with a matching index every page costs the same as the first.
+Cursors are opaque to clients: the sort key of the last row, JSON encoded
+and base64url'd.
+"""
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidPageRequest(ValueError):
+    """Raised for a malformed cursor or page size"""
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise InvalidPageRequest('invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidPageRequest('invalid cursor')
+    return values
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE):
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidPageRequest('limit must be an integer')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def wants_page(args):
+    """True when the client asked for a page rather than the legacy full list"""
+    return 'limit' in args or 'after' in args
+
+
+def fetch_page(conn, table, order_by, after=None, limit=DEFAULT_PAGE_SIZE,
+               descending=False, columns='*', where=None, where_params=()):
+    """Return (rows, next_cursor) for one page of `table` ordered by `order_by`.
+
+    `order_by` must end in a unique column (normally id) so the ordering is
+    total and no row is skipped or repeated between pages. `where` is an
+    optional SQL filter with `where_params`; an index on its equality
+    columns followed by `order_by` keeps pages cheap.
+    """
+    key = ', '.join(order_by)
+    direction = 'DESC' if descending else 'ASC'
+    sql = f'SELECT {columns} FROM {table}'
+    conditions = [where] if where else []
+    params = list(where_params)
+    if after:
+        values = decode_cursor(after, len(order_by))
+        placeholders = ', '.join('?' * len(order_by))
+        conditions.append(f"({key}) {'<' if descending else '>'} ({placeholders})")
+        params.extend(values)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY ' + ', '.join(f'{col} {direction}' for col in order_by)
+    sql += ' LIMIT ?'
+    params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][col] for col in order_by)
+    return rows, next_cursor
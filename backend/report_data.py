@@ -0,0 +1,77 @@
+"""Summary metrics shared by the PDF and Excel reports
+
+Everything the report summaries need comes from two GROUP BY queries, one
+over requests and one over donors, each answered from a covering index.
+The renderers only look values up in the resulting ReportSummary.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from compatibility import BLOOD_GROUPS
+from stats import REQUEST_STATUSES
+
+
+@dataclass
+class ReportSummary:
+    total_requests: int = 0
+    total_donors: int = 0
+    donors_with_donations: int = 0
+    requests_by_status: Dict[str, int] = field(default_factory=dict)
+    requests_by_group: Dict[str, int] = field(default_factory=dict)
+    requests_by_group_status: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    donors_by_group: Dict[str, int] = field(default_factory=dict)
+
+    def status_count(self, status):
+        return self.requests_by_status.get(status, 0)
+
+    def group_status_count(self, blood_group, status):
+        return self.requests_by_group_status.get(blood_group, {}).get(status, 0)
+
+    @property
+    def most_requested_group(self) -> Optional[str]:
+        """Blood group with the most requests (ties go to BLOOD_GROUPS order)"""
+        counts = {group: count for group, count in self.requests_by_group.items() if count}
+        if not counts:
+            return None
+        order = {group: i for i, group in enumerate(BLOOD_GROUPS)}
+        return min(counts, key=lambda group: (-counts[group], order.get(group, len(order))))
+
+
+def percentage(count, total):
+    return f"{(count/total*100):.1f}%" if total > 0 else "0%"
+
+
+def load_report_summary(conn):
+    """Compute every report summary metric in one pass per table"""
+    summary = ReportSummary(
+        requests_by_status={status: 0 for status in REQUEST_STATUSES},
+        requests_by_group={group: 0 for group in BLOOD_GROUPS},
+        requests_by_group_status={group: {status: 0 for status in REQUEST_STATUSES} for group in BLOOD_GROUPS},
+        donors_by_group={group: 0 for group in BLOOD_GROUPS},
+    )
+
+    cur = conn.execute('''
+        SELECT blood_group, status, COUNT(*) AS count
+        FROM requests
+        GROUP BY blood_group, status
+    ''')
+    for row in cur:
+        group, status, count = row['blood_group'], row['status'], row['count']
+        summary.total_requests += count
+        summary.requests_by_status[status] = summary.requests_by_status.get(status, 0) + count
+        summary.requests_by_group[group] = summary.requests_by_group.get(group, 0) + count
+        by_status = summary.requests_by_group_status.setdefault(group, {})
+        by_status[status] = by_status.get(status, 0) + count
+
+    cur = conn.execute('''
+        SELECT blood_group, COUNT(*) AS count,
+               COUNT(NULLIF(last_donation_date, '')) AS donated
+        FROM donors
+        GROUP BY blood_group
+    ''')
+    for row in cur:
+        summary.total_donors += row['count']
+        summary.donors_with_donations += row['donated']
+        summary.donors_by_group[row['blood_group']] = row['count']
+
+    return summary
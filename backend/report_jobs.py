@@ -0,0 +1,175 @@
+"""Background report generation jobs
+
+POST /api/reports/jobs queues a job row and hands rendering to a small
+thread pool in the worker process, so no request waits on reportlab or
+xlsxwriter. Job state lives in the report_jobs table, which lets any
+gunicorn worker answer status polls; finished files are kept under
+REPORTS_DIR and served by the download endpoint.
+
+Each job row records the pid of the worker rendering it. When a worker
+starts, jobs still queued or running under a process that no longer
+exists (or under this pid, left by an earlier run) are marked failed and
+their partial files removed, so status polls do not wait on them forever.
+"""
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import db
+from reports import generate_donor_report, generate_excel_report
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORTS_DIR = os.environ.get('BLOODBANK_REPORTS_DIR', os.path.join(BASE_DIR, 'reports'))
+REPORT_WORKERS = int(os.environ.get('BLOODBANK_REPORT_WORKERS', '2'))
+
+# Finished artifacts older than this are removed when new jobs are queued
+REPORT_RETENTION_HOURS = int(os.environ.get('BLOODBANK_REPORT_RETENTION_HOURS', '24'))
+
+
+# format -> (file extension, mimetype, file name prefix, renderer writing to a path)
+REPORT_FORMATS = {
+    'pdf': ('pdf', 'application/pdf', 'LifeGrid_Blood_Request_Report', generate_donor_report),
+    'pdf_summary': ('pdf', 'application/pdf', 'LifeGrid_Blood_Request_Summary',
+                    partial(generate_donor_report, summary_only=True)),
+    'excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+              'LifeGrid_Complete_Report', generate_excel_report),
+}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix='report')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _update_job(job_id, **fields):
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+
+    def update(conn):
+        conn.execute(f'UPDATE report_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    db.run_write(update)
+
+
+def submit_job(report_format):
+    """Queue a report and return its job id"""
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(REPORT_FORMATS)}")
+    job_id = uuid.uuid4().hex
+
+    def insert(conn):
+        conn.execute('INSERT INTO report_jobs (id, format, worker_pid) VALUES (?, ?, ?)',
+                     (job_id, report_format, os.getpid()))
+
+    db.run_write(insert)
+    _get_executor().submit(_run_job, job_id, report_format)
+    cleanup_expired_jobs()
+    return job_id
+
+
+def _run_job(job_id, report_format):
+    extension, _, prefix, render = REPORT_FORMATS[report_format]
+    _update_job(job_id, status='running', started_at=_now())
+    last_progress = [0.0]
+
+    def progress(fraction):
+        # Keep progress writes coarse; each one is a queued write
+        if fraction - last_progress[0] >= 0.1 or fraction >= 1.0:
+            last_progress[0] = fraction
+            _update_job(job_id, progress=round(min(fraction, 0.99), 2))
+
+    try:
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        file_name = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        file_path = os.path.join(REPORTS_DIR, f'{job_id}.{extension}')
+        render(file_path, progress=progress)
+        _update_job(job_id, status='done', progress=1.0, file_name=file_name,
+                    file_path=file_path, finished_at=_now())
+    except Exception as e:
+        print(f"Report job {job_id} failed: {str(e)}")
+        _update_job(job_id, status='failed', error=str(e), finished_at=_now())
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+INTERRUPTED = 'interrupted: the worker rendering this report stopped'
+
+
+def _fail_orphaned_jobs(conn):
+    rows = conn.execute("SELECT id, format, worker_pid FROM report_jobs WHERE status IN ('queued', 'running')").fetchall()
+    # A job under this pid is left from an earlier process: this one has not queued any yet
+    orphaned = [row for row in rows
+                if not row['worker_pid'] or row['worker_pid'] == os.getpid() or not _process_alive(row['worker_pid'])]
+    for row in orphaned:
+        conn.execute("UPDATE report_jobs SET status = 'failed', error = ?, finished_at = ? "
+                     "WHERE id = ? AND status IN ('queued', 'running')", (INTERRUPTED, _now(), row['id']))
+    return orphaned
+
+
+def recover_stale_jobs():
+    """Fail jobs orphaned by a stopped worker and remove their partial files;
+    returns how many. Call once when a worker starts, before it queues jobs."""
+    orphaned = db.run_write(_fail_orphaned_jobs)
+    for row in orphaned:
+        extension = REPORT_FORMATS[row['format']][0] if row['format'] in REPORT_FORMATS else None
+        partial_path = os.path.join(REPORTS_DIR, f"{row['id']}.{extension}")
+        if extension and os.path.exists(partial_path):
+            os.remove(partial_path)
+    if orphaned:
+        print(f"Marked {len(orphaned)} interrupted report jobs as failed")
+    return len(orphaned)
+
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def get_job(job_id):
+    conn = db.get_db()
+    row = conn.execute('SELECT * FROM report_jobs WHERE id = ?', (job_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def job_mimetype(job):
+    return REPORT_FORMATS[job['format']][1]
+
+
+def cleanup_expired_jobs():
+    """Delete job rows and artifacts older than REPORT_RETENTION_HOURS"""
+    conn = db.get_db()
+    rows = conn.execute(
+        "SELECT id, file_path FROM report_jobs WHERE created_at < datetime('now', ?) AND status IN ('done', 'failed')",
+        (f'-{REPORT_RETENTION_HOURS} hours',)
+    ).fetchall()
+    conn.close()
+    if not rows:
+        return 0
+    for row in rows:
+        if row['file_path'] and os.path.exists(row['file_path']):
+            os.remove(row['file_path'])
+    ids = [row['id'] for row in rows]
+
+    def delete(conn):
+        conn.execute(f"DELETE FROM report_jobs WHERE id IN ({', '.join('?' * len(ids))})", ids)
+
+    db.run_write(delete)
+    return len(ids)
@@ -0,0 +1,109 @@
+"""Request status changes and the notifications they fan out to users
+
+One writer job applies any number of (request id, status) changes: the
+batch is loaded into a temp table, requests are updated with one
+UPDATE ... FROM, and one notification_outbox event per request is queued in
+the same transaction. Updating the linked user_requests and notifying their
+users happens later, in outbox.py.
+"""
+from stats import REQUEST_STATUSES
+
+# Largest batch accepted by the batch status endpoint
+MAX_STATUS_BATCH = 5000
+
+STATUS_TITLES = {
+    'pending': 'Request Pending',
+    'approved': 'Request Approved',
+    'rejected': 'Request Rejected',
+    'fulfilled': 'Request Fulfilled'
+}
+
+STATUS_MESSAGES = {
+    'pending': 'Your blood request is currently pending review by our admin team.',
+    'approved': 'Great news! Your blood request has been approved. We will process it shortly.',
+    'rejected': 'Unfortunately, your blood request has been rejected. Please contact us for more details.',
+    'fulfilled': 'Your blood request has been successfully fulfilled. Thank you for using our service!'
+}
+
+NOTIFICATION_TYPES = {
+    'pending': 'info',
+    'approved': 'success',
+    'rejected': 'error',
+    'fulfilled': 'success'
+}
+
+
+def status_notification(status, patient_name, blood_group):
+    """(title, message, type) of the notification sent for a status change"""
+    title = STATUS_TITLES.get(status, 'Request Update')
+    message = f"{STATUS_MESSAGES.get(status, 'Your request status has been updated.')} (Patient: {patient_name}, Blood Group: {blood_group})"
+    return title, message, NOTIFICATION_TYPES.get(status, 'info')
+
+
+def apply_status_updates(conn, updates):
+    """Writer job: set each request's status and queue its notifications.
+
+    updates maps request id -> status (already validated). Returns the set
+    of request ids that exist. The work done does not depend on how many
+    users are linked to each request.
+    """
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS status_batch (request_id INTEGER PRIMARY KEY, status TEXT NOT NULL)')
+    conn.execute('DELETE FROM status_batch')
+    conn.executemany('INSERT INTO status_batch (request_id, status) VALUES (?, ?)', updates.items())
+
+    # Unknown ids are reported back rather than queued
+    conn.execute('DELETE FROM status_batch WHERE request_id NOT IN (SELECT id FROM requests)')
+    found = {row[0] for row in conn.execute('SELECT request_id FROM status_batch')}
+
+    conn.execute('''
+        UPDATE requests SET status = b.status
+        FROM status_batch b
+        WHERE requests.id = b.request_id
+    ''')
+
+    # Linked user_requests are updated and notified by the outbox dispatcher
+    conn.execute('''
+        INSERT INTO notification_outbox (event, request_id, status)
+        SELECT 'request_status', request_id, status FROM status_batch ORDER BY request_id
+    ''')
+
+    conn.execute('DELETE FROM status_batch')
+    return found
+
+
+def parse_status_batch(data):
+    """Validate a batch payload into (items, {id: status}, {item index: error result}).
+
+    Accepts {"updates": [{"id": 1, "status": "approved"}, ...]} or
+    {"ids": [1, 2, 3], "status": "approved"}. Raises ValueError when the
+    payload as a whole is unusable.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('body must be a JSON object with "updates" or "ids"')
+    if 'updates' in data:
+        items = data.get('updates')
+        if not isinstance(items, list):
+            raise ValueError('updates must be a list of {"id": ..., "status": ...} objects')
+    else:
+        ids = data.get('ids')
+        if not isinstance(ids, list):
+            raise ValueError('send either "updates" or "ids" with "status"')
+        items = [{'id': req_id, 'status': data.get('status')} for req_id in ids]
+    if not items:
+        raise ValueError('no updates given')
+    if len(items) > MAX_STATUS_BATCH:
+        raise ValueError(f'at most {MAX_STATUS_BATCH} updates per batch')
+
+    updates, errors = {}, {}
+    for index, item in enumerate(items):
+        req_id = item.get('id') if isinstance(item, dict) else None
+        status = item.get('status') if isinstance(item, dict) else None
+        if not isinstance(req_id, int) or isinstance(req_id, bool):
+            errors[index] = {'id': req_id, 'success': False, 'error': 'id must be an integer'}
+        elif status not in REQUEST_STATUSES:
+            errors[index] = {'id': req_id, 'success': False, 'error': 'invalid status'}
+        elif req_id in updates:
+            errors[index] = {'id': req_id, 'success': False, 'error': 'duplicate id in batch'}
+        else:
+            updates[req_id] = status
+    return items, updates, errors
@@ -0,0 +1,296 @@
+"""Notification retention: archive expired rows and give the space back
+
+Read notifications older than READ_TTL_DAYS and unread ones older than
+UNREAD_TTL_DAYS move out of the hot notifications table, either into
+notifications_archive or into gzip'd NDJSON files under ARCHIVE_DIR.
+Every batch of RETENTION_BATCH_SIZE rows is its own short writer job, so
+the write lock is never held for long and normal traffic interleaves with a
+large backlog. Afterwards free pages are released with incremental_vacuum,
+VACUUM_STEP_PAGES at a time.
+
+Retention is off until an operator sets a TTL, e.g.
+BLOODBANK_READ_NOTIFICATION_TTL_DAYS=30. Archived notifications leave the
+API: every endpoint and the frontend read only the notifications table,
+so users no longer see a row once it is archived.
+
+In file mode each batch is written to a pending file that is renamed into
+place only after the DELETE of the same rows has committed, so a failed
+batch never leaves rows both in the table and in the archive. A pending
+file left by a crash is kept if its rows are gone from the table and
+dropped otherwise.
+
+Incremental vacuum only works on a database with auto_vacuum=INCREMENTAL;
+switching an existing file over needs one offline full VACUUM:
+
+    python retention.py --enable-incremental-vacuum
+
+Each gunicorn worker runs a RetentionWorker thread, and the maintenance_runs
+table makes sure only one of them does the work per interval.
+
+    python retention.py [--dry-run]
+"""
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import db
+import migrations
+
+# 0 (the default) keeps notifications of that kind forever
+READ_TTL_DAYS = int(os.environ.get('BLOODBANK_READ_NOTIFICATION_TTL_DAYS', '0'))
+UNREAD_TTL_DAYS = int(os.environ.get('BLOODBANK_UNREAD_NOTIFICATION_TTL_DAYS', '0'))
+
+# 'table' (notifications_archive) or 'file' (gzip NDJSON in ARCHIVE_DIR)
+ARCHIVE_MODE = os.environ.get('BLOODBANK_NOTIFICATION_ARCHIVE', 'table')
+ARCHIVE_DIR = os.environ.get('BLOODBANK_ARCHIVE_DIR',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+
+RETENTION_BATCH_SIZE = int(os.environ.get('BLOODBANK_RETENTION_BATCH', '500'))
+RETENTION_INTERVAL_HOURS = float(os.environ.get('BLOODBANK_RETENTION_INTERVAL_HOURS', '6'))
+
+# Pause between batches so queued application writes go first
+BATCH_PAUSE_SECONDS = 0.05
+
+VACUUM_STEP_PAGES = 1000
+
+# Pending archive files older than this belong to a batch that died
+PENDING_STALE_SECONDS = 3600
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'request_id', 'title', 'message', 'type', 'is_read', 'created_at')
+
+
+def _cutoff(days, now=None):
+    return ((now or datetime.utcnow()) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _expired_ids(conn, is_read, cutoff, limit):
+    return [row[0] for row in conn.execute(
+        'SELECT id FROM notifications WHERE is_read = ? AND created_at < ? ORDER BY created_at LIMIT ?',
+        (is_read, cutoff, limit)
+    )]
+
+
+def _write_pending_file(rows):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f'pending-{uuid.uuid4().hex}.ndjson.gz')
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(''.join(
+            json.dumps(dict(row), separators=(',', ':')) + '\n' for row in rows
+        ).encode()))
+        f.flush()
+        os.fsync(f.fileno())
+    return path
+
+
+def publish_archive_file(pending_path):
+    """Rename a committed batch's pending file into the archive; returns the new path"""
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    path = os.path.join(ARCHIVE_DIR, f'notifications-{stamp}-{uuid.uuid4().hex[:8]}.ndjson.gz')
+    os.replace(pending_path, path)
+    return path
+
+
+def recover_pending_files(conn, older_than=PENDING_STALE_SECONDS):
+    """Settle pending files a crashed batch left behind; returns (published, dropped)"""
+    published = dropped = 0
+    if not os.path.isdir(ARCHIVE_DIR):
+        return published, dropped
+    for name in sorted(os.listdir(ARCHIVE_DIR)):
+        path = os.path.join(ARCHIVE_DIR, name)
+        if not name.startswith('pending-') or time.time() - os.path.getmtime(path) < older_than:
+            continue
+        try:
+            with gzip.open(path, 'rt') as f:
+                ids = [json.loads(line)['id'] for line in f if line.strip()]
+        except (OSError, EOFError, ValueError, KeyError):
+            ids = None
+        # Ids are AUTOINCREMENT, so rows still present mean the DELETE never committed
+        if ids and not conn.execute(f"SELECT 1 FROM notifications WHERE id IN ({', '.join('?' * len(ids))}) LIMIT 1",
+                                    ids).fetchone():
+            publish_archive_file(path)
+            published += 1
+        else:
+            os.remove(path)
+            dropped += 1
+    return published, dropped
+
+
+def archive_batch(conn, is_read, cutoff, limit=None, mode=None):
+    """Writer job: move up to limit expired notifications out.
+
+    Returns (rows moved, pending file). In file mode the caller publishes
+    the pending file with publish_archive_file() once the job has committed.
+    """
+    ids = _expired_ids(conn, is_read, cutoff, limit or RETENTION_BATCH_SIZE)
+    mode = mode or ARCHIVE_MODE
+    if not ids:
+        return 0, None
+    placeholders = ', '.join('?' * len(ids))
+    columns = ', '.join(ARCHIVE_COLUMNS)
+    pending = None
+    if mode == 'file':
+        rows = conn.execute(f'SELECT {columns} FROM notifications WHERE id IN ({placeholders})', ids).fetchall()
+        pending = _write_pending_file(rows)
+    else:
+        conn.execute(f'''
+            INSERT OR REPLACE INTO notifications_archive ({columns})
+            SELECT {columns} FROM notifications WHERE id IN ({placeholders})
+        ''', ids)
+    try:
+        # Triggers keep notification_counters and table_versions in step
+        conn.execute(f'DELETE FROM notifications WHERE id IN ({placeholders})', ids)
+    except Exception:
+        if pending:
+            os.remove(pending)
+        raise
+    return len(ids), pending
+
+
+def count_expired(conn, is_read, cutoff):
+    return conn.execute('SELECT COUNT(*) FROM notifications WHERE is_read = ? AND created_at < ?',
+                        (is_read, cutoff)).fetchone()[0]
+
+
+def _vacuum_step(conn, pages):
+    """Writer job: release up to pages free pages; returns the freelist size left"""
+    # incremental_vacuum frees one page per sqlite3_step, but the sqlite3
+    # module only steps a statement without result columns once
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    for _ in range(min(pages, free)):
+        conn.execute('PRAGMA incremental_vacuum(1)')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def incremental_vacuum(step_pages=VACUUM_STEP_PAGES):
+    """Release free pages in small steps; returns pages released (0 if not enabled)"""
+    conn = db.get_db()
+    try:
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    finally:
+        conn.close()
+    if auto_vacuum != 2:
+        if free:
+            print(f"Retention: {free} free pages not reclaimed; run "
+                  f"'python retention.py --enable-incremental-vacuum' once to enable incremental vacuum")
+        return 0
+    released = 0
+    while free:
+        remaining = db.run_write(_vacuum_step, step_pages)
+        released += free - remaining
+        if remaining >= free:
+            break
+        free = remaining
+        time.sleep(BATCH_PAUSE_SECONDS)
+    return released
+
+
+def run_retention(dry_run=False, now=None):
+    """Archive every expired notification in batches, then vacuum; returns a report"""
+    started = time.monotonic()
+    policies = [('read', 1, READ_TTL_DAYS), ('unread', 0, UNREAD_TTL_DAYS)]
+    report = {'mode': ARCHIVE_MODE, 'dry_run': dry_run}
+    if ARCHIVE_MODE == 'file' and not dry_run:
+        conn = db.get_db()
+        try:
+            report['pending_published'], report['pending_dropped'] = recover_pending_files(conn)
+        finally:
+            conn.close()
+    for name, is_read, days in policies:
+        moved = 0
+        if days > 0:
+            cutoff = _cutoff(days, now)
+            if dry_run:
+                conn = db.get_db()
+                try:
+                    moved = count_expired(conn, is_read, cutoff)
+                finally:
+                    conn.close()
+            else:
+                while True:
+                    # If the COMMIT fails, the next run drops the pending file
+                    count, pending = db.run_write(archive_batch, is_read, cutoff)
+                    if pending:
+                        publish_archive_file(pending)
+                    moved += count
+                    if count < RETENTION_BATCH_SIZE:
+                        break
+                    time.sleep(BATCH_PAUSE_SECONDS)
+        report[f'archived_{name}'] = moved
+    report['pages_released'] = 0 if dry_run else incremental_vacuum()
+    report['seconds'] = round(time.monotonic() - started, 3)
+    return report
+
+
+def _claim_run(conn, name, interval_hours):
+    """Writer job: True if this process should do the periodic run now"""
+    conn.execute('INSERT OR IGNORE INTO maintenance_runs (name, last_run_at) VALUES (?, NULL)', (name,))
+    cur = conn.execute('''
+        UPDATE maintenance_runs SET last_run_at = CURRENT_TIMESTAMP
+        WHERE name = ? AND (last_run_at IS NULL OR last_run_at <= datetime('now', ?))
+    ''', (name, f'-{interval_hours * 3600:.0f} seconds'))
+    return cur.rowcount == 1
+
+
+class RetentionWorker:
+    """Background thread running retention every RETENTION_INTERVAL_HOURS"""
+
+    def __init__(self, interval_hours=RETENTION_INTERVAL_HOURS):
+        self.interval_hours = interval_hours
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.last_report = None
+
+    def start(self):
+        if self.interval_hours <= 0 or (READ_TTL_DAYS <= 0 and UNREAD_TTL_DAYS <= 0):
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name='retention', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        # Check a few times per interval; only the worker that claims the run does it
+        check_seconds = max(60.0, self.interval_hours * 3600 / 6)
+        while True:
+            try:
+                if db.run_write(_claim_run, 'notification_retention', self.interval_hours):
+                    self.last_report = run_retention()
+                    print(f"Notification retention: {self.last_report}")
+            except Exception as e:
+                print(f"Notification retention failed: {str(e)}")
+            time.sleep(check_seconds)
+
+
+_worker = RetentionWorker()
+
+
+def start():
+    _worker.start()
+
+
+def enable_incremental_vacuum():
+    """Switch the database to auto_vacuum=INCREMENTAL (rewrites the whole file)"""
+    conn = db.connect(db.DB_PATH)
+    try:
+        conn.isolation_level = None
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    if '--enable-incremental-vacuum' in sys.argv:
+        print('Incremental vacuum enabled' if enable_incremental_vacuum() else 'Could not enable incremental vacuum')
+    else:
+        migrations.migrate()
+        print(run_retention(dry_run='--dry-run' in sys.argv))
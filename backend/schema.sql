@@ -90,5 +90,21 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Indexes (see migrations.py, which is the source of truth for the live schema)
+CREATE INDEX idx_notifications_user_created ON notifications (user_id, created_at);
+CREATE INDEX idx_notifications_user_unread ON notifications (user_id, is_read, created_at);
+CREATE INDEX idx_user_requests_request ON user_requests (request_id);
+CREATE INDEX idx_user_requests_user_created ON user_requests (user_id, created_at);
+CREATE INDEX idx_user_donations_user_date ON user_donations (user_id, donation_date);
+CREATE INDEX idx_requests_created ON requests (created_at);
+CREATE INDEX idx_donors_group_city ON donors (blood_group, city COLLATE NOCASE, last_donation_date);
+CREATE INDEX idx_donors_city_group ON donors (city COLLATE NOCASE, blood_group);
+CREATE INDEX idx_requests_group_status ON requests (blood_group, status);
+CREATE INDEX idx_donors_name ON donors (name);
+CREATE INDEX idx_notifications_read_created ON notifications (is_read, created_at);
+CREATE INDEX idx_notifications_user_id ON notifications (user_id, id);
+CREATE INDEX idx_donors_group_last ON donors (blood_group, last_donation_date);
+CREATE INDEX idx_donors_name_nocase ON donors (name COLLATE NOCASE);
+
 -- Insert default admin account
 INSERT INTO admin (username, password) VALUES ('admin', 'admin123');
@@ -0,0 +1,98 @@
+"""Full-text search over donors, requests and user requests
+
+Each searchable table has an FTS5 index (donors_fts, requests_fts,
+user_requests_fts) over its text columns. The indexes are external-content
+tables: they store only the inverted index and read the text back from the
+base table for snippets, and triggers keep them in sync on every insert,
+update and delete (see migrations.py).
+
+Queries are built from the words of the user's input, never passed
+through as FTS5 syntax, so stray quotes or operators cannot cause a syntax
+error. Every word must match, and words of PREFIX_MIN_LENGTH or more
+characters also match as prefixes ("raj" finds "Rajesh"); the prefix
+indexes on 2 and 3 characters keep short prefixes cheap. Results are
+ranked by bm25 with the name columns weighted highest.
+"""
+import html
+import re
+
+# FTS index, base table, columns to return
+SEARCH_TABLES = {
+    'donors': ('donors_fts', 'donors', ('id', 'name', 'age', 'blood_group', 'contact', 'city', 'last_donation_date')),
+    'requests': ('requests_fts', 'requests',
+                 ('id', 'patient_name', 'blood_group', 'units', 'hospital', 'city', 'contact', 'status', 'created_at')),
+    'user_requests': ('user_requests_fts', 'user_requests',
+                      ('id', 'user_id', 'request_id', 'patient_name', 'blood_group', 'hospital', 'city', 'contact',
+                       'status', 'created_at')),
+}
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 100
+
+# Words beyond this many are ignored
+MAX_QUERY_TERMS = 8
+
+# Shorter words only match whole tokens; one-letter prefixes match too much
+PREFIX_MIN_LENGTH = 2
+
+# Snippets are HTML: row text is escaped and matches wrapped in <mark>.
+# FTS5 inserts these control characters, which cannot occur in the text.
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+SNIPPET_TOKENS = 12
+
+WORD = re.compile(r'\w+')
+
+
+class InvalidSearch(ValueError):
+    """Raised for an empty query or an unknown table"""
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word required, longer words as prefixes"""
+    terms = WORD.findall(text or '')[:MAX_QUERY_TERMS]
+    if not terms:
+        raise InvalidSearch('q must contain at least one letter or digit')
+    return ' '.join(f'"{term}"*' if len(term) >= PREFIX_MIN_LENGTH else f'"{term}"' for term in terms)
+
+
+def parse_tables(value):
+    if not value:
+        return list(SEARCH_TABLES)
+    tables = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in tables if name not in SEARCH_TABLES]
+    if unknown or not tables:
+        raise InvalidSearch(f"in must be a comma-separated subset of {', '.join(SEARCH_TABLES)}")
+    return tables
+
+
+def search_table(conn, name, query, limit=DEFAULT_SEARCH_LIMIT):
+    """Best matches in one table: its columns plus snippet and score (lower is better)"""
+    fts, table, columns = SEARCH_TABLES[name]
+    select = ', '.join(f't.{column}' for column in columns)
+    rows = conn.execute(f'''
+        SELECT {select},
+               snippet({fts}, -1, ?, ?, '…', ?) AS snippet,
+               {fts}.rank AS score
+        FROM {fts}
+        JOIN {table} t ON t.id = {fts}.rowid
+        WHERE {fts} MATCH ?
+        ORDER BY {fts}.rank
+        LIMIT ?
+    ''', (SNIPPET_START, SNIPPET_END, SNIPPET_TOKENS, query, limit)).fetchall()
+    results = []
+    for row in rows:
+        result = dict(row)
+        result['snippet'] = snippet_html(result['snippet'])
+        results.append(result)
+    return results
+
+
+def snippet_html(snippet):
+    return html.escape(snippet or '').replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+
+def search(conn, text, tables=None, limit=DEFAULT_SEARCH_LIMIT):
+    """{table name: [matches]} for every requested table"""
+    query = fts_query(text)
+    return {name: search_table(conn, name, query, limit) for name in (tables or SEARCH_TABLES)}
@@ -0,0 +1,55 @@
+"""Dashboard statistics and unread counts read from trigger-maintained counter tables"""
+from compatibility import BLOOD_GROUPS
+
+REQUEST_STATUSES = ('pending', 'approved', 'rejected', 'fulfilled')
+
+
+def read_stats(conn):
+    """Totals by blood group and status; one indexed read of a tiny table"""
+    counters = {}
+    for row in conn.execute('SELECT scope, key, value FROM stat_counters'):
+        counters.setdefault(row['scope'], {})[row['key']] = row['value']
+
+    def by_key(scope, keys):
+        values = counters.get(scope, {})
+        result = {key: values.get(key, 0) for key in keys}
+        # Keep any unexpected values (legacy rows) visible rather than dropping them
+        for key, value in values.items():
+            if key not in result and value:
+                result[key or 'unknown'] = value
+        return result
+
+    by_group_status = {group: {status: 0 for status in REQUEST_STATUSES} for group in BLOOD_GROUPS}
+    for key, value in counters.get('requests.blood_group_status', {}).items():
+        group, _, status = key.partition('|')
+        if value:
+            by_group_status.setdefault(group or 'unknown', {})[status or 'unknown'] = value
+
+    return {
+        'donors': {
+            'total': counters.get('donors', {}).get('total', 0),
+            'by_blood_group': by_key('donors.blood_group', BLOOD_GROUPS),
+        },
+        'requests': {
+            'total': counters.get('requests', {}).get('total', 0),
+            'by_status': by_key('requests.status', REQUEST_STATUSES),
+            'by_blood_group': by_key('requests.blood_group', BLOOD_GROUPS),
+            'by_blood_group_status': by_group_status,
+        },
+    }
+
+
+def unread_count(conn, user_id):
+    """A user's unread notifications; one primary key lookup"""
+    row = conn.execute('SELECT unread FROM notification_counters WHERE user_id = ?', (user_id,)).fetchone()
+    return row['unread'] if row else 0
+
+
+def unread_counts(conn, user_ids):
+    """{user_id: unread notifications} for several users"""
+    user_ids = list(user_ids)
+    placeholders = ', '.join('?' * len(user_ids))
+    counts = dict(conn.execute(
+        f'SELECT user_id, unread FROM notification_counters WHERE user_id IN ({placeholders})', user_ids
+    ).fetchall())
+    return {user_id: counts.get(user_id, 0) for user_id in user_ids}
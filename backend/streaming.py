@@ -0,0 +1,78 @@
+"""Incremental responses: JSON fed straight from a SQLite cursor, and files
+
+Rows are pulled with fetchmany() and encoded a batch at a time, so a worker
+never holds more than one batch of rows plus one encoded chunk in memory,
+and the first bytes leave before the query has finished.
+"""
+import json
+import os
+
+from flask import Response, stream_with_context
+
+STREAM_BATCH_SIZE = 500
+
+
+def iter_json_array(cursor, batch_size=STREAM_BATCH_SIZE):
+    """Yield a JSON array of the cursor's rows in batch-sized chunks"""
+    yield '['
+    first = True
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        chunk = ','.join(json.dumps(dict(row), separators=(',', ':')) for row in rows)
+        yield chunk if first else ',' + chunk
+        first = False
+    yield ']'
+
+
+def stream_rows(conn, cursor, key=None, extra=None, batch_size=STREAM_BATCH_SIZE):
+    """Stream cursor rows as a JSON array, or as {key: [...], **extra}.
+
+    The connection is closed once the last chunk has been sent (or the
+    client goes away).
+    """
+    def generate():
+        try:
+            if key is not None:
+                yield '{' + json.dumps(key) + ':'
+            yield from iter_json_array(cursor, batch_size)
+            if key is not None:
+                for name, value in (extra or {}).items():
+                    yield ',' + json.dumps(name) + ':' + json.dumps(value)
+                yield '}'
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def stream_file(path, mimetype, filename, delete=False, chunk_size=FILE_CHUNK_SIZE):
+    """Send a file as an attachment in fixed-size chunks, optionally deleting it afterwards"""
+    def generate():
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    response = Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Content-Length': str(os.path.getsize(path)),
+    })
+    if delete:
+        # Runs when the response is closed, even if the body was never read
+        # (HEAD, or a client that disconnects first)
+        response.call_on_close(lambda: _remove_file(path))
+    return response
@@ -0,0 +1,91 @@
+"""Tests for session tokens: issue, expiry, logout and revoking an account"""
+import time
+
+import pytest
+from itsdangerous import TimestampSigner, URLSafeTimedSerializer
+
+import auth
+import db
+import migrations
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'auth.db')
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    conn.close()
+    monkeypatch.setattr(db, '_pool', db.ConnectionPool(path))
+    monkeypatch.setattr(db, '_writer', db.DatabaseWriter(path))
+    monkeypatch.setattr(auth, '_serializer', URLSafeTimedSerializer('test-secret', salt=auth.TOKEN_SALT))
+    monkeypatch.setattr(auth, '_revocations', None)
+    yield path
+    db._pool.close_all()
+
+
+def issue_token_at(monkeypatch, timestamp, role='user', subject=1):
+    with monkeypatch.context() as m:
+        m.setattr(TimestampSigner, 'get_timestamp', lambda self: int(timestamp))
+        return auth.issue_token(role, subject)[0]
+
+
+def test_issued_token_carries_claims():
+    token, expires_at = auth.issue_token('user', 7)
+    claims = auth.verify_token(token)
+    assert (claims['role'], claims['sub']) == ('user', 7)
+    assert claims['exp'] == claims['iat'] + auth.TOKEN_TTL_SECONDS
+    assert abs(expires_at - claims['exp']) <= 1
+
+
+def test_tampered_or_missing_token_is_invalid():
+    token, _ = auth.issue_token('user', 7)
+    with pytest.raises(auth.InvalidToken, match='invalid token'):
+        auth.verify_token(token[:-2] + ('AA' if not token.endswith('AA') else 'BB'))
+    with pytest.raises(auth.InvalidToken, match='missing token'):
+        auth.verify_token(None)
+
+
+def test_token_expires_after_ttl(monkeypatch):
+    token = issue_token_at(monkeypatch, time.time() - auth.TOKEN_TTL_SECONDS - 5)
+    with pytest.raises(auth.InvalidToken, match='token expired'):
+        auth.verify_token(token)
+
+
+def test_logout_revokes_only_that_token():
+    token, _ = auth.issue_token('user', 7)
+    other, _ = auth.issue_token('user', 7)
+    auth.revoke_token(auth.verify_token(token))
+    with pytest.raises(auth.InvalidToken, match='token revoked'):
+        auth.verify_token(token)
+    assert auth.verify_token(other)['sub'] == 7
+
+
+def test_revoke_subject_revokes_earlier_tokens_of_that_account(monkeypatch):
+    now = time.time()
+    token = issue_token_at(monkeypatch, now - 60)
+    other_account = issue_token_at(monkeypatch, now - 60, subject=8)
+    auth.revoke_subject('user', 1)
+    with pytest.raises(auth.InvalidToken, match='token revoked'):
+        auth.verify_token(token)
+    assert auth.verify_token(other_account)['sub'] == 8
+
+
+def test_tokens_issued_after_the_cutoff_stay_valid(monkeypatch):
+    now = time.time()
+    auth.get_revocations().add(None, 'user', 1, now - 30, now + auth.TOKEN_TTL_SECONDS)
+    with pytest.raises(auth.InvalidToken, match='token revoked'):
+        auth.verify_token(issue_token_at(monkeypatch, now - 60))
+    assert auth.verify_token(issue_token_at(monkeypatch, now - 10))['sub'] == 1
+
+
+def test_other_processes_pick_up_revocations(monkeypatch):
+    token = issue_token_at(monkeypatch, time.time() - 60)
+    claims = auth.verify_token(token)
+    auth.revoke_token(claims)
+    auth.revoke_subject('user', 9)
+    # A fresh cache stands in for another worker process
+    cache = auth.RevocationCache(refresh_seconds=0)
+    assert cache.is_revoked(claims)
+    assert cache.is_revoked({'jti': 'other', 'role': 'user', 'sub': 9, 'iat': int(time.time()) - 60})
+    assert cache.stats()['tokens'] == 1
+    assert cache.stats()['accounts'] == 1
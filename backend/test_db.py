@@ -0,0 +1,158 @@
+"""Tests for the per-process connection pool and the single writer"""
+import sqlite3
+import threading
+
+import pytest
+from flask import Flask
+
+import db
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'pool.db')
+    conn = db.connect(path)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def raw(pooled):
+    return pooled.__dict__['_conn']
+
+
+def test_connections_are_reused(path):
+    pool = db.ConnectionPool(path, size=2)
+    first = pool.acquire()
+    conn = raw(first)
+    first.close()
+    first.close()
+    second = pool.acquire()
+    assert raw(second) is conn
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['reused'] == 1
+    with pytest.raises(Exception, match='closed'):
+        first.execute('SELECT 1')
+
+
+def test_open_transaction_is_rolled_back_on_release(path):
+    pool = db.ConnectionPool(path, size=1)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO items (name) VALUES ('left open')")
+    conn.close()
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+
+
+def test_checkout_times_out_when_pool_is_exhausted(path):
+    pool = db.ConnectionPool(path, size=1, timeout=0.05)
+    held = pool.acquire()
+    with pytest.raises(db.PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    held.close()
+    pool.acquire().close()
+    assert pool.stats()['open'] == 1
+
+
+def test_failed_connection_is_recycled(path):
+    pool = db.ConnectionPool(path, size=1)
+    conn = pool.acquire()
+    broken = raw(conn)
+    conn.failed = True
+    conn.close()
+    assert pool.stats()['recycled'] == 1
+    assert pool.stats()['open'] == 0
+    replacement = pool.acquire()
+    assert raw(replacement) is not broken
+    assert replacement.execute('SELECT 1').fetchone()[0] == 1
+
+
+def test_unusable_connection_is_recycled_on_release(path):
+    pool = db.ConnectionPool(path, size=1)
+    conn = pool.acquire()
+    raw(conn).close()
+    conn.close()
+    assert pool.stats()['recycled'] == 1
+    assert pool.acquire().execute('SELECT 1').fetchone()[0] == 1
+
+
+def test_database_error_in_a_request_recycles_its_connection(path, monkeypatch):
+    pool = db.ConnectionPool(path, size=1)
+    monkeypatch.setattr(db, '_pool', pool)
+    app = Flask(__name__)
+    with app.app_context():
+        db.get_db()
+        db.release_db(sqlite3.OperationalError('disk I/O error'))
+    with app.app_context():
+        db.get_db()
+        db.release_db(sqlite3.IntegrityError('UNIQUE constraint failed'))
+    assert pool.stats()['recycled'] == 1
+    assert pool.stats()['open'] == 1
+
+
+def test_pool_starts_fresh_after_fork(path):
+    pool = db.ConnectionPool(path, size=1, timeout=0.05)
+    inherited = pool.acquire()
+    parent_conn = raw(inherited)
+    # As seen from a forked child: the parent's connection is still checked out
+    pool._pid = -1
+    child = pool.acquire()
+    child_conn = raw(child)
+    assert child_conn is not parent_conn
+    assert pool.stats()['open'] == 1
+    child.close()
+    assert raw(pool.acquire()) is child_conn
+
+
+def insert_item(conn, name):
+    return conn.execute('INSERT INTO items (name) VALUES (?)', (name,)).lastrowid
+
+
+def insert_then_fail(conn, name):
+    insert_item(conn, name)
+    raise RuntimeError('job failed')
+
+
+def item_names(path):
+    conn = db.connect(path)
+    try:
+        return [row['name'] for row in conn.execute('SELECT name FROM items ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def test_failing_job_rolls_back_only_itself(path):
+    writer = db.DatabaseWriter(path)
+    started, release = threading.Event(), threading.Event()
+
+    def hold(conn):
+        started.set()
+        release.wait(5)
+
+    writer.submit(hold)
+    started.wait(5)
+    # Queued while the writer is busy, so these share one transaction
+    futures = [writer.submit(insert_item, 'first'),
+               writer.submit(insert_then_fail, 'failed'),
+               writer.submit(insert_item, 'first'),
+               writer.submit(insert_item, 'last')]
+    release.set()
+
+    assert futures[0].result(5) == 1
+    with pytest.raises(RuntimeError):
+        futures[1].result(5)
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[2].result(5)
+    assert futures[3].result(5) == 2
+    assert item_names(path) == ['first', 'last']
+    stats = writer.stats()
+    assert (stats['jobs'], stats['failed'], stats['max_batch']) == (5, 2, 4)
+
+
+def test_run_returns_once_committed(path):
+    writer = db.DatabaseWriter(path)
+    assert writer.run(insert_item, 'committed') == 1
+    assert item_names(path) == ['committed']
@@ -0,0 +1,85 @@
+"""Tests for reading and importing uploaded donor files"""
+import io
+
+import pytest
+
+import db
+import migrations
+from donor_import import ImportFormatError, import_donors, read_csv_rows
+
+CSV_TEXT = 'name,blood_group,city\nJosé Núñez,O+,Pune\nAnanya Rao,A-,Surat\n'
+
+
+class UnseekableStream(io.RawIOBase):
+    """A stream that can only be read forwards, like a piped upload"""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._data.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def test_utf8_csv_is_read():
+    rows = list(read_csv_rows(io.BytesIO(CSV_TEXT.encode('utf-8-sig'))))
+    assert [row['name'] for row in rows] == ['José Núñez', 'Ananya Rao']
+
+
+@pytest.mark.parametrize('encoding', ['latin-1', 'utf-16'])
+def test_non_utf8_csv_is_a_format_error(encoding):
+    with pytest.raises(ImportFormatError, match='UTF-8'):
+        list(read_csv_rows(io.BytesIO(CSV_TEXT.encode(encoding))))
+
+
+def test_bad_byte_late_in_file_fails_before_any_row():
+    data = CSV_TEXT.encode('utf-8') + 'Zoë Shah,B+,Delhi\n'.encode('latin-1')
+    rows = read_csv_rows(io.BytesIO(data))
+    with pytest.raises(ImportFormatError):
+        next(rows)
+
+
+def test_non_utf8_unseekable_stream_is_a_format_error():
+    stream = UnseekableStream(CSV_TEXT.encode('latin-1'))
+    with pytest.raises(ImportFormatError, match='UTF-8'):
+        list(read_csv_rows(stream))
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'import.db')
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO donors (name, blood_group, contact) VALUES ('Asha Patel', 'O+', '+91 90000 00000')")
+    conn.commit()
+    monkeypatch.setattr(db, '_pool', db.ConnectionPool(path))
+    monkeypatch.setattr(db, '_writer', db.DatabaseWriter(path))
+    yield conn
+    conn.close()
+    db._pool.close_all()
+
+
+IMPORT_ROWS = [
+    {'name': 'asha  PATEL', 'blood_group': 'O+', 'contact': '+91-90000-00000'},
+    {'name': 'Asha Patel', 'blood_group': 'O+', 'contact': '9111111111'},
+    {'name': 'Ravi Kumar', 'blood_group': 'B+', 'contact': '9222222222'},
+    {'name': 'ravi kumar', 'blood_group': 'B+', 'contact': '92222-22222'},
+]
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 100])
+def test_import_skips_donors_already_on_file_and_in_the_file(database, batch_size):
+    report = import_donors(IMPORT_ROWS, batch_size=batch_size)
+    assert (report['valid'], report['inserted'], report['duplicates']) == (2, 2, 2)
+    contacts = [row['contact'] for row in database.execute('SELECT contact FROM donors ORDER BY id')]
+    assert contacts == ['+91 90000 00000', '9111111111', '9222222222']
+
+
+def test_dry_run_reports_duplicates_without_writing(database):
+    report = import_donors(IMPORT_ROWS, dry_run=True, batch_size=2)
+    assert (report['valid'], report['inserted'], report['duplicates']) == (2, 0, 2)
+    assert database.execute('SELECT COUNT(*) FROM donors').fetchone()[0] == 1
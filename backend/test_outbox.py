@@ -0,0 +1,92 @@
+"""Tests for ordered delivery of request status events from the outbox"""
+import pytest
+
+import db
+import migrations
+import outbox
+from request_status import apply_status_updates
+
+REQUEST_ID = 1
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = db.connect(str(tmp_path / 'outbox.db'))
+    migrations.migrate(conn)
+    conn.execute(
+        "INSERT INTO requests (patient_name, blood_group, units, hospital, city, contact) "
+        "VALUES ('Asha Patel', 'O+', 2, 'Civil Hospital', 'Pune', '9000000000')")
+    user_id = conn.execute(
+        "INSERT INTO users (name, username, email, password, contact, blood_group) "
+        "VALUES ('Asha', 'asha', 'asha@example.com', 'x', '9000000000', 'O+')").lastrowid
+    conn.execute(
+        "INSERT INTO user_requests (user_id, request_id, patient_name, blood_group) "
+        "VALUES (?, 1, 'Asha Patel', 'O+')", (user_id,))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def pending_events(conn):
+    return conn.execute('SELECT status, attempts FROM notification_outbox ORDER BY id').fetchall()
+
+
+def user_request_status(conn):
+    return conn.execute('SELECT status FROM user_requests').fetchone()['status']
+
+
+def test_later_status_waits_for_failed_earlier_one(conn, monkeypatch):
+    apply_status_updates(conn, {REQUEST_ID: 'approved'})
+    apply_status_updates(conn, {REQUEST_ID: 'fulfilled'})
+    conn.commit()
+
+    handler = outbox.EVENT_HANDLERS['request_status']
+    calls = []
+
+    def fail_first_delivery(conn, event):
+        calls.append(event['status'])
+        if len(calls) == 1:
+            raise RuntimeError('gateway down')
+        return handler(conn, event)
+
+    monkeypatch.setitem(outbox.EVENT_HANDLERS, 'request_status', fail_first_delivery)
+
+    handled, delivered = outbox.dispatch_batch(conn)
+    conn.commit()
+    assert (handled, delivered) == (1, [])
+    assert calls == ['approved']
+    assert [tuple(row) for row in pending_events(conn)] == [('approved', 1), ('fulfilled', 0)]
+    assert user_request_status(conn) == 'pending'
+
+    handled, delivered = outbox.dispatch_batch(conn)
+    conn.commit()
+    assert handled == 2
+    assert calls == ['approved', 'approved', 'fulfilled']
+    assert pending_events(conn) == []
+    assert user_request_status(conn) == 'fulfilled'
+    assert [notification['title'] for notification in delivered] == [
+        title for title, _, _ in (outbox.status_notification(status, 'Asha Patel', 'O+')
+                                  for status in ('approved', 'fulfilled'))]
+
+
+def test_parked_event_releases_later_ones(conn, monkeypatch):
+    apply_status_updates(conn, {REQUEST_ID: 'approved'})
+    apply_status_updates(conn, {REQUEST_ID: 'rejected'})
+    conn.execute("UPDATE notification_outbox SET attempts = ? WHERE status = 'approved'",
+                 (outbox.OUTBOX_MAX_ATTEMPTS - 1,))
+    conn.commit()
+
+    handler = outbox.EVENT_HANDLERS['request_status']
+
+    def fail_approved(conn, event):
+        if event['status'] == 'approved':
+            raise RuntimeError('gateway down')
+        return handler(conn, event)
+
+    monkeypatch.setitem(outbox.EVENT_HANDLERS, 'request_status', fail_approved)
+
+    outbox.dispatch_batch(conn)
+    conn.commit()
+    parked = conn.execute('SELECT status FROM notification_outbox WHERE failed_at IS NOT NULL').fetchall()
+    assert [row['status'] for row in parked] == ['approved']
+    assert user_request_status(conn) == 'rejected'
@@ -0,0 +1,72 @@
+"""Tests for keyset pagination cursors"""
+import pytest
+
+import db
+from pagination import (MAX_PAGE_SIZE, InvalidPageRequest, decode_cursor, encode_cursor, fetch_page,
+                        parse_limit)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = db.connect(str(tmp_path / 'pages.db'))
+    conn.execute('CREATE TABLE donors (id INTEGER PRIMARY KEY, name TEXT, city TEXT)')
+    # Several donors share a city, so the sort key ties without id
+    conn.executemany('INSERT INTO donors (id, name, city) VALUES (?, ?, ?)',
+                     [(i, f'donor {i}', ('Pune', 'Surat', None)[i % 3]) for i in range(1, 12)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def all_pages(conn, order_by, limit, descending=False, **kwargs):
+    pages, after = [], None
+    while True:
+        rows, after = fetch_page(conn, 'donors', order_by, after, limit, descending, **kwargs)
+        pages.append([row['id'] for row in rows])
+        if after is None:
+            return pages
+
+
+@pytest.mark.parametrize('values', [[42], ['Pune', 7], [None, 3], ['José Núñez', 2.5]])
+def test_cursor_round_trip(values):
+    cursor = encode_cursor(values)
+    assert '=' not in cursor
+    assert decode_cursor(cursor, len(values)) == values
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'e30', encode_cursor([1]), encode_cursor('x'), ''])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidPageRequest, match='invalid cursor'):
+        decode_cursor(cursor, 2)
+
+
+def test_pages_cover_every_row_once(conn):
+    pages = all_pages(conn, ('id',), 4)
+    assert pages == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11]]
+
+
+def test_ties_on_the_sort_key_are_not_skipped_or_repeated(conn):
+    expected = [row['id'] for row in conn.execute('SELECT id FROM donors ORDER BY city DESC, id DESC')]
+    pages = all_pages(conn, ('city', 'id'), 2, descending=True, where='city IS NOT NULL')
+    assert sum(pages, []) == [i for i in expected if i % 3 != 2]
+    assert all(len(page) == 2 for page in pages[:-1])
+
+
+def test_descending_pages(conn):
+    assert all_pages(conn, ('id',), 5, descending=True) == [[11, 10, 9, 8, 7], [6, 5, 4, 3, 2], [1]]
+
+
+def test_last_full_page_has_no_cursor(conn):
+    rows, after = fetch_page(conn, 'donors', ('id',), limit=11)
+    assert len(rows) == 11 and after is None
+
+
+@pytest.mark.parametrize('value, expected', [(None, 50), ('', 50), ('0', 1), ('20', 20),
+                                             (str(MAX_PAGE_SIZE + 1), MAX_PAGE_SIZE)])
+def test_parse_limit(value, expected):
+    assert parse_limit(value) == expected
+
+
+def test_non_integer_limit():
+    with pytest.raises(InvalidPageRequest):
+        parse_limit('ten')
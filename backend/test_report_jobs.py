@@ -0,0 +1,65 @@
+"""Tests for recovering report jobs left behind by a stopped worker"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import db
+import migrations
+import report_jobs
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'reports.db')
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    monkeypatch.setattr(db, '_pool', db.ConnectionPool(path))
+    monkeypatch.setattr(db, '_writer', db.DatabaseWriter(path))
+    monkeypatch.setattr(report_jobs, 'REPORTS_DIR', str(tmp_path))
+    yield conn
+    conn.close()
+    db._pool.close_all()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def add_job(conn, job_id, status, worker_pid, tmp_path):
+    conn.execute('INSERT INTO report_jobs (id, format, status, worker_pid) VALUES (?, ?, ?, ?)',
+                 (job_id, 'pdf', status, worker_pid))
+    conn.commit()
+    partial = tmp_path / f'{job_id}.pdf'
+    partial.write_bytes(b'%PDF-partial')
+    return partial
+
+
+def job_status(conn, job_id):
+    return tuple(conn.execute('SELECT status, error FROM report_jobs WHERE id = ?', (job_id,)).fetchone())
+
+
+def test_jobs_of_stopped_workers_are_failed(database, tmp_path):
+    dead = add_job(database, 'dead', 'running', dead_pid(), tmp_path)
+    queued = add_job(database, 'queued', 'queued', dead_pid(), tmp_path)
+    earlier_run = add_job(database, 'earlier', 'running', os.getpid(), tmp_path)
+
+    assert report_jobs.recover_stale_jobs() == 3
+
+    for job_id, partial in (('dead', dead), ('queued', queued), ('earlier', earlier_run)):
+        assert job_status(database, job_id) == ('failed', report_jobs.INTERRUPTED)
+        assert not partial.exists()
+
+
+def test_live_and_finished_jobs_are_left_alone(database, tmp_path):
+    sibling = add_job(database, 'sibling', 'running', os.getppid(), tmp_path)
+    done = add_job(database, 'done', 'done', dead_pid(), tmp_path)
+
+    assert report_jobs.recover_stale_jobs() == 0
+
+    assert job_status(database, 'sibling') == ('running', None)
+    assert job_status(database, 'done') == ('done', None)
+    assert sibling.exists() and done.exists()
@@ -0,0 +1,72 @@
+"""Tests for archiving expired notifications to files"""
+import gzip
+import json
+import os
+import sqlite3
+
+import pytest
+
+import db
+import migrations
+import retention
+
+CUTOFF = '2026-01-01 00:00:00'
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    conn = db.connect(str(tmp_path / 'retention.db'))
+    migrations.migrate(conn)
+    conn.executemany(
+        "INSERT INTO notifications (user_id, title, message, type, is_read, created_at) "
+        "VALUES (1, 'Request update', 'Approved', 'status', 1, ?)",
+        [('2025-06-01 10:00:00',)] * 3)
+    conn.commit()
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    yield conn
+    conn.close()
+
+
+def archived_ids():
+    ids = []
+    for name in sorted(os.listdir(retention.ARCHIVE_DIR)):
+        if name.startswith('notifications-'):
+            with gzip.open(os.path.join(retention.ARCHIVE_DIR, name), 'rt') as f:
+                ids += [json.loads(line)['id'] for line in f]
+    return ids
+
+
+def notification_count(conn):
+    return conn.execute('SELECT COUNT(*) FROM notifications').fetchone()[0]
+
+
+def test_batch_is_published_after_commit(conn):
+    moved, pending = retention.archive_batch(conn, 1, CUTOFF, mode='file')
+    assert moved == 3
+    assert archived_ids() == []
+    conn.commit()
+    retention.publish_archive_file(pending)
+    assert archived_ids() == [1, 2, 3]
+    assert not os.path.exists(pending)
+
+
+def test_failed_delete_leaves_no_archive_file(conn):
+    conn.execute('CREATE TRIGGER block_delete BEFORE DELETE ON notifications BEGIN SELECT RAISE(ABORT, "no"); END')
+    with pytest.raises(sqlite3.IntegrityError):
+        retention.archive_batch(conn, 1, CUTOFF, mode='file')
+    assert os.listdir(retention.ARCHIVE_DIR) == []
+    assert notification_count(conn) == 3
+
+
+def test_pending_files_of_crashed_batches_are_settled(conn):
+    # Committed, but the process died before the rename
+    _, committed = retention.archive_batch(conn, 1, CUTOFF, limit=2, mode='file')
+    conn.commit()
+    # Written, but the DELETE was rolled back
+    _, rolled_back = retention.archive_batch(conn, 1, CUTOFF, mode='file')
+    conn.rollback()
+
+    assert retention.recover_pending_files(conn, older_than=0) == (1, 1)
+    assert not os.path.exists(committed) and not os.path.exists(rolled_back)
+    assert archived_ids() == [1, 2]
+    assert notification_count(conn) == 1
@@ -0,0 +1,44 @@
+"""Tests for streamed file downloads"""
+from flask import Flask
+
+from streaming import stream_file
+
+
+def write_report(tmp_path, size=200 * 1024):
+    path = tmp_path / 'report.pdf'
+    path.write_bytes(b'x' * size)
+    return path
+
+
+def test_file_is_sent_and_removed(tmp_path):
+    path = write_report(tmp_path)
+    response = stream_file(str(path), 'application/pdf', 'report.pdf', delete=True)
+    assert b''.join(response.response) == b'x' * 200 * 1024
+    response.close()
+    assert not path.exists()
+
+
+def test_unread_body_still_removes_file(tmp_path):
+    path = write_report(tmp_path)
+    response = stream_file(str(path), 'application/pdf', 'report.pdf', delete=True)
+    response.close()
+    assert not path.exists()
+
+
+def test_head_request_removes_file(tmp_path):
+    path = write_report(tmp_path)
+    app = Flask(__name__)
+    app.add_url_rule('/report', 'report', lambda: stream_file(str(path), 'application/pdf', 'report.pdf',
+                                                                delete=True))
+    response = app.test_client().head('/report')
+    assert response.status_code == 200
+    assert response.data == b''
+    response.close()
+    assert not path.exists()
+
+
+def test_file_kept_without_delete(tmp_path):
+    path = write_report(tmp_path)
+    response = stream_file(str(path), 'application/pdf', 'report.pdf')
+    response.close()
+    assert path.exists()
@@ -11,6 +11,100 @@ let currentUser = null;
 // API base URL for backend when serving frontend on a different port
 const API_BASE = 'http://127.0.0.1:5000';
 
+// Last ETag and body per API GET URL; unchanged data comes back as a 304
+const ETAG_CACHE_LIMIT = 100;
+const _etagCache = new Map();
+
+async function conditionalFetch(url, options) {
+    const cached = _etagCache.get(url);
+    const headers = new Headers(options && options.headers);
+    if (cached) headers.set('If-None-Match', cached.etag);
+
+    const response = await _origFetch(url, { ...options, headers, cache: 'no-store' });
+    if (response.status === 304 && cached) {
+        return new Response(cached.body, {
+            status: 200,
+            headers: { 'Content-Type': cached.contentType, 'ETag': cached.etag }
+        });
+    }
+
+    const etag = response.headers.get('ETag');
+    const contentType = response.headers.get('Content-Type') || '';
+    if (response.ok && etag && contentType.includes('application/json')) {
+        const body = await response.clone().text();
+        _etagCache.delete(url);
+        _etagCache.set(url, { etag, body, contentType });
+        if (_etagCache.size > ETAG_CACHE_LIMIT) {
+            _etagCache.delete(_etagCache.keys().next().value);
+        }
+    }
+    return response;
+}
+
+// Signed session tokens from the login endpoints, one per role, kept in
+// localStorage and swapped for a fresh one halfway through their lifetime
+const SESSION_TOKEN_KEYS = { admin: 'bloodbank_admin_token', user: 'bloodbank_user_token' };
+const _sessionRefreshTimers = {};
+
+function getSessionToken(role) {
+    return JSON.parse(localStorage.getItem(SESSION_TOKEN_KEYS[role]) || 'null');
+}
+
+function saveSessionToken(role, data) {
+    const session = { token: data.token, expiresAt: data.expires_at };
+    localStorage.setItem(SESSION_TOKEN_KEYS[role], JSON.stringify(session));
+    scheduleSessionRefresh(role, session);
+}
+
+function scheduleSessionRefresh(role, session) {
+    clearTimeout(_sessionRefreshTimers[role]);
+    const remainingMs = session.expiresAt * 1000 - Date.now();
+    _sessionRefreshTimers[role] = setTimeout(() => refreshSessionToken(role), Math.max(0, remainingMs / 2));
+}
+
+// Resolves false when the token is gone, expired or revoked
+async function refreshSessionToken(role) {
+    const session = getSessionToken(role);
+    if (!session) return false;
+    try {
+        const response = await fetch('/api/auth/refresh', {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${session.token}` }
+        });
+        if (response.ok) {
+            saveSessionToken(role, await response.json());
+            return true;
+        }
+        if (response.status === 401) {
+            clearSessionToken(role, false);
+            return false;
+        }
+    } catch (error) {
+        console.error('Session refresh error:', error);
+    }
+    // Server unreachable: keep the token and try again later
+    scheduleSessionRefresh(role, { expiresAt: Date.now() / 1000 + 60 });
+    return true;
+}
+
+function clearSessionToken(role, revoke = true) {
+    const session = getSessionToken(role);
+    clearTimeout(_sessionRefreshTimers[role]);
+    localStorage.removeItem(SESSION_TOKEN_KEYS[role]);
+    if (revoke && session) {
+        fetch('/api/auth/logout', {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${session.token}` }
+        }).catch(error => console.error('Logout error:', error));
+    }
+}
+
+// Admin pages act with the admin token, everything else with the user's
+function currentSessionToken() {
+    const session = getSessionToken(currentPage.startsWith('admin') ? 'admin' : 'user');
+    return session && session.token;
+}
+
 // Patch fetch to automatically prefix API calls with backend base URL
 // This avoids 404/HTML responses from the static server on port 8000
 const _origFetch = window.fetch.bind(window);
@@ -18,6 +112,16 @@ window.fetch = (url, options) => {
     try {
         if (typeof url === 'string' && url.startsWith('/api')) {
             url = `${API_BASE}${url}`;
+            const token = currentSessionToken();
+            const headers = new Headers(options && options.headers);
+            if (token && !headers.has('Authorization')) {
+                headers.set('Authorization', `Bearer ${token}`);
+                options = { ...options, headers };
+            }
+            const method = ((options && options.method) || 'GET').toUpperCase();
+            if (method === 'GET') {
+                return conditionalFetch(url, options);
+            }
         }
     } catch (e) {
         // Fall back to original URL on any unexpected error
@@ -186,13 +290,13 @@ async function loadBloodAvailability() {
     if (!availabilityContainer) return;
 
     try {
-        const response = await fetch('/api/donors');
-        const donors = await response.json();
+        const response = await fetch('/api/stats');
+        const stats = await response.json();
         const bloodGroups = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'];
         availabilityContainer.innerHTML = '';
 
         bloodGroups.forEach(group => {
-            const count = donors.filter(donor => donor.blood_group === group).length;
+            const count = stats.donors.by_blood_group[group] || 0;
             const groupCard = document.createElement('div');
             groupCard.className = 'blood-group-card';
             groupCard.innerHTML = `
@@ -212,9 +316,9 @@ async function updateHomeStats() {
     const totalDonorsElement = document.getElementById('total-donors');
     if (totalDonorsElement) {
         try {
-            const response = await fetch('/api/donors');
-            const donors = await response.json();
-            totalDonorsElement.textContent = donors.length;
+            const response = await fetch('/api/stats');
+            const stats = await response.json();
+            totalDonorsElement.textContent = stats.donors.total;
         } catch (error) {
             console.error('Error updating home stats:', error);
         }
@@ -404,6 +508,7 @@ async function handleBloodRequest(event) {
         if (response.ok) {
             const result = await response.json();
             showToast('Blood request submitted successfully! We will contact you soon.');
+            showNearbyDonorCount(result.id);
             
             // Add this request to user's history (user is logged in due to our check)
             try {
@@ -501,6 +606,23 @@ function validateRequestData(data) {
 }
 
 
+// Follow-up toast with the compatible donors near a new request's city;
+// capped at one page, so a busy city reads as "50+"
+const NEARBY_COUNT_LIMIT = 50;
+
+async function showNearbyDonorCount(requestId) {
+    try {
+        const response = await fetch(`/api/requests/${requestId}/nearby-donors?limit=${NEARBY_COUNT_LIMIT}`);
+        if (!response.ok) return;
+        const data = await response.json();
+        if (data.count === 0) return;
+        const count = data.count >= NEARBY_COUNT_LIMIT ? `${NEARBY_COUNT_LIMIT}+` : data.count;
+        showToast(`${count} compatible donor${data.count === 1 ? '' : 's'} within ${data.radius_km} km.`);
+    } catch (error) {
+        console.error('Error loading nearby donors:', error);
+    }
+}
+
 // Admin Functions
 function initializeAdminLogin() {
     const adminForm = document.getElementById('admin-login-form');
@@ -528,6 +650,7 @@ async function handleAdminLogin(event) {
         if (response.ok) {
             isAdminLoggedIn = true;
             localStorage.setItem('bloodbank_admin_session', 'true');
+            saveSessionToken('admin', await response.json());
             showToast('Login successful! Redirecting to dashboard...');
 
             setTimeout(() => {
@@ -546,6 +669,7 @@ async function handleAdminLogin(event) {
 function adminLogout() {
     isAdminLoggedIn = false;
     localStorage.removeItem('bloodbank_admin_session');
+    clearSessionToken('admin');
     showToast('Logged out successfully');
     showPage('home');
 }
@@ -557,17 +681,13 @@ function loadAdminDashboard() {
 
 async function updateAdminStats() {
     try {
-        const [donorsRes, requestsRes] = await Promise.all([
-            fetch('/api/donors'),
-            fetch('/api/requests')
-        ]);
-        const donors = await donorsRes.json();
-        const requests = await requestsRes.json();
-        
-        const totalDonors = donors.length;
-        const totalRequests = requests.length;
-        const pendingRequests = requests.filter(req => req.status === 'pending').length;
-        const fulfilledRequests = requests.filter(req => req.status === 'fulfilled').length;
+        const response = await fetch('/api/stats');
+        const stats = await response.json();
+
+        const totalDonors = stats.donors.total;
+        const totalRequests = stats.requests.total;
+        const pendingRequests = stats.requests.by_status.pending;
+        const fulfilledRequests = stats.requests.by_status.fulfilled;
 
         document.getElementById('admin-total-donors').textContent = totalDonors;
         document.getElementById('admin-total-requests').textContent = totalRequests;
@@ -600,19 +720,121 @@ function showAdminTab(tabName) {
         loadRequestsList();
     } else if (tabName === 'donors') {
         loadDonorsList();
+    } else if (tabName === 'search') {
+        initializeAdminSearch();
     }
 }
 
-async function loadRequestsList() {
-    const container = document.getElementById('requests-list');
+// Server-side full-text search; each keystroke waits for a short pause and
+// responses to superseded queries are dropped
+const SEARCH_DELAY_MS = 250;
+let searchTimer = null;
+let searchSequence = 0;
+
+function initializeAdminSearch() {
+    const input = document.getElementById('admin-search-input');
+    if (!input || input.dataset.ready) return;
+    input.dataset.ready = 'true';
+    input.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => runAdminSearch(input.value), SEARCH_DELAY_MS);
+    });
+    input.focus();
+}
+
+async function runAdminSearch(query) {
+    const container = document.getElementById('search-results');
     if (!container) return;
+    const sequence = ++searchSequence;
+    if (!query.trim()) {
+        container.innerHTML = '';
+        return;
+    }
 
     try {
-        const response = await fetch('/api/requests');
-        const requests = await response.json();
+        const response = await fetch(`/api/search?${new URLSearchParams({ q: query, limit: 10 })}`);
+        const data = await response.json();
+        if (sequence !== searchSequence) return;
+        if (!response.ok) {
+            container.innerHTML = `<p style="text-align: center; color: #6b7280; padding: 2rem;">${data.error}</p>`;
+            return;
+        }
+
+        const { donors, requests, user_requests: userRequests } = data.results;
         container.innerHTML = '';
+        if (donors.length + requests.length + userRequests.length === 0) {
+            container.innerHTML = '<p style="text-align: center; color: #6b7280; padding: 2rem;">No matching records</p>';
+            return;
+        }
 
-        if (requests.length === 0) {
+        // Snippets come back as escaped HTML with the matched words in <mark>
+        const withSnippet = (card, label, snippet) => {
+            const note = document.createElement('p');
+            note.style.cssText = 'font-size: 0.875rem; color: #6b7280; margin-bottom: 0.75rem;';
+            note.innerHTML = `<strong>${label}</strong> &middot; ${snippet}`;
+            card.prepend(note);
+            return card;
+        };
+        requests.forEach(request => {
+            container.appendChild(withSnippet(createRequestCard(request), `Request #${request.id}`, request.snippet));
+        });
+        donors.forEach(donor => {
+            container.appendChild(withSnippet(createDonorCard(donor), `Donor #${donor.id}`, donor.snippet));
+        });
+        userRequests.forEach(userRequest => {
+            const card = document.createElement('div');
+            card.className = 'request-card';
+            card.innerHTML = `
+                <div class="request-info">
+                    <h3>${userRequest.patient_name} (${userRequest.blood_group})</h3>
+                    <p>${userRequest.hospital || ''} ${userRequest.city ? `&middot; ${userRequest.city}` : ''}</p>
+                    <p>User #${userRequest.user_id} &middot; ${userRequest.status}</p>
+                </div>
+            `;
+            container.appendChild(withSnippet(card, `User request #${userRequest.id}`, userRequest.snippet));
+        });
+    } catch (error) {
+        console.error('Error searching records:', error);
+        showToast('Search failed', 'error');
+    }
+}
+
+// Admin lists are fetched a page at a time using the API's keyset cursors
+const ADMIN_PAGE_SIZE = 50;
+let requestsCursor = null;
+let donorsCursor = null;
+
+async function fetchPage(url, cursor) {
+    const params = new URLSearchParams({ limit: ADMIN_PAGE_SIZE });
+    if (cursor) params.set('after', cursor);
+    const response = await fetch(`${url}?${params}`);
+    return response.json();
+}
+
+function createLoadMoreButton(onClick) {
+    const button = document.createElement('button');
+    button.className = 'btn btn-outline load-more-btn';
+    button.style.display = 'block';
+    button.style.margin = '1.5rem auto';
+    button.textContent = 'Load more';
+    button.addEventListener('click', () => {
+        button.disabled = true;
+        onClick();
+    });
+    return button;
+}
+
+async function loadRequestsList(append = false) {
+    const container = document.getElementById('requests-list');
+    if (!container) return;
+
+    try {
+        const page = await fetchPage('/api/requests', append ? requestsCursor : null);
+        const requests = page.requests;
+        if (!append) container.innerHTML = '';
+        container.querySelectorAll('.load-more-btn').forEach(btn => btn.remove());
+
+        if (!append && requests.length === 0) {
             container.innerHTML = '<p style="text-align: center; color: #6b7280; padding: 2rem;">No blood requests found</p>';
             return;
         }
@@ -621,6 +843,11 @@ async function loadRequestsList() {
             const requestCard = createRequestCard(request);
             container.appendChild(requestCard);
         });
+
+        requestsCursor = page.next_cursor;
+        if (requestsCursor) {
+            container.appendChild(createLoadMoreButton(() => loadRequestsList(true)));
+        }
     } catch (error) {
         console.error('Error loading requests list:', error);
         container.innerHTML = '<p style="text-align: center; color: #dc2626; padding: 2rem;">Failed to load requests.</p>';
@@ -653,6 +880,13 @@ function createRequestCard(request) {
             </button>
         `;
     }
+    if (request.status === 'pending' || request.status === 'approved') {
+        actionButtons += `
+            <button class="btn btn-outline" onclick="toggleRequestMatches(${request.id}, this)">
+                <i class="fas fa-users"></i> Matches
+            </button>
+        `;
+    }
 
     card.innerHTML = `
         <div class="request-header">
@@ -678,11 +912,53 @@ function createRequestCard(request) {
                 ${actionButtons}
             </div>
         </div>
+        <div class="request-matches" id="request-matches-${request.id}" style="display: none;"></div>
     `;
 
     return card;
 }
 
+// Ranked compatible, eligible donors for a request (same city and exact group first)
+async function toggleRequestMatches(requestId, button) {
+    const container = document.getElementById(`request-matches-${requestId}`);
+    if (!container) return;
+    if (container.style.display === 'block') {
+        container.style.display = 'none';
+        return;
+    }
+
+    button.disabled = true;
+    try {
+        const response = await fetch(`/api/requests/${requestId}/matches?limit=10`);
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Failed to load matches');
+        }
+
+        container.innerHTML = data.matches.length === 0
+            ? '<p style="color: #6b7280; padding: 0.75rem 0;">No eligible compatible donors found</p>'
+            : `<table style="width: 100%; margin-top: 1rem; font-size: 0.875rem;">
+                <tr><th align="left">#</th><th align="left">Donor</th><th align="left">Group</th><th align="left">City</th><th align="left">Contact</th><th align="left">Last donation</th></tr>
+                ${data.matches.map(match => `
+                    <tr>
+                        <td>${match.rank}</td>
+                        <td>${match.name}</td>
+                        <td>${match.blood_group}${match.exact_group ? '' : ' <span style="color: #6b7280;">(compatible)</span>'}</td>
+                        <td>${match.city || ''}</td>
+                        <td>${match.contact || ''}</td>
+                        <td>${match.last_donation_date || 'Never'}</td>
+                    </tr>
+                `).join('')}
+            </table>`;
+        container.style.display = 'block';
+    } catch (error) {
+        console.error('Error loading matches:', error);
+        showToast(error.message, 'error');
+    } finally {
+        button.disabled = false;
+    }
+}
+
 async function updateRequestStatus(requestId, newStatus) {
     try {
         const response = await fetch(`/api/requests/${requestId}/status`, {
@@ -706,29 +982,37 @@ async function updateRequestStatus(requestId, newStatus) {
     }
 }
 
-async function loadDonorsList() {
+async function loadDonorsList(append = false) {
     const container = document.getElementById('donors-list');
     if (!container) return;
 
     try {
-        const response = await fetch('/api/donors');
-        const donors = await response.json();
-        container.innerHTML = '';
+        const page = await fetchPage('/api/donors', append ? donorsCursor : null);
+        const donors = page.donors;
+        if (!append) container.innerHTML = '';
+        container.querySelectorAll('.load-more-btn').forEach(btn => btn.remove());
 
-        if (donors.length === 0) {
+        if (!append && donors.length === 0) {
             container.innerHTML = '<p style="text-align: center; color: #6b7280; padding: 2rem;">No donors found</p>';
             return;
         }
 
-        const donorsGrid = document.createElement('div');
-        donorsGrid.className = 'donors-grid';
+        let donorsGrid = container.querySelector('.donors-grid');
+        if (!donorsGrid) {
+            donorsGrid = document.createElement('div');
+            donorsGrid.className = 'donors-grid';
+            container.appendChild(donorsGrid);
+        }
 
         donors.forEach(donor => {
             const donorCard = createDonorCard(donor);
             donorsGrid.appendChild(donorCard);
         });
 
-        container.appendChild(donorsGrid);
+        donorsCursor = page.next_cursor;
+        if (donorsCursor) {
+            container.appendChild(createLoadMoreButton(() => loadDonorsList(true)));
+        }
     } catch (error) {
         console.error('Error loading donors list:', error);
         container.innerHTML = '<p style="text-align: center; color: #dc2626; padding: 2rem;">Failed to load donors.</p>';
@@ -826,9 +1110,20 @@ function initializeApp() {
         currentUser = JSON.parse(localStorage.getItem('currentUser') || 'null');
         if (currentUser) {
             updateNavigationForUser();
+            startNotificationStream();
         }
     }
 
+    // Restored sessions must still hold a valid token
+    const expireSession = (role, logout) => refreshSessionToken(role).then(valid => {
+        if (!valid) {
+            logout();
+            showToast('Your session has expired. Please log in again.', 'error');
+        }
+    });
+    if (isAdminLoggedIn) expireSession('admin', adminLogout);
+    if (isUserLoggedIn) expireSession('user', userLogout);
+
     // Initialize forms
     initializeDonorForm();
     initializeRequestForm();
@@ -890,10 +1185,12 @@ async function userLogin(username, password) {
             currentUser = data.user;
             localStorage.setItem('currentUser', JSON.stringify(currentUser));
             localStorage.setItem('isUserLoggedIn', 'true');
+            saveSessionToken('user', data);
             showToast('Login successful! Welcome back.', 'success');
             showPage('user-dashboard');
             updateNavigationForUser();
             updateFormButtons(); // Update form buttons after login
+            startNotificationStream();
             return true;
         } else {
             showToast(data.error || 'Invalid username/email or password. Please try again.', 'error');
@@ -907,10 +1204,13 @@ async function userLogin(username, password) {
 }
 
 function userLogout() {
+    stopNotificationStream();
+    notificationStore = null;
     isUserLoggedIn = false;
     currentUser = null;
     localStorage.removeItem('currentUser');
     localStorage.removeItem('isUserLoggedIn');
+    clearSessionToken('user');
     
     // Hide notification icon
     const notifNavItem = document.getElementById('notification-nav-item');
@@ -1021,16 +1321,16 @@ async function loadUserDashboard() {
     document.getElementById('profile-contact').textContent = currentUser.contact || 'N/A';
     
     try {
-        // Fetch donations, requests, and notifications data
-        const [donationsResponse, requestsResponse, notificationsResponse] = await Promise.all([
+        // Fetch donations, requests, and the unread notification count
+        const [donationsResponse, requestsResponse, unreadResponse] = await Promise.all([
             fetch(`/api/users/${currentUser.id}/donations`),
             fetch(`/api/users/${currentUser.id}/requests`),
-            fetch(`/api/users/${currentUser.id}/notifications`)
+            fetch(`/api/users/${currentUser.id}/notifications/unread-count`)
         ]);
         
         const donationsResult = await donationsResponse.json();
         const requestsResult = await requestsResponse.json();
-        const notificationsResult = await notificationsResponse.json();
+        const unreadResult = await unreadResponse.json();
         
         const donations = donationsResult.donations || [];
         const requests = requestsResult.requests || [];
@@ -1041,8 +1341,8 @@ async function loadUserDashboard() {
         document.getElementById('user-lives-saved').textContent = donations.length * 3; // Each donation saves 3 lives
         
         // Update notification badge
-        if (notificationsResult.unread_count !== undefined) {
-            updateNotificationBadge(notificationsResult.unread_count);
+        if (unreadResult.unread_count !== undefined) {
+            updateNotificationBadge(unreadResult.unread_count);
         }
         
         // Calculate last donation
@@ -1394,6 +1694,49 @@ function editProfile() {
 }
 
 
+const REPORT_POLL_INTERVAL_MS = 1000;
+
+async function runReportJob(format, onProgress) {
+    const createResponse = await fetch('/api/reports/jobs', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ format }),
+    });
+    if (!createResponse.ok) {
+        throw new Error(`Failed to queue ${format.toUpperCase()} report`);
+    }
+    const { status_url: statusUrl } = await createResponse.json();
+
+    let job;
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, REPORT_POLL_INTERVAL_MS));
+        const statusResponse = await fetch(statusUrl);
+        if (!statusResponse.ok) {
+            throw new Error(`Lost track of ${format.toUpperCase()} report job`);
+        }
+        job = await statusResponse.json();
+        if (job.status === 'done') break;
+        if (job.status === 'failed') {
+            throw new Error(job.error || `Failed to generate ${format.toUpperCase()} report`);
+        }
+        onProgress(job.progress || 0);
+    }
+
+    const fileResponse = await fetch(job.download_url);
+    if (!fileResponse.ok) {
+        throw new Error(`Failed to download ${format.toUpperCase()} report`);
+    }
+    const blob = await fileResponse.blob();
+    const url = window.URL.createObjectURL(blob);
+    const a = document.createElement('a');
+    a.href = url;
+    a.download = job.file_name;
+    document.body.appendChild(a);
+    a.click();
+    window.URL.revokeObjectURL(url);
+    document.body.removeChild(a);
+}
+
 function generateDonorReport(format) {
     // Show loading state
     const button = event.target;
@@ -1408,30 +1751,12 @@ function generateDonorReport(format) {
     const allButtons = document.querySelectorAll('.report-options button');
     allButtons.forEach(btn => btn.disabled = true);
     
-    // Determine API endpoint and file details
-    const apiEndpoint = isPdf ? '/api/reports/donors' : '/api/reports/excel';
-    const fileExtension = isPdf ? 'pdf' : 'xlsx';
-    const reportType = isPdf ? 'Blood_Request_Report' : 'Complete_Report';
-    
-    // Make API call to generate report
-    fetch(apiEndpoint)
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`Failed to generate ${format.toUpperCase()} report`);
-            }
-            return response.blob();
-        })
-        .then(blob => {
-            // Create download link
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = `LifeGrid_${reportType}_${new Date().toISOString().slice(0, 19).replace(/:/g, '-')}.${fileExtension}`;
-            document.body.appendChild(a);
-            a.click();
-            window.URL.revokeObjectURL(url);
-            document.body.removeChild(a);
-            
+    // Queue the report as a background job, poll it, then download the file
+    const reportLabel = isPdf ? 'PDF' : 'Excel';
+    runReportJob(format, progress => {
+        button.innerHTML = `<i class="fas fa-spinner fa-spin"></i> Generating ${reportLabel} Report... ${Math.round(progress * 100)}%`;
+    })
+        .then(() => {
             const successMessage = isPdf 
                 ? 'Blood Request PDF report generated and downloaded successfully!' 
                 : 'Complete Excel report generated and downloaded successfully!';
@@ -1520,6 +1845,67 @@ function updateFormButtons() {
 }
 
 // Notification Functions
+
+// Local copy of the signed-in user's notifications, newest first. The first
+// load fetches one page; after that only notifications newer than latestId
+// are fetched, and older history is paged in with nextCursor on demand.
+let notificationStore = null;
+
+async function syncNotifications() {
+    const url = `/api/users/${currentUser.id}/notifications`;
+    if (!notificationStore || notificationStore.userId !== currentUser.id) {
+        const page = await fetchPage(url, null);
+        notificationStore = {
+            userId: currentUser.id,
+            items: page.notifications,
+            latestId: page.notifications.length ? page.notifications[0].id : 0,
+            nextCursor: page.next_cursor
+        };
+        return page.unread_count;
+    }
+
+    let delta;
+    do {
+        const response = await fetch(`${url}?since_id=${notificationStore.latestId}`);
+        delta = await response.json();
+        // Delta rows come oldest first; a concurrent sync may already have added some
+        delta.notifications.forEach(notification => {
+            if (notification.id > notificationStore.latestId) {
+                notificationStore.items.unshift(notification);
+                notificationStore.latestId = notification.id;
+            }
+        });
+    } while (delta.has_more);
+    return delta.unread_count;
+}
+
+async function loadOlderNotifications() {
+    if (!notificationStore || !notificationStore.nextCursor) return;
+
+    try {
+        const page = await fetchPage(`/api/users/${currentUser.id}/notifications`, notificationStore.nextCursor);
+        notificationStore.items.push(...page.notifications);
+        notificationStore.nextCursor = page.next_cursor;
+        displayNotifications(notificationStore.items);
+    } catch (error) {
+        console.error('Error loading older notifications:', error);
+        showToast('Failed to load notifications', 'error');
+    }
+}
+
+function updateStoredNotifications(update) {
+    if (notificationStore) {
+        update(notificationStore);
+    }
+    if (currentUserTab === 'notifications' && notificationStore) {
+        displayNotifications(notificationStore.items);
+    }
+    const dropdown = document.getElementById('notification-dropdown');
+    if (dropdown && dropdown.style.display === 'block' && notificationStore) {
+        displayNotificationDropdown(notificationStore.items);
+    }
+}
+
 async function loadUserNotifications() {
     if (!currentUser || !currentUser.id) {
         console.log('No user logged in');
@@ -1527,13 +1913,9 @@ async function loadUserNotifications() {
     }
 
     try {
-        const response = await fetch(`/api/users/${currentUser.id}/notifications`);
-        const data = await response.json();
-        
-        if (data.notifications) {
-            displayNotifications(data.notifications);
-            updateNotificationBadge(data.unread_count);
-        }
+        const unread = await syncNotifications();
+        displayNotifications(notificationStore.items);
+        updateNotificationBadge(unread);
     } catch (error) {
         console.error('Error loading notifications:', error);
         showToast('Failed to load notifications', 'error');
@@ -1584,6 +1966,10 @@ function displayNotifications(notifications) {
             </div>
         `;
     }).join('');
+
+    if (notificationStore && notificationStore.nextCursor) {
+        notificationsList.appendChild(createLoadMoreButton(loadOlderNotifications));
+    }
 }
 
 function getNotificationIcon(type) {
@@ -1668,17 +2054,81 @@ async function loadNotificationDropdown() {
     if (!currentUser || !currentUser.id) return;
     
     try {
-        const response = await fetch(`/api/users/${currentUser.id}/notifications`);
-        const data = await response.json();
-        
-        if (data.notifications) {
-            displayNotificationDropdown(data.notifications);
-        }
+        const unread = await syncNotifications();
+        displayNotificationDropdown(notificationStore.items);
+        updateNotificationBadge(unread);
     } catch (error) {
         console.error('Error loading notifications:', error);
     }
 }
 
+// Live notifications over Server-Sent Events; EventSource reconnects on its
+// own and resumes from the last notification id it saw. When the server
+// turns the stream away (503, too many open streams) the badge is polled
+// instead and the stream is tried again later.
+const NOTIFICATION_POLL_MS = 30000;
+const STREAM_RETRY_MS = 120000;
+let notificationStream = null;
+let notificationPollTimer = null;
+
+function startNotificationStream() {
+    if (!currentUser || !currentUser.id || typeof EventSource === 'undefined') return;
+    stopNotificationStream();
+
+    notificationStream = new EventSource(`${API_BASE}/api/users/${currentUser.id}/notifications/stream`);
+    notificationStream.addEventListener('unread', (event) => {
+        updateNotificationBadge(JSON.parse(event.data).unread_count);
+    });
+    notificationStream.addEventListener('notification', (event) => {
+        const notification = JSON.parse(event.data);
+        showToast(notification.title, notification.type === 'error' ? 'error' : 'success');
+
+        // Pull the delta into the local copy and redraw any open views
+        if (notificationStore) {
+            syncNotifications()
+                .then(() => updateStoredNotifications(() => {}))
+                .catch(error => console.error('Error syncing notifications:', error));
+        }
+    });
+    notificationStream.onerror = () => {
+        // CLOSED means a refused connection, which EventSource never retries
+        if (notificationStream && notificationStream.readyState === EventSource.CLOSED) {
+            pollNotificationsUntilStreamRetry();
+        }
+    };
+}
+
+function pollNotificationsUntilStreamRetry() {
+    stopNotificationStream();
+    const retryAt = Date.now() + STREAM_RETRY_MS;
+    const poll = async () => {
+        if (!currentUser) return;
+        if (Date.now() >= retryAt) {
+            startNotificationStream();
+            return;
+        }
+        try {
+            const response = await fetch(`/api/users/${currentUser.id}/notifications/unread-count`);
+            if (response.ok) {
+                updateNotificationBadge((await response.json()).unread_count);
+            }
+        } catch (error) {
+            console.error('Error polling notifications:', error);
+        }
+        notificationPollTimer = setTimeout(poll, NOTIFICATION_POLL_MS);
+    };
+    poll();
+}
+
+function stopNotificationStream() {
+    clearTimeout(notificationPollTimer);
+    notificationPollTimer = null;
+    if (notificationStream) {
+        notificationStream.close();
+        notificationStream = null;
+    }
+}
+
 function displayNotificationDropdown(notifications) {
     const dropdownList = document.getElementById('notification-dropdown-list');
     
@@ -1745,8 +2195,12 @@ async function markNotificationRead(notificationId) {
         });
 
         if (response.ok) {
-            // Reload notifications to update UI
-            await loadUserNotifications();
+            const result = await response.json();
+            updateStoredNotifications(store => {
+                const notification = store.items.find(n => n.id === notificationId);
+                if (notification) notification.is_read = 1;
+            });
+            updateNotificationBadge(result.unread_count);
             showToast('Notification marked as read', 'success');
         }
     } catch (error) {
@@ -1767,15 +2221,11 @@ async function markAllNotificationsRead() {
         });
 
         if (response.ok) {
-            // Reload notifications to update UI
-            await loadUserNotifications();
-            
-            // Refresh dropdown if it's open
-            const dropdown = document.getElementById('notification-dropdown');
-            if (dropdown && dropdown.style.display === 'block') {
-                await loadNotificationDropdown();
-            }
-            
+            const result = await response.json();
+            updateStoredNotifications(store => {
+                store.items.forEach(notification => { notification.is_read = 1; });
+            });
+            updateNotificationBadge(result.unread_count);
             showToast('All notifications marked as read', 'success');
         }
     } catch (error) {
@@ -1800,8 +2250,11 @@ async function deleteNotification(notificationId) {
         });
 
         if (response.ok) {
-            // Reload notifications to update UI
-            await loadUserNotifications();
+            const result = await response.json();
+            updateStoredNotifications(store => {
+                store.items = store.items.filter(n => n.id !== notificationId);
+            });
+            updateNotificationBadge(result.unread_count);
             showToast('Notification deleted', 'success');
         }
     } catch (error) {